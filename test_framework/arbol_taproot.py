@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Árboles de scripts taproot (taptrees) grandes con hashes de rama en caché.
+
+taproot_construct del framework arma el árbol a partir de listas anidadas y
+calcula de una vez la ruta de Merkle de todas las hojas, copiando las rutas
+en cada nivel. Con miles o millones de hojas (alternativas con timelock o
+multifirmas) TaprootTree:
+
+- calcula el hash de todas las hojas reutilizando el estado de SHA256
+  después de la etiqueta TapLeaf y la versión de la hoja;
+- arma un árbol balanceado o, con pesos, uno de Huffman (BIP341 recomienda
+  que las hojas más probables queden más cerca de la raíz);
+- guarda el hash de cada nodo en un bytearray y el padre y el hermano de
+  cada nodo en arreglos, así el control block de cualquier hoja se arma en
+  O(profundidad) sin recorrer el resto del árbol;
+- cambia una hoja recalculando solo los hashes de su ruta hasta la raíz.
+
+Uso:
+    tree = TaprootTree(scripts, internal_key)            # balanceado
+    tree = TaprootTree(scripts, internal_key, weights)   # Huffman
+    tree.script_pubkey                                   # OP_1 <output_key>
+    witness = tree.witness(i, [sig])                     # gasto por la hoja i
+    tree.update_leaf(i, new_script)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+import heapq
+from array import array
+from functools import lru_cache
+
+from test_framework.key import tweak_add_pubkey
+from test_framework.messages import ser_string
+
+from firmador_local import p2tr_script
+from sighash_bip341 import tagged_hasher
+
+LEAF_VERSION_TAPSCRIPT = 0xc0
+# Profundidad máxima de una ruta de Merkle en un control block (BIP341)
+TAPROOT_CONTROL_MAX_NODE_COUNT = 128
+
+tap_branch = tagged_hasher("TapBranch")
+tap_tweak = tagged_hasher("TapTweak")
+
+
+@lru_cache(maxsize=None)
+def _leaf_midstate(version):
+    """Estado de SHA256 después de la etiqueta TapLeaf y la versión"""
+    tag_hash = hashlib.sha256(b"TapLeaf").digest()
+    return hashlib.sha256(tag_hash + tag_hash + bytes([version]))
+
+
+def hash_leaves(scripts, version=LEAF_VERSION_TAPSCRIPT):
+    """Hashes TapLeaf de una lista de scripts de la misma versión"""
+    midstate = _leaf_midstate(version)
+    hashes = []
+    for script in scripts:
+        h = midstate.copy()
+        h.update(ser_string(script))
+        hashes.append(h.digest())
+    return hashes
+
+
+def leaf_hash(script, version=LEAF_VERSION_TAPSCRIPT):
+    return hash_leaves([script], version)[0]
+
+
+def branch_hash(a, b):
+    return tap_branch(a + b if a < b else b + a)
+
+
+def check_control_block(control_block, script, output_key):
+    """Verificar un control block como lo hace el nodo al gastar por el
+    script path: la ruta desde la hoja debe llevar a una raíz cuyo tweak de
+    la llave interna da output_key con la paridad indicada"""
+    path = control_block[33:]
+    if len(control_block) < 33 or len(path) % 32 or len(path) // 32 > TAPROOT_CONTROL_MAX_NODE_COUNT:
+        return False
+    version, parity = control_block[0] & 0xfe, control_block[0] & 1
+    internal_key = control_block[1:33]
+    k = leaf_hash(script, version)
+    for i in range(0, len(path), 32):
+        k = branch_hash(k, path[i:i + 32])
+    tweaked = tweak_add_pubkey(internal_key, tap_tweak(internal_key + k))
+    return tweaked is not None and tweaked[0] == output_key and int(tweaked[1]) == parity
+
+
+class TaprootTree():
+    """Árbol de scripts con una llave interna x-only de 32 bytes. Los nodos
+    0..n-1 son las hojas en el orden de scripts y los nodos internos se
+    numeran en el orden en que se crean; la raíz es el último."""
+
+    def __init__(self, scripts, internal_key, weights=None, version=LEAF_VERSION_TAPSCRIPT):
+        assert len(scripts) > 0, "el árbol necesita al menos una hoja"
+        assert len(internal_key) == 32, "la llave interna debe ser x-only"
+        self.scripts = list(scripts)
+        self.internal_key = bytes(internal_key)
+        self.version = version
+        n = len(self.scripts)
+        self.num_leaves = n
+        self._hashes = bytearray(32 * (2 * n - 1))
+        self._hashes[:32 * n] = b"".join(hash_leaves(self.scripts, version))
+        self._parent = array("q", [-1]) * (2 * n - 1)
+        self._sibling = array("q", [-1]) * (2 * n - 1)
+        self._next = n
+        if weights is None:
+            self._build_balanced()
+        else:
+            self._build_huffman(weights)
+        self.root_index = 2 * n - 2
+        # (output_key, paridad), se calcula al pedirlo y se borra al cambiar
+        # una hoja
+        self._output = None
+
+    def _hash(self, node):
+        return bytes(self._hashes[32 * node:32 * node + 32])
+
+    def _set_branch(self, node, a, b):
+        self._hashes[32 * node:32 * node + 32] = branch_hash(self._hash(a), self._hash(b))
+
+    def _join(self, a, b):
+        node = self._next
+        self._next += 1
+        self._set_branch(node, a, b)
+        self._parent[a] = self._parent[b] = node
+        self._sibling[a] = b
+        self._sibling[b] = a
+        return node
+
+    def _build_balanced(self):
+        """Une los nodos por pares nivel por nivel; si un nivel es impar el
+        último sube sin pareja. Profundidad ceil(log2(n))."""
+        level = list(range(self.num_leaves))
+        while len(level) > 1:
+            joined = [self._join(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                joined.append(level[-1])
+            level = joined
+
+    def _build_huffman(self, weights):
+        """Une siempre los dos nodos de menor peso. Falla si alguna hoja
+        queda a más de 128 niveles de la raíz."""
+        assert len(weights) == self.num_leaves, "un peso por hoja"
+        assert all(w > 0 for w in weights), "los pesos deben ser positivos"
+        heights = array("H", [0]) * (2 * self.num_leaves - 1)
+        # El índice del nodo desempata los pesos iguales de forma determinista
+        heap = [(w, i) for i, w in enumerate(weights)]
+        heapq.heapify(heap)
+        while len(heap) > 1:
+            w1, a = heapq.heappop(heap)
+            w2, b = heapq.heappop(heap)
+            node = self._join(a, b)
+            heights[node] = max(heights[a], heights[b]) + 1
+            assert heights[node] <= TAPROOT_CONTROL_MAX_NODE_COUNT, \
+                "el árbol de Huffman rebasa {} niveles, usar pesos menos dispares".format(
+                    TAPROOT_CONTROL_MAX_NODE_COUNT)
+            heapq.heappush(heap, (w1 + w2, node))
+
+    @property
+    def merkle_root(self):
+        return self._hash(self.root_index)
+
+    def _tweak(self):
+        if self._output is None:
+            output_key, negated = tweak_add_pubkey(self.internal_key, tap_tweak(self.internal_key + self.merkle_root))
+            self._output = (output_key, int(negated))
+        return self._output
+
+    @property
+    def output_key(self):
+        return self._tweak()[0]
+
+    @property
+    def script_pubkey(self):
+        return p2tr_script(self.output_key)
+
+    def depth(self, leaf):
+        depth = 0
+        while self._parent[leaf] != -1:
+            leaf = self._parent[leaf]
+            depth += 1
+        return depth
+
+    def merkle_path(self, leaf):
+        """Hashes de los hermanos desde la hoja hasta la raíz"""
+        path = []
+        node = leaf
+        while self._parent[node] != -1:
+            path.append(self._hash(self._sibling[node]))
+            node = self._parent[node]
+        return b"".join(path)
+
+    def control_block(self, leaf):
+        return bytes([self.version | self._tweak()[1]]) + self.internal_key + self.merkle_path(leaf)
+
+    def witness(self, leaf, stack=()):
+        """Testigo para gastar por la hoja: los elementos que consume el
+        script, el script y el control block"""
+        return list(stack) + [bytes(self.scripts[leaf]), self.control_block(leaf)]
+
+    def update_leaf(self, leaf, script):
+        """Cambiar el script de una hoja recalculando solo su ruta"""
+        self.scripts[leaf] = script
+        self._hashes[32 * leaf:32 * leaf + 32] = leaf_hash(script, self.version)
+        node = leaf
+        while self._parent[node] != -1:
+            self._set_branch(self._parent[node], node, self._sibling[node])
+            node = self._parent[node]
+        self._output = None
+
+    def to_nested(self, name="leaf{}"):
+        """El árbol como listas anidadas de (nombre, script), el formato de
+        taproot_construct del framework"""
+        children = {}
+        for node in range(self.root_index):
+            children.setdefault(self._parent[node], []).append(node)
+
+        def nested(node):
+            if node < self.num_leaves:
+                return (name.format(node), self.scripts[node], self.version)
+            return [nested(child) for child in children[node]]
+        return [nested(self.root_index)]
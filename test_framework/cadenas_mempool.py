@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Generador de grafos de transacciones sin confirmar para estresar los
+límites de ancestros y descendientes del mempool.
+
+Los ejemplos solo gastan un UTXO confirmado una vez. MempoolGraphBuilder
+parte de una salida confirmada (por ejemplo un coinbase maduro) y arma, con
+firma local, distintas formas de transacciones que dependen unas de otras:
+
+- chain: cadena lineal, cada hijo gasta la salida de su padre (CPFP). Con
+  los límites por defecto del nodo caben 25 transacciones.
+- tree: árbol de reparto (fan-out) de ancho y profundidad dados.
+- diamond: un padre que se reparte en varios hijos y una transacción que
+  junta de nuevo todas sus salidas (fan-out y fan-in).
+- fan_in: una transacción que gasta salidas de varias ramas.
+
+Cada transacción lleva la cuenta de sus ancestros sin confirmar, así que el
+orden por número de ancestros es un orden de dependencias válido para
+enviarlas, y check_limits avisa antes de enviar si una forma rebasa
+-limitancestorcount o -limitdescendantcount.
+
+Uso:
+    builder = MempoolGraphBuilder(signer, script_pubkey)
+    txs = builder.chain(Coin.confirmed(txid, 0, txout), 25)
+    check_limits(txs)
+    latencies = submit_in_order(node, txs)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import time
+from collections import namedtuple
+
+from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint
+
+# Límites por defecto del mempool de Bitcoin Core (v22-v24), contando a la
+# propia transacción
+DEFAULT_ANCESTOR_LIMIT = 25
+DEFAULT_DESCENDANT_LIMIT = 25
+# Tarifa en sat/vB y tamaños aproximados de P2WPKH para calcularla antes de
+# firmar
+FEE_RATE = 2
+TX_OVERHEAD_VBYTES = 11
+P2WPKH_INPUT_VBYTES = 68
+P2WPKH_OUTPUT_VBYTES = 31
+
+
+class Coin(namedtuple("Coin", ["txid", "n", "txout", "ancestors"])):
+    """Salida gastable: txid entero, índice, CTxOut y el conjunto de txids de
+    las transacciones sin confirmar de las que depende, incluida la que la
+    creó (vacío si la salida está confirmada)"""
+
+    @classmethod
+    def confirmed(cls, txid, n, txout):
+        if isinstance(txid, str):
+            txid = int(txid, 16)
+        return cls(txid, n, txout, frozenset())
+
+
+# Transacción del grafo: la CTransaction firmada, sus salidas como Coin y
+# sus ancestros sin confirmar (sin contarse a sí misma)
+GraphTx = namedtuple("GraphTx", ["tx", "coins", "ancestors"])
+
+
+def estimate_fee(num_inputs, num_outputs, fee_rate=FEE_RATE):
+    return fee_rate * (TX_OVERHEAD_VBYTES + P2WPKH_INPUT_VBYTES * num_inputs +
+                       P2WPKH_OUTPUT_VBYTES * num_outputs)
+
+
+def dependency_order(txs):
+    """Los ancestros de una transacción siempre tienen menos ancestros que
+    ella, así que ordenar por su número da un orden topológico"""
+    return sorted(txs, key=lambda g: len(g.ancestors))
+
+
+def package_counts(txs):
+    """Por cada transacción (txid -> (ancestros, descendientes)), contando a
+    la propia transacción como lo hace el mempool"""
+    descendants = {g.tx.sha256: 1 for g in txs}
+    for g in txs:
+        for ancestor in g.ancestors:
+            if ancestor in descendants:
+                descendants[ancestor] += 1
+    return {g.tx.sha256: (len(g.ancestors) + 1, descendants[g.tx.sha256]) for g in txs}
+
+
+def check_limits(txs, ancestor_limit=DEFAULT_ANCESTOR_LIMIT, descendant_limit=DEFAULT_DESCENDANT_LIMIT):
+    """AssertionError si alguna transacción rebasa los límites del mempool.
+    Solo cuenta las transacciones de txs: los ancestros que ya estén en el
+    mempool deben ir en la lista."""
+    for txid, (ancestors, descendants) in package_counts(txs).items():
+        assert ancestors <= ancestor_limit, "{:064x} tendría {} ancestros (límite {})".format(
+            txid, ancestors, ancestor_limit)
+        assert descendants <= descendant_limit, "{:064x} tendría {} descendientes (límite {})".format(
+            txid, descendants, descendant_limit)
+
+
+def submit_in_order(node, txs, mempool_size=0):
+    """Enviar txs en orden de dependencias con sendrawtransaction. Regresa
+    una lista de (ancestros incluyéndose, transacciones en el mempool antes
+    del envío, latencia en segundos); mempool_size es cuántas había antes
+    del lote."""
+    results = []
+    for g in dependency_order(txs):
+        tx_hex = g.tx.serialize().hex()
+        start = time.perf_counter()
+        node.sendrawtransaction(tx_hex)
+        results.append((len(g.ancestors) + 1, mempool_size, time.perf_counter() - start))
+        mempool_size += 1
+    return results
+
+
+class MempoolGraphBuilder():
+    """Arma y firma grafos de transacciones P2WPKH que pagan a
+    script_pubkey, una llave registrada en signer (LocalSigner)"""
+
+    def __init__(self, signer, script_pubkey, fee_rate=FEE_RATE):
+        assert signer.can_sign(script_pubkey)
+        self.signer = signer
+        self.script_pubkey = script_pubkey
+        self.fee_rate = fee_rate
+
+    def spend(self, coins, num_outputs=1):
+        """Una transacción que gasta coins y reparte su valor, menos la
+        tarifa, en num_outputs salidas iguales"""
+        fee = estimate_fee(len(coins), num_outputs, self.fee_rate)
+        value = (sum(c.txout.nValue for c in coins) - fee) // num_outputs
+        assert value > 0, "las salidas no alcanzan para la tarifa"
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(c.txid, c.n)) for c in coins]
+        tx.vout = [CTxOut(value, self.script_pubkey) for _ in range(num_outputs)]
+        self.signer.sign_tx(tx, [c.txout for c in coins])
+        # Los ancestros de una coin ya incluyen a la transacción que la creó
+        ancestors = frozenset().union(*(c.ancestors for c in coins))
+        own = ancestors | {tx.sha256}
+        return GraphTx(tx, [Coin(tx.sha256, n, out, own) for n, out in enumerate(tx.vout)], ancestors)
+
+    def chain(self, coin, length):
+        """Cadena lineal de length transacciones, cada una gasta la única
+        salida de la anterior"""
+        txs = []
+        for _ in range(length):
+            g = self.spend([coin])
+            txs.append(g)
+            coin = g.coins[0]
+        return txs
+
+    def tree(self, coin, fanout, depth):
+        """Árbol de reparto: la raíz tiene fanout salidas y cada nivel gasta
+        cada salida del anterior en una transacción con fanout salidas; las
+        hojas tienen una sola salida. Son 1 + fanout + ... + fanout^(depth-1)
+        transacciones."""
+        txs = []
+        level = [coin]
+        for d in range(depth):
+            outputs = fanout if d < depth - 1 else 1
+            generated = [self.spend([c], outputs) for c in level]
+            txs += generated
+            level = [c for g in generated for c in g.coins]
+        return txs
+
+    def diamond(self, coin, width):
+        """Un padre con width salidas, width hijos y un nieto que junta las
+        width salidas (width + 2 transacciones)"""
+        parent = self.spend([coin], width)
+        children = [self.spend([c]) for c in parent.coins]
+        join = self.spend([g.coins[0] for g in children])
+        return [parent] + children + [join]
+
+    def fan_in(self, coins):
+        """Una transacción que gasta todas las coins, por ejemplo las puntas
+        de varias cadenas"""
+        return [self.spend(coins)]
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Codificación y decodificación de direcciones por lotes: Base58Check y
+bech32/bech32m.
+
+byte_to_base58 y encode_segwit_address del framework codifican una dirección
+por llamada, dígito por dígito en Python. Para listas de millones de hash160
+(listas de vigilancia, rangos derivados de un descriptor) este módulo:
+
+- Base58Check: reutiliza el estado SHA256 del byte de versión para el
+  checksum de cada payload y convierte a base58 con divisiones del entero
+  completo entre 58^10, armando cada bloque de 10 dígitos con una tabla de
+  pares de caracteres.
+- bech32/bech32m: convierte de 8 a 5 bits con base64.b32encode (en C) y
+  traduce el alfabeto con bytes.translate; el checksum parte del estado del
+  polinomio ya calculado para el hrp y la versión de testigo, y avanza tres
+  símbolos por paso con una tabla de 32,768 entradas.
+
+Los decodificadores hacen el trabajo inverso con las mismas tablas.
+
+Uso:
+    addresses = encode_base58check(hashes, 111)           # P2PKH de testnet
+    addresses = encode_segwit(programs, "bcrt", 1)        # P2TR de regtest
+    addresses = encode_base58check(buffer, 196, size=20)  # buffer contiguo
+    decoded = decode_segwit(addresses, "bcrt")            # [(versión, programa)]
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import base64
+import binascii
+import hashlib
+from functools import lru_cache
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+# Pares de dígitos base58: PAIRS[v] para 0 <= v < 58^2
+B58_PAIRS = [a + b for a in B58_ALPHABET for b in B58_ALPHABET]
+B58_PAIR_VALUES = {pair: value for value, pair in enumerate(B58_PAIRS)}
+P2 = 58 ** 2
+P4 = 58 ** 4
+P6 = 58 ** 6
+P8 = 58 ** 8
+# Cada división del entero produce un bloque de 10 dígitos
+B58_CHUNK = 58 ** 10
+B58_CHUNK_DIGITS = 10
+
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+BECH32_GENERATOR = [0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3]
+# Traducciones entre el alfabeto de base64.b32encode, los valores de 5 bits
+# y el alfabeto de bech32
+B32_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+B32_TO_VALUES = bytes.maketrans(B32_ALPHABET, bytes(range(32)))
+VALUES_TO_B32 = bytes.maketrans(bytes(range(32)), B32_ALPHABET)
+VALUES_TO_CHARSET = bytes.maketrans(bytes(range(32)), BECH32_CHARSET.encode())
+# Los caracteres fuera del alfabeto quedan con su código ASCII (> 31)
+CHARSET_TO_VALUES = bytes.maketrans(BECH32_CHARSET.encode(), bytes(range(32)))
+
+
+def split_payloads(payloads, size):
+    """Lista de payloads: payloads puede ser una secuencia de bytes o un
+    buffer contiguo (bytes, bytearray, memoryview) de payloads de size bytes"""
+    if isinstance(payloads, (bytes, bytearray, memoryview)):
+        view = memoryview(payloads)
+        assert len(view) % size == 0, "el buffer no es múltiplo de {} bytes".format(size)
+        return [view[i:i + size] for i in range(0, len(view), size)]
+    return payloads
+
+
+def _b58_chunk(value):
+    """10 dígitos base58 (con ceros a la izquierda) de value < 58^10"""
+    return (B58_PAIRS[value // P8] + B58_PAIRS[value // P6 % P2] + B58_PAIRS[value // P4 % P2] +
+            B58_PAIRS[value // P2 % P2] + B58_PAIRS[value % P2])
+
+
+def b58encode(data):
+    """Base58 de data, con un '1' por cada byte cero inicial"""
+    zeros = len(data) - len(data.lstrip(b"\x00"))
+    n = int.from_bytes(data, "big")
+    chunks = []
+    while n:
+        n, rest = divmod(n, B58_CHUNK)
+        chunks.append(_b58_chunk(rest))
+    return "1" * zeros + "".join(reversed(chunks)).lstrip("1")
+
+
+def b58decode(s):
+    zeros = len(s) - len(s.lstrip("1"))
+    body = s[zeros:]
+    # Rellenar con el dígito cero para tener bloques completos
+    body = "1" * (-len(body) % B58_CHUNK_DIGITS) + body
+    n = 0
+    try:
+        for i in range(0, len(body), B58_CHUNK_DIGITS):
+            c = body[i:i + B58_CHUNK_DIGITS]
+            n = n * B58_CHUNK + (B58_PAIR_VALUES[c[0:2]] * P8 + B58_PAIR_VALUES[c[2:4]] * P6 +
+                                 B58_PAIR_VALUES[c[4:6]] * P4 + B58_PAIR_VALUES[c[6:8]] * P2 +
+                                 B58_PAIR_VALUES[c[8:10]])
+    except KeyError:
+        raise AssertionError("carácter base58 inválido en {}".format(s))
+    return b"\x00" * zeros + n.to_bytes((n.bit_length() + 7) // 8, "big")
+
+
+def encode_base58check(payloads, version, size=20):
+    """Direcciones Base58Check de cada payload con el byte de versión
+    (0/5 en mainnet, 111/196 en testnet y regtest)"""
+    prefix = bytes([version])
+    # El checksum es sha256d(versión + payload): el estado después del byte
+    # de versión se calcula una vez y se copia para cada payload
+    state = hashlib.sha256(prefix)
+    addresses = []
+    for payload in split_payloads(payloads, size):
+        h = state.copy()
+        h.update(payload)
+        checksum = hashlib.sha256(h.digest()).digest()[:4]
+        addresses.append(b58encode(prefix + bytes(payload) + checksum))
+    return addresses
+
+
+def decode_base58check(addresses):
+    """Lista de (payload, versión) como base58_to_byte del framework, falla
+    con AssertionError si un checksum no es válido"""
+    result = []
+    for address in addresses:
+        data = b58decode(address)
+        assert len(data) > 4, "dirección base58 muy corta: {}".format(address)
+        checksum = hashlib.sha256(hashlib.sha256(data[:-4]).digest()).digest()[:4]
+        assert checksum == data[-4:], "checksum base58 inválido: {}".format(address)
+        result.append((data[1:-4], data[0]))
+    return result
+
+
+def _polymod_step(chk, value):
+    top = chk >> 25
+    chk = (chk & 0x1ffffff) << 5 ^ value
+    for i in range(5):
+        if (top >> i) & 1:
+            chk ^= BECH32_GENERATOR[i]
+    return chk
+
+
+@lru_cache(maxsize=None)
+def _polymod_table():
+    """Contribución de los 15 bits altos del estado después de tres pasos.
+    El polinomio es lineal, así que tres pasos con los símbolos a, b, c son:
+    ((chk & 0x7fff) << 15) ^ (a << 10 | b << 5 | c) ^ tabla[chk >> 15]"""
+    table = []
+    for high in range(1 << 15):
+        chk = high << 15
+        for _ in range(3):
+            chk = _polymod_step(chk, 0)
+        table.append(chk)
+    return table
+
+
+def _polymod(chk, values):
+    table = _polymod_table()
+    start = len(values) % 3
+    for value in values[:start]:
+        chk = _polymod_step(chk, value)
+    for i in range(start, len(values), 3):
+        chk = (((chk & 0x7fff) << 15) ^ (values[i] << 10 | values[i + 1] << 5 | values[i + 2]) ^
+               table[chk >> 15])
+    return chk
+
+
+@lru_cache(maxsize=None)
+def _hrp_state(hrp, witver=None):
+    """Estado del polinomio después del hrp expandido (y de la versión de
+    testigo si se da), compartido por todas las direcciones del lote"""
+    values = [ord(x) >> 5 for x in hrp] + [0] + [ord(x) & 31 for x in hrp]
+    if witver is not None:
+        values.append(witver)
+    chk = 1
+    for value in values:
+        chk = _polymod_step(chk, value)
+    return chk
+
+
+def _to_values(payload):
+    """8 a 5 bits con relleno de ceros al final, como convertbits de BIP173"""
+    return base64.b32encode(payload).rstrip(b"=").translate(B32_TO_VALUES)
+
+
+def encode_segwit(programs, hrp, witver, size=None):
+    """Direcciones segwit de cada programa de testigo: bech32 para la
+    versión 0 y bech32m para las demás (BIP350). size solo hace falta si
+    programs es un buffer contiguo."""
+    const = BECH32_CONST if witver == 0 else BECH32M_CONST
+    state = _hrp_state(hrp, witver)
+    prefix = hrp + "1" + BECH32_CHARSET[witver]
+    if size is None:
+        size = 20 if witver == 0 else 32
+    addresses = []
+    for program in split_payloads(programs, size):
+        assert 2 <= len(program) <= 40, "programa de testigo de tamaño inválido"
+        values = _to_values(program)
+        polymod = _polymod(state, values + bytes(6)) ^ const
+        checksum = bytes((polymod >> 5 * (5 - i)) & 31 for i in range(6))
+        addresses.append(prefix + (values + checksum).translate(VALUES_TO_CHARSET).decode())
+    return addresses
+
+
+def _decode_segwit(address, hrp):
+    if address.lower() != address and address.upper() != address:
+        return None, None
+    address = address.lower()
+    pos = address.rfind("1")
+    if address[:pos] != hrp or len(address) > 90 or len(address) - pos < 8:
+        return None, None
+    try:
+        values = address[pos + 1:].encode("ascii").translate(CHARSET_TO_VALUES)
+    except UnicodeEncodeError:
+        return None, None
+    if max(values) > 31:
+        return None, None
+    witver = values[0]
+    const = BECH32_CONST if witver == 0 else BECH32M_CONST
+    if witver > 16 or _polymod(_hrp_state(hrp), values) != const:
+        return None, None
+    program_values = values[1:-6]
+    if not program_values:
+        return None, None
+    try:
+        b32 = program_values.translate(VALUES_TO_B32)
+        program = base64.b32decode(b32 + b"=" * (-len(b32) % 8))
+    except binascii.Error:
+        return None, None
+    # Los bits de relleno deben ser cero
+    padding = len(program_values) * 5 - len(program) * 8
+    if padding >= 5 or program_values[-1] & ((1 << padding) - 1):
+        return None, None
+    if not 2 <= len(program) <= 40 or (witver == 0 and len(program) not in (20, 32)):
+        return None, None
+    return witver, program
+
+
+def decode_segwit(addresses, hrp):
+    """Lista de (versión, programa) como decode_segwit_address del
+    framework, (None, None) para las direcciones inválidas"""
+    return [_decode_segwit(address, hrp) for address in addresses]
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Derivación local de direcciones BIP32 a partir de descriptores.
+
+Los ejemplos obtienen cada dirección con getnewaddress (y su pubkey con
+getaddressinfo), una llamada RPC por dirección. DescriptorDeriver toma los
+mismos descriptores que usan los scripts, por ejemplo
+tr(tprv.../86'/1'/0'/0/*) con o sin el checksum de descsum_create, y deriva
+rangos de llaves y direcciones en el proceso. Las direcciones de un rango se
+codifican en un solo lote con codec_direcciones.py.
+
+Los nodos intermedios de la ruta (típicamente los endurecidos 86'/1'/0' y
+la cadena 0) se derivan una sola vez y quedan en caché, así que cada
+dirección nueva solo cuesta una derivación de hijo.
+
+Descriptores soportados: tr(KEY), wpkh(KEY), pkh(KEY) y sh(wpkh(KEY)), donde
+KEY es un xprv/tprv o xpub/tpub con origen [fingerprint/ruta] opcional y
+una ruta que puede terminar en * o *'.
+
+Uso:
+    deriver = DescriptorDeriver(descsum_create("tr(tprv.../86'/1'/0'/0/*)"))
+    addresses = deriver.derive_addresses(0, 10000)
+    deriver.verify_sample(self.nodes[0], [0, 9999])
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+import hmac
+import re
+
+from test_framework.address import base58_to_byte, hash160
+from test_framework.descriptors import descsum_check, descsum_create
+from test_framework.key import (ECKey, ECPubKey, SECP256K1, SECP256K1_G,
+                                SECP256K1_ORDER, tweak_add_pubkey)
+from test_framework.script import CScript, OP_0, OP_1, TaggedHash
+from test_framework.script_util import (key_to_p2wpkh_script,
+                                        keyhash_to_p2pkh_script,
+                                        scripthash_to_p2sh_script)
+from test_framework.util import assert_equal
+
+from codec_direcciones import encode_base58check, encode_segwit
+
+HARDENED = 0x80000000
+
+# Bytes de versión de las llaves extendidas: privada o pública
+XPRV_VERSIONS = {bytes.fromhex("0488ade4"), bytes.fromhex("04358394")}
+XPUB_VERSIONS = {bytes.fromhex("0488b21e"), bytes.fromhex("043587cf")}
+
+# hrp bech32 y versiones base58 (P2PKH, P2SH) por red
+NETWORKS = {
+    "main": ("bc", 0, 5),
+    "test": ("tb", 111, 196),
+    "regtest": ("bcrt", 111, 196),
+}
+
+# Solo llaves extendidas (xpub/xprv/tpub/tprv); los descriptores con llaves
+# en hex los resuelve descriptor_script de indice_utxos.py
+DESCRIPTOR_RE = re.compile(r"^(tr|wpkh|pkh|sh\(wpkh)\((?:\[[0-9a-fA-F]{8}[^\]]*\])?([xt](?:pub|prv)[1-9A-HJ-NP-Za-km-z]+)"
+                           r"((?:/[0-9]+['h]?)*)(/\*['h]?)?\)+$")
+
+
+def parse_path(path):
+    """'/86'/1'/0'/0' -> (86 | HARDENED, 1 | HARDENED, 0 | HARDENED, 0)"""
+    indexes = []
+    for step in path.split("/")[1:]:
+        if step[-1] in "'h":
+            indexes.append(int(step[:-1]) | HARDENED)
+        else:
+            indexes.append(int(step))
+    return tuple(indexes)
+
+
+def point_to_bytes(point):
+    """Punto jacobiano de la curva a pubkey comprimida de 33 bytes"""
+    x, y, _ = SECP256K1.affine(point)
+    return bytes([2 + (y & 1)]) + x.to_bytes(32, "big")
+
+
+class ExtendedKey():
+    """Nodo BIP32: llave privada (entero) o pública (punto) y chain code"""
+
+    def __init__(self, chaincode, privkey=None, pubkey=None):
+        self.chaincode = chaincode
+        self.privkey = privkey
+        self._pubkey = pubkey
+
+    @classmethod
+    def from_base58(cls, s):
+        payload, version = base58_to_byte(s)
+        data = bytes([version]) + payload
+        assert_equal(len(data), 78)
+        chaincode, key = data[13:45], data[45:78]
+        if data[:4] in XPRV_VERSIONS:
+            assert_equal(key[0], 0)
+            return cls(chaincode, privkey=int.from_bytes(key[1:], "big"))
+        assert data[:4] in XPUB_VERSIONS, "versión de llave extendida desconocida"
+        return cls(chaincode, pubkey=key)
+
+    def pubkey(self):
+        """Pubkey comprimida en bytes; en llaves privadas se calcula una vez"""
+        if self._pubkey is None:
+            key = ECKey()
+            key.set(self.privkey.to_bytes(32, "big"), True)
+            self._pubkey = key.get_pubkey().get_bytes()
+        return self._pubkey
+
+    def child(self, index):
+        """CKDpriv o CKDpub de BIP32"""
+        if index & HARDENED:
+            assert self.privkey is not None, "no se puede derivar un hijo endurecido de una xpub"
+            data = b"\x00" + self.privkey.to_bytes(32, "big")
+        else:
+            data = self.pubkey()
+        digest = hmac.new(self.chaincode, data + index.to_bytes(4, "big"), hashlib.sha512).digest()
+        tweak = int.from_bytes(digest[:32], "big")
+        assert tweak < SECP256K1_ORDER
+        if self.privkey is not None:
+            return ExtendedKey(digest[32:], privkey=(self.privkey + tweak) % SECP256K1_ORDER)
+        # Hijo público: tweak * G + K
+        parent = ECPubKey()
+        parent.set(self._pubkey)
+        return ExtendedKey(digest[32:], pubkey=point_to_bytes(SECP256K1.mul([(SECP256K1_G, tweak), (parent.p, 1)])))
+
+
+class DescriptorDeriver():
+    """Deriva llaves, scriptPubKeys y direcciones de un descriptor con rango"""
+
+    def __init__(self, descriptor, network="regtest"):
+        if "#" in descriptor:
+            assert descsum_check(descriptor), "checksum del descriptor inválido"
+            descriptor = descriptor.split("#")[0]
+        match = DESCRIPTOR_RE.match(descriptor)
+        assert match, "descriptor no soportado: {}".format(descriptor)
+        self.descriptor = descriptor
+        self.kind = match.group(1).replace("(", "-")
+        self.hrp, self.p2pkh_version, self.p2sh_version = NETWORKS[network]
+        self.prefix = parse_path(match.group(3))
+        wildcard = match.group(4)
+        self.ranged = wildcard is not None
+        self.hardened_wildcard = self.ranged and wildcard[-1] in "'h"
+        # Caché: ruta -> nodo BIP32, empezando con la llave maestra
+        self._nodes = {(): ExtendedKey.from_base58(match.group(2))}
+        # Caché: índice -> (pubkey, scriptPubKey, dirección)
+        self._children = {}
+
+    def _node(self, path):
+        """Nodo de la ruta, derivando solo lo que no está en caché"""
+        node = self._nodes.get(path)
+        if node is None:
+            node = self._node(path[:-1]).child(path[-1])
+            self._nodes[path] = node
+        return node
+
+    def _child(self, index):
+        assert self.ranged or index == 0
+        if not self.ranged:
+            return self._node(self.prefix)
+        step = index | HARDENED if self.hardened_wildcard else index
+        # Los hijos no se guardan en _nodes para no llenar la caché de nodos
+        # con miles de hojas, solo el prefijo común queda en caché
+        return self._node(self.prefix).child(step)
+
+    def pubkey(self, index):
+        return self._derive(index)[0]
+
+    def privkey(self, index):
+        """Llave privada de 32 bytes del índice, None si es una xpub"""
+        node = self._child(index)
+        return None if node.privkey is None else node.privkey.to_bytes(32, "big")
+
+    def script_pubkey(self, index):
+        return self._derive(index)[1]
+
+    def address(self, index):
+        return self._derive(index)[2]
+
+    def derive_addresses(self, start, end):
+        """Direcciones de los índices [start, end)"""
+        self._derive_range(start, end)
+        return [self._children[i][2] for i in range(start, end)]
+
+    def derive_scripts(self, start, end):
+        self._derive_range(start, end)
+        return [self._children[i][1] for i in range(start, end)]
+
+    def _derive(self, index):
+        if index not in self._children:
+            self._derive_range(index, index + 1)
+        return self._children[index]
+
+    def _derive_range(self, start, end):
+        """Derivar los índices de [start, end) que no están en caché y
+        codificar sus direcciones en un solo lote"""
+        missing = [i for i in range(start, end) if i not in self._children]
+        if not missing:
+            return
+        pubkeys = [self._child(i).pubkey() for i in missing]
+        scripts, payloads = zip(*[self._script_and_payload(pubkey) for pubkey in pubkeys])
+        addresses = self._encode_addresses(payloads)
+        for i, pubkey, script, address in zip(missing, pubkeys, scripts, addresses):
+            self._children[i] = (pubkey, script, address)
+
+    def _script_and_payload(self, pubkey):
+        """scriptPubKey y lo que se codifica en la dirección: el programa de
+        testigo o el hash del script base58"""
+        if self.kind == "tr":
+            xonly = pubkey[1:]
+            output_key, _ = tweak_add_pubkey(xonly, TaggedHash("TapTweak", xonly))
+            return CScript([OP_1, output_key]), output_key
+        keyhash = hash160(pubkey)
+        if self.kind == "wpkh":
+            return key_to_p2wpkh_script(pubkey), keyhash
+        if self.kind == "pkh":
+            return keyhash_to_p2pkh_script(keyhash), keyhash
+        # sh(wpkh(...))
+        script_hash = hash160(CScript([OP_0, keyhash]))
+        return scripthash_to_p2sh_script(script_hash), script_hash
+
+    def _encode_addresses(self, payloads):
+        if self.kind == "tr":
+            return encode_segwit(payloads, self.hrp, 1)
+        if self.kind == "wpkh":
+            return encode_segwit(payloads, self.hrp, 0)
+        if self.kind == "pkh":
+            return encode_base58check(payloads, self.p2pkh_version)
+        return encode_base58check(payloads, self.p2sh_version)
+
+    def verify_sample(self, node, indexes):
+        """Comparar una muestra de índices contra deriveaddresses del nodo,
+        con una sola llamada RPC para el rango que cubre la muestra"""
+        start, end = min(indexes), max(indexes)
+        if self.ranged:
+            remote = node.deriveaddresses(descsum_create(self.descriptor), [start, end])
+        else:
+            remote = node.deriveaddresses(descsum_create(self.descriptor))
+        for i in indexes:
+            assert_equal(self.address(i), remote[i - start])
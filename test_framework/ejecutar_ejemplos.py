@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Ejecutar en paralelo todos los ejemplos de transacciones.
+
+Busca los scripts mi_ejemplo_tx_*.py que definen la clase ExampleTest y los
+ejecuta como procesos independientes, cada uno con su propio --portseed (y
+por lo tanto su propio rango de puertos) y su propio --tmpdir, de la misma
+forma que lo hace test_runner.py de Bitcoin Core. Al final escribe un resumen
+en JSON con el tiempo y el resultado de cada script, y el tiempo total queda
+cerca del tiempo del script más lento.
+
+Los argumentos que no reconoce este script se pasan a cada ejemplo, por
+ejemplo --cachedir o --configfile.
+
+Uso:
+    ./ejecutar_ejemplos.py --jobs=4 --output=resumen.json
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+EXAMPLE_PATTERN = "mi_ejemplo_tx_*.py"
+EXAMPLE_CLASS = "class ExampleTest("
+
+# Códigos de salida de BitcoinTestFramework
+TEST_EXIT_PASSED = 0
+TEST_EXIT_SKIPPED = 77
+
+# Líneas de la salida que guardamos en el resumen cuando un ejemplo falla
+FAILED_OUTPUT_LINES = 40
+
+
+def find_examples(directory):
+    """Scripts mi_ejemplo_tx_*.py del directorio que definen ExampleTest"""
+    examples = []
+    for path in sorted(glob.glob(os.path.join(directory, EXAMPLE_PATTERN))):
+        with open(path, encoding="utf8") as f:
+            if EXAMPLE_CLASS in f.read():
+                examples.append(path)
+    return examples
+
+
+def run_example(script, portseed, tmpdir, extra_args):
+    """Ejecutar un ejemplo en su propio proceso y regresar su resultado"""
+    cmd = [sys.executable, script, "--portseed={}".format(portseed), "--tmpdir={}".format(tmpdir)] + extra_args
+    start = time.time()
+    proc = subprocess.run(cmd, cwd=os.path.dirname(script), stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT, universal_newlines=True)
+    duration = time.time() - start
+    if proc.returncode == TEST_EXIT_PASSED:
+        status = "passed"
+    elif proc.returncode == TEST_EXIT_SKIPPED:
+        status = "skipped"
+    else:
+        status = "failed"
+    result = {
+        "name": os.path.basename(script),
+        "status": status,
+        "duration": round(duration, 3),
+        "returncode": proc.returncode,
+        "portseed": portseed,
+        "tmpdir": tmpdir,
+    }
+    if status == "failed":
+        result["output"] = proc.stdout.splitlines()[-FAILED_OUTPUT_LINES:]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+                        help="Número de ejemplos a ejecutar al mismo tiempo")
+    parser.add_argument("--output", default="resumen_ejemplos.json",
+                        help="Archivo JSON con el resumen")
+    parser.add_argument("--tmpdirprefix", default=tempfile.gettempdir(),
+                        help="Directorio donde se crean los directorios temporales de cada ejemplo")
+    args, extra_args = parser.parse_known_args()
+
+    examples = find_examples(os.path.dirname(os.path.abspath(__file__)))
+    if not examples:
+        print("No se encontraron ejemplos")
+        sys.exit(1)
+
+    # Un directorio raíz por ejecución; cada ejemplo recibe un subdirectorio
+    # que todavía no existe porque el framework lo crea
+    root = tempfile.mkdtemp(prefix="ejemplos_", dir=args.tmpdirprefix)
+    # Semillas de puertos consecutivas, cada una separa un bloque de puertos
+    # distinto para los nodos del ejemplo
+    base_portseed = os.getpid()
+
+    print("Ejecutando {} ejemplos con {} procesos en paralelo".format(len(examples), args.jobs))
+    start = time.time()
+    results = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(run_example, script, base_portseed + i,
+                                   os.path.join(root, os.path.splitext(os.path.basename(script))[0]), extra_args)
+                   for i, script in enumerate(examples)]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print("{:<32} {:<8} {:8.3f}s".format(result["name"], result["status"], result["duration"]))
+    total = time.time() - start
+
+    results.sort(key=lambda r: r["name"])
+    summary = {
+        "total_duration": round(total, 3),
+        "slowest": max(results, key=lambda r: r["duration"])["name"],
+        "sum_of_durations": round(sum(r["duration"] for r in results), 3),
+        "jobs": args.jobs,
+        "passed": all(r["status"] != "failed" for r in results),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf8") as f:
+        json.dump(summary, f, indent=2)
+    print("Tiempo total: {:.3f}s (suma de los ejemplos: {:.3f}s)".format(total, summary["sum_of_durations"]))
+    print("Resumen en {}".format(args.output))
+
+    # El framework borra el tmpdir de los ejemplos que pasan
+    if not os.listdir(root):
+        os.rmdir(root)
+    sys.exit(0 if summary["passed"] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Funciones de apoyo para resumir las mediciones de tiempo de los ejemplos.
+No depende del framework, solo de la librería estándar, para poder usarse
+desde cualquier script de prueba o benchmark.
+"""
+import math
+import time
+
+
+def timed(fn, *args):
+    """Regresa (fn(*args), segundos que tardó)"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def percentile(values, p):
+    """Percentil p (0-100) por el método del rango más cercano."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Rango más cercano: el elemento ceil(p/100 * n), indexado desde 1
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values):
+    """Regresa un diccionario con el resumen de una lista de latencias en
+    segundos."""
+    total = sum(values)
+    return {
+        "n": len(values),
+        "total": total,
+        "mean": total / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def format_summary(name, values):
+    """Línea de texto con p50/p99 en milisegundos, lista para self.log.info"""
+    s = summarize(values)
+    return "{:<10} n={:<6} p50={:9.3f}ms p99={:9.3f}ms max={:9.3f}ms total={:8.3f}s".format(
+        name, s["n"], s["p50"] * 1000, s["p99"] * 1000, s["max"] * 1000, s["total"])
+
+
+def log_histogram(values, first=0.001, buckets=12):
+    """Conteos por intervalos que duplican su ancho: [0, first), [first,
+    2*first), ... y el último abierto. Regresa una lista de (inicio, fin,
+    conteo); el fin del último es None."""
+    bounds = [0.0] + [first * 2 ** i for i in range(buckets - 1)]
+    counts = [0] * buckets
+    for value in values:
+        i = 0
+        while i < buckets - 1 and value >= bounds[i + 1]:
+            i += 1
+        counts[i] += 1
+    ends = bounds[1:] + [None]
+    return list(zip(bounds, ends, counts))
+
+
+def format_histogram(values, first=0.001, buckets=12, width=40):
+    """Líneas de texto de log_histogram en milisegundos, con barras
+    escaladas al intervalo más poblado. Omite los intervalos vacíos de los
+    extremos."""
+    rows = log_histogram(values, first, buckets)
+    filled = [i for i, (_, _, count) in enumerate(rows) if count]
+    if not filled:
+        return []
+    top = max(count for _, _, count in rows)
+    lines = []
+    for start, end, count in rows[filled[0]:filled[-1] + 1]:
+        label = "{:.1f}-{:.1f}ms".format(start * 1000, end * 1000) if end is not None else \
+            ">={:.1f}ms".format(start * 1000)
+        lines.append("{:>18} {:>6} {}".format(label, count, "#" * round(count / top * width)))
+    return lines
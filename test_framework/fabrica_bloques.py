@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Producción local de bloques con blocktools, enviados por P2P.
+
+self.generate mina cada bloque con una llamada RPC (generatetoaddress) en la
+que el nodo arma la plantilla, busca la prueba de trabajo y conecta el
+bloque. BlockFactory arma los bloques en el proceso con create_block y
+create_coinbase, con las transacciones que queramos, resuelve la prueba de
+trabajo de regtest (en promedio dos intentos) y los envía al nodo por una
+conexión P2P, todos seguidos y con un solo ping al final.
+
+Uso:
+    factory = BlockFactory(self.nodes[0])
+    blocks = factory.mine(COINBASE_MATURITY + 1)
+    blocks = factory.mine_transactions(txs)    # los bloques que hagan falta
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import time
+
+from test_framework.blocktools import add_witness_commitment, create_block, create_coinbase
+from test_framework.messages import COIN, msg_block
+from test_framework.p2p import P2PInterface
+from test_framework.util import assert_equal
+
+from indice_utxos import address_to_script
+from rpc_lotes import RPCBatch
+
+# Peso máximo de un bloque (BIP141), se reservan 4,000 WU para el
+# encabezado y el coinbase
+MAX_BLOCK_WEIGHT = 4000000
+COINBASE_RESERVED_WEIGHT = 4000
+
+
+def pack_transactions(txs, max_weight=MAX_BLOCK_WEIGHT - COINBASE_RESERVED_WEIGHT):
+    """Repartir txs, en orden, en listas que no rebasen max_weight. El orden
+    se respeta para que los hijos nunca queden antes que sus padres."""
+    blocks, current, weight = [], [], 0
+    for tx in txs:
+        tx_weight = tx.get_weight()
+        if current and weight + tx_weight > max_weight:
+            blocks.append(current)
+            current, weight = [], 0
+        current.append(tx)
+        weight += tx_weight
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+class BlockFactory():
+    """Arma, resuelve y envía bloques sobre la punta del nodo. Por defecto el
+    coinbase paga a la llave determinista del nodo, la misma que usa
+    self.generate, así que la wallet ve los coinbase."""
+
+    def __init__(self, node, p2p=None, script_pubkey=None):
+        self.node = node
+        self._p2p = p2p
+        if script_pubkey is None:
+            script_pubkey = address_to_script(node.get_deterministic_priv_key().address)
+        self.script_pubkey = script_pubkey
+        tip = node.getblockheader(node.getbestblockhash())
+        self.tip = int(tip["hash"], 16)
+        self.height = tip["height"]
+        self.last_time = tip["time"]
+
+    @property
+    def p2p(self):
+        if self._p2p is None:
+            self._p2p = self.node.add_p2p_connection(P2PInterface())
+        return self._p2p
+
+    def mempool_fees(self, txs):
+        """Suma en satoshis de las comisiones de txs, que deben estar en el
+        mempool del nodo, con un solo lote de getmempoolentry"""
+        if not txs:
+            return 0
+        for tx in txs:
+            tx.rehash()
+        with RPCBatch(self.node) as batch:
+            entries = [batch.getmempoolentry(tx.hash) for tx in txs]
+        return sum(int(entry.result()["fees"]["base"] * COIN) for entry in entries)
+
+    def create_block(self, txs=(), ntime=None, fees=None):
+        """Bloque resuelto sobre la punta con las transacciones txs. Avanza
+        la punta de la fábrica, pero no lo envía. El coinbase cobra fees
+        satoshis además del subsidio; si no se indica, se suman las
+        comisiones de txs en el mempool del nodo, como lo haría generate."""
+        txs = list(txs)
+        if fees is None:
+            fees = self.mempool_fees(txs)
+        self.height += 1
+        coinbase = create_coinbase(self.height, fees=fees)
+        coinbase.vout[0].scriptPubKey = self.script_pubkey
+        coinbase.rehash()
+        if ntime is None:
+            ntime = self.last_time + 1
+        block = create_block(self.tip, coinbase, ntime, txlist=txs)
+        add_witness_commitment(block)
+        block.solve()
+        self.tip = block.sha256
+        self.last_time = ntime
+        return block
+
+    def submit(self, blocks):
+        """Enviar los bloques por P2P uno tras otro y esperar con un solo
+        ping a que el nodo los procese"""
+        for block in blocks:
+            self.p2p.send_message(msg_block(block))
+        self.p2p.sync_with_ping()
+        assert_equal(self.node.getbestblockhash(), blocks[-1].hash)
+        return [block.hash for block in blocks]
+
+    def _start_time(self, num_blocks):
+        # Terminar cerca de la hora actual: si la punta es el génesis de
+        # regtest el nodo seguiría en descarga inicial (IBD) con bloques viejos
+        return max(self.last_time, int(time.time()) - num_blocks)
+
+    def mine(self, num_blocks, sync_fun=None):
+        """Minar num_blocks bloques vacíos, regresa sus hashes como
+        self.generate"""
+        self.last_time = self._start_time(num_blocks)
+        hashes = self.submit([self.create_block() for _ in range(num_blocks)])
+        if sync_fun is not None:
+            sync_fun()
+        return hashes
+
+    def mine_transactions(self, txs, max_weight=MAX_BLOCK_WEIGHT - COINBASE_RESERVED_WEIGHT, sync_fun=None):
+        """Minar txs (CTransaction del mempool del nodo, en orden de
+        dependencia) en tantos bloques como hagan falta para no rebasar
+        max_weight por bloque. Cada coinbase cobra las comisiones de su
+        bloque."""
+        groups = pack_transactions(txs, max_weight)
+        self.last_time = self._start_time(len(groups))
+        hashes = self.submit([self.create_block(group) for group in groups])
+        if sync_fun is not None:
+            sync_fun()
+        return hashes
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Financiamiento colectivo (crowdfunding) con SIGHASH_ALL|ANYONECANPAY.
+
+Las salidas de la campaña quedan fijas y cada participante firma solo su
+propia entrada con ALL|ANYONECANPAY (ver SigHash/SigHash.md). Con esa bandera
+el mensaje firmado no incluye las demás entradas ni la posición de la propia
+(BIP143 y BIP341 no incluyen el índice, el sighash legacy solo deja la
+entrada firmada), así que una firma válida en la transacción del participante
+sigue siendo válida en la transacción final con miles de entradas.
+
+CrowdfundAggregator aprovecha eso:
+
+- cada aportación se verifica una sola vez al llegar, con ScriptVerifier, y
+  nunca se vuelven a verificar las ya aceptadas;
+- rechaza firmas con otra bandera, que dejarían de ser válidas al agregar
+  entradas, y outpoints repetidos;
+- guarda solo las entradas y testigos ya serializados, y lleva el tamaño y
+  el peso de la transacción al día, así finalize() solo concatena bytes.
+
+Uso:
+    aggregator = CrowdfundAggregator([CTxOut(goal, campaign_script)])
+    tx = aggregator.template()                 # lo que firma el participante
+    tx.vin.append(CTxIn(outpoint))
+    signer.sign_tx(tx, [spent], SIGHASH_ALL | SIGHASH_ANYONECANPAY)
+    aggregator.add(tx, [spent])                # AssertionError con el motivo
+    raw = aggregator.finalize(min_fee_rate=2)  # bytes de la transacción
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import copy
+import struct
+from io import BytesIO
+
+from test_framework.messages import CTransaction, ser_compact_size
+from test_framework.script import SIGHASH_ALL, SIGHASH_ANYONECANPAY
+
+from sighash_bip341 import SIGHASH_DEFAULT
+from verificador_script import (MULTISIG, P2PK, P2PKH, P2SH, P2TR, P2WPKH,
+                                ScriptVerifier, classify, push_only)
+
+CROWDFUND_HASHTYPE = SIGHASH_ALL | SIGHASH_ANYONECANPAY
+WITNESS_SCALE_FACTOR = 4
+
+
+def signature_hashtypes(script_pubkey, script_sig, witness):
+    """Banderas SIGHASH de las firmas de una entrada, None si no se
+    reconocen las firmas. Las firmas Schnorr de 64 bytes son SIGHASH_DEFAULT."""
+    kind, _ = classify(script_pubkey)
+    if kind == P2WPKH:
+        return [witness[0][-1]] if len(witness) == 2 and witness[0] else None
+    if kind == P2TR:
+        if len(witness) != 1 or len(witness[0]) not in (64, 65):
+            return None
+        return [SIGHASH_DEFAULT] if len(witness[0]) == 64 else [witness[0][64]]
+    stack = push_only(script_sig)
+    if not stack:
+        return None
+    if kind == P2SH:
+        if not isinstance(stack[-1], bytes):
+            return None
+        kind, _ = classify(stack[-1])
+        stack = stack[:-1]
+    if kind in (P2PK, P2PKH):
+        sigs = stack[:1]
+    elif kind == MULTISIG:
+        # El primer elemento es el que consume OP_CHECKMULTISIG de más
+        sigs = stack[1:]
+    else:
+        return None
+    if not sigs or any(not isinstance(sig, bytes) or not sig for sig in sigs):
+        return None
+    return [sig[-1] for sig in sigs]
+
+
+class CrowdfundAggregator():
+    """Junta entradas firmadas con ALL|ANYONECANPAY sobre un conjunto fijo de
+    salidas. El orden de las entradas es el de llegada."""
+
+    def __init__(self, outputs, version=2, locktime=0, verifier=None):
+        assert outputs, "la campaña necesita al menos una salida"
+        self.version = version
+        self.locktime = locktime
+        self.outputs = [copy.deepcopy(txout) for txout in outputs]
+        self.goal = sum(txout.nValue for txout in self.outputs)
+        self._outputs = ser_compact_size(len(self.outputs)) + b"".join(txout.serialize() for txout in self.outputs)
+        # Cada entrada se verifica una sola vez, las cachés no ayudan
+        self.verifier = verifier if verifier is not None else ScriptVerifier(sig_cache_size=0, script_cache_size=0)
+        self._inputs = bytearray()
+        # Testigo serializado de cada entrada, b"\x00" si no tiene
+        self._witnesses = bytearray()
+        self._has_witness = False
+        self._outpoints = set()
+        self.num_inputs = 0
+        self.num_contributions = 0
+        self.total_in = 0
+
+    def template(self):
+        """Transacción sin entradas con las salidas de la campaña, para que el
+        participante agregue las suyas y las firme"""
+        tx = CTransaction()
+        tx.nVersion = self.version
+        tx.nLockTime = self.locktime
+        tx.vout = [copy.deepcopy(txout) for txout in self.outputs]
+        return tx
+
+    def add(self, tx, spent):
+        """Aceptar las entradas de una transacción de aportación firmada sobre
+        template(). spent[i] es el CTxOut que gasta la entrada i. Regresa el
+        índice de la primera entrada en la transacción final."""
+        assert len(tx.vin) > 0 and len(tx.vin) == len(spent), "una salida gastada por entrada"
+        assert tx.nVersion == self.version and tx.nLockTime == self.locktime, \
+            "la versión y el locktime deben ser los de la campaña"
+        assert ser_compact_size(len(tx.vout)) + b"".join(txout.serialize() for txout in tx.vout) == self._outputs, \
+            "las salidas no son las de la campaña"
+        outpoints = [txin.prevout.serialize() for txin in tx.vin]
+        assert len(set(outpoints)) == len(outpoints) and self._outpoints.isdisjoint(outpoints), \
+            "outpoint ya aportado"
+        stacks = [tx.wit.vtxinwit[i].scriptWitness.stack if i < len(tx.wit.vtxinwit) else []
+                  for i in range(len(tx.vin))]
+        hashtypes = [signature_hashtypes(txout.scriptPubKey, txin.scriptSig, stack)
+                     for txin, txout, stack in zip(tx.vin, spent, stacks)]
+        for i, types in enumerate(hashtypes):
+            assert types is None or all(h == CROWDFUND_HASHTYPE for h in types), \
+                "entrada {}: las firmas deben usar SIGHASH_ALL|ANYONECANPAY".format(i)
+        # Si no se reconocieron las firmas, el verificador da el motivo
+        self.verifier.check_tx(tx, spent)
+        for i, types in enumerate(hashtypes):
+            # Una entrada sin firmas (OP_TRUE) la podría cambiar cualquiera
+            assert types, "entrada {}: no tiene firmas".format(i)
+
+        first = self.num_inputs
+        for txin, stack in zip(tx.vin, stacks):
+            self._inputs += txin.serialize()
+            self._witnesses += ser_compact_size(len(stack))
+            for item in stack:
+                self._witnesses += ser_compact_size(len(item)) + item
+            self._has_witness = self._has_witness or bool(stack)
+        self._outpoints.update(outpoints)
+        self.num_inputs += len(tx.vin)
+        self.num_contributions += 1
+        self.total_in += sum(txout.nValue for txout in spent)
+        return first
+
+    @property
+    def base_size(self):
+        """Tamaño sin testigos: versión, entradas, salidas y locktime"""
+        return 8 + len(ser_compact_size(self.num_inputs)) + len(self._inputs) + len(self._outputs)
+
+    @property
+    def total_size(self):
+        if not self._has_witness:
+            return self.base_size
+        # Marcador y bandera de segwit
+        return self.base_size + 2 + len(self._witnesses)
+
+    @property
+    def weight(self):
+        return self.base_size * (WITNESS_SCALE_FACTOR - 1) + self.total_size
+
+    @property
+    def vsize(self):
+        return (self.weight + WITNESS_SCALE_FACTOR - 1) // WITNESS_SCALE_FACTOR
+
+    @property
+    def fee(self):
+        """Comisión actual, negativa mientras no se junte la meta"""
+        return self.total_in - self.goal
+
+    def missing(self, fee_rate=0):
+        """Satoshis que faltan para pagar las salidas con una comisión de
+        fee_rate sat/vB sobre el tamaño actual"""
+        return max(0, self.goal + fee_rate * self.vsize - self.total_in)
+
+    def finalize(self, min_fee_rate=None):
+        """Bytes de la transacción final. Con min_fee_rate (sat/vB) falla si
+        las aportaciones no alcanzan para las salidas y la comisión."""
+        assert self.num_inputs > 0, "no hay aportaciones"
+        if min_fee_rate is not None:
+            assert self.missing(min_fee_rate) == 0, "faltan {} satoshis".format(self.missing(min_fee_rate))
+        parts = [struct.pack("<i", self.version)]
+        if self._has_witness:
+            parts.append(b"\x00\x01")
+        parts += [ser_compact_size(self.num_inputs), self._inputs, self._outputs]
+        if self._has_witness:
+            parts.append(self._witnesses)
+        parts.append(struct.pack("<I", self.locktime))
+        return b"".join(parts)
+
+    def to_tx(self, min_fee_rate=None):
+        """La transacción final como CTransaction"""
+        tx = CTransaction()
+        tx.deserialize(BytesIO(self.finalize(min_fee_rate)))
+        tx.rehash()
+        return tx
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Firmador local de transacciones por lotes, construido sobre ECKey y las
+motores de sighash de sighash_bip143.py y sighash_bip341.py.
+
+En lugar de serializar a hex y llamar a signrawtransactionwithwallet por
+cada transacción, registramos nuestras llaves y firmamos en el proceso los
+objetos CTransaction directamente.
+
+Uso:
+    signer = LocalSigner()
+    signer.add_key(key)                      # ECKey
+    signer.add_key(wif_to_key(node.get_deterministic_priv_key().key), taproot=False)
+    signer.add_p2sh(redeem_script, keys)     # P2SH de una llave o multifirma
+    signer.sign_batch(txs, spent_outputs)    # spent_outputs[i][j] = CTxOut
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+import struct
+
+from test_framework.address import base58_to_byte, hash160
+from test_framework.messages import CTxInWitness, ser_compact_size, ser_string
+from test_framework.key import (ECKey, compute_xonly_pubkey, sign_schnorr,
+                                tweak_add_privkey, tweak_add_pubkey)
+from test_framework.script import (CScript, LegacySignatureHash, OP_0, OP_1,
+                                   OP_CHECKMULTISIG, SIGHASH_ALL, TaggedHash)
+from test_framework.script_util import (key_to_p2pk_script,
+                                        key_to_p2wpkh_script,
+                                        keyhash_to_p2pkh_script,
+                                        script_to_p2sh_script)
+
+from sighash_bip143 import SegwitV0Sighash
+from sighash_bip341 import SIGHASH_DEFAULT, TaprootSighash
+
+# Tipos de script que sabe firmar el firmador
+P2PK = "p2pk"
+P2PKH = "p2pkh"
+P2WPKH = "p2wpkh"
+P2SH = "p2sh"
+P2TR = "p2tr"
+
+
+def taproot_tweak_keypair(privkey, merkle_root=b""):
+    """Aplicar el tweak de taproot (BIP341) a una llave privada de 32 bytes.
+    Regresa la llave privada que firma por el key path y la llave x-only de
+    salida que va en el scriptPubKey OP_1 <output_key>."""
+    internal_key, _ = compute_xonly_pubkey(privkey)
+    tweak = TaggedHash("TapTweak", internal_key + merkle_root)
+    output_key, _ = tweak_add_pubkey(internal_key, tweak)
+    return tweak_add_privkey(privkey, tweak), output_key
+
+
+def p2tr_script(output_key):
+    return CScript([OP_1, output_key])
+
+
+def wif_to_key(wif):
+    """ECKey de una llave privada en WIF, como la llave determinista que
+    regresa get_deterministic_priv_key()"""
+    payload, _ = base58_to_byte(wif)
+    key = ECKey()
+    # Con 33 bytes el último (0x01) indica que la pubkey va comprimida
+    key.set(payload[:32], len(payload) == 33)
+    return key
+
+
+def is_multisig(script):
+    """Verdadero si el script es una plantilla <m> <pubkeys> <n> OP_CHECKMULTISIG"""
+    script = bytes(script)
+    return len(script) > 0 and script[-1] == OP_CHECKMULTISIG
+
+
+class LegacySighashCache():
+    """Sighash legacy (pre segwit) de todas las entradas de una transacción,
+    reutilizando la serialización y los estados intermedios de SHA256.
+
+    Para SIGHASH_ALL el mensaje de la entrada i es la transacción con el
+    scriptSig vacío en todas las entradas salvo la i. El prefijo (versión y
+    entradas 0..i-1 vacías) se hashea una sola vez y se copia el estado
+    intermedio (midstate) para cada entrada; las salidas se serializan una
+    sola vez. Otras banderas usan LegacySignatureHash del framework."""
+
+    def __init__(self, tx):
+        self.tx = tx
+        self._version = struct.pack("<i", tx.nVersion)
+        # Entrada serializada con el scriptSig vacío
+        self._empty_inputs = [txin.prevout.serialize() + b"\x00" + struct.pack("<I", txin.nSequence)
+                              for txin in tx.vin]
+        self._tail = (ser_compact_size(len(tx.vout)) + b"".join(o.serialize() for o in tx.vout) +
+                      struct.pack("<I", tx.nLockTime))
+        self._midstates = None
+
+    def _prefix_midstates(self):
+        # _midstates[i] es el estado del hash después de la versión, el número
+        # de entradas y las entradas 0..i-1 vacías
+        h = hashlib.sha256(self._version + ser_compact_size(len(self._empty_inputs)))
+        midstates = []
+        for empty in self._empty_inputs:
+            midstates.append(h.copy())
+            h.update(empty)
+        return midstates
+
+    def sighash(self, index, script_code, hashtype=SIGHASH_ALL):
+        if hashtype != SIGHASH_ALL:
+            sighash, err = LegacySignatureHash(script_code, self.tx, index, hashtype)
+            assert err is None, err
+            return sighash
+        if self._midstates is None:
+            self._midstates = self._prefix_midstates()
+        txin = self.tx.vin[index]
+        h = self._midstates[index].copy()
+        h.update(txin.prevout.serialize() + ser_string(script_code) + struct.pack("<I", txin.nSequence))
+        h.update(b"".join(self._empty_inputs[index + 1:]))
+        h.update(self._tail + struct.pack("<I", hashtype))
+        return hashlib.sha256(h.digest()).digest()
+
+
+class LocalSigner():
+    """Firma por lotes entradas P2PK, P2PKH, P2WPKH, P2SH (de una llave o
+    multifirma) y P2TR (key path, sin árbol de scripts) con llaves
+    registradas."""
+
+    def __init__(self):
+        # scriptPubKey (bytes) -> (tipo, ECKey, pubkey en bytes)
+        self._keys = {}
+
+    def add_key(self, key, taproot=True, pubkey=None):
+        """Registrar una ECKey, regresa su pubkey en bytes. El tweak de
+        taproot cuesta varias multiplicaciones de punto, con taproot=False no
+        se registra la salida P2TR. Si ya se tiene la pubkey comprimida (por
+        ejemplo de pool_llaves.py) se puede pasar para no recalcularla."""
+        if pubkey is None:
+            pubkey = key.get_pubkey().get_bytes()
+        keyhash = hash160(pubkey)
+        self._keys[bytes(key_to_p2pk_script(pubkey))] = (P2PK, key, pubkey)
+        self._keys[bytes(keyhash_to_p2pkh_script(keyhash))] = (P2PKH, key, pubkey)
+        self._keys[bytes(key_to_p2wpkh_script(pubkey))] = (P2WPKH, key, pubkey)
+        if taproot:
+            tweaked_privkey, output_key = taproot_tweak_keypair(key.get_bytes())
+            self._keys[bytes(p2tr_script(output_key))] = (P2TR, tweaked_privkey, output_key)
+        return pubkey
+
+    def add_p2sh(self, redeem_script, keys):
+        """Registrar un redeem script P2SH, regresa su scriptPubKey. Para
+        <pubkey> OP_CHECKSIG keys es la llave; para multi, las m llaves que
+        firman, en el mismo orden que sus pubkeys en el script."""
+        redeem_script = CScript(redeem_script)
+        script_pubkey = script_to_p2sh_script(redeem_script)
+        self._keys[bytes(script_pubkey)] = (P2SH, list(keys), redeem_script)
+        return script_pubkey
+
+    def can_sign(self, script_pubkey):
+        return bytes(script_pubkey) in self._keys
+
+    def sign_batch(self, txs, spent_outputs, hashtype=SIGHASH_ALL):
+        """Firmar en el lugar una lista de CTransaction.
+
+        spent_outputs[i] es la lista de CTxOut que gasta cada entrada de
+        txs[i], necesaria para el scriptPubKey y, en segwit, el monto. Regresa
+        la misma lista de transacciones ya firmadas y con el hash calculado.
+
+        En las entradas taproot SIGHASH_ALL se firma como SIGHASH_DEFAULT, que
+        compromete lo mismo con una firma de 64 bytes."""
+        assert len(txs) == len(spent_outputs)
+        for tx, spent in zip(txs, spent_outputs):
+            self.sign_tx(tx, spent, hashtype)
+        return txs
+
+    def sign_tx(self, tx, spent, hashtype=SIGHASH_ALL):
+        assert len(tx.vin) == len(spent)
+        legacy = None
+        segwit = None
+        taproot = None
+        for i, txout in enumerate(spent):
+            kind, key, pubkey = self._keys[bytes(txout.scriptPubKey)]
+            if kind == P2TR:
+                # Los hashes compartidos de BIP341 se calculan una vez para
+                # todas las entradas taproot de la transacción
+                if taproot is None:
+                    taproot = TaprootSighash(tx, spent)
+                tr_hashtype = SIGHASH_DEFAULT if hashtype == SIGHASH_ALL else hashtype
+                sig = sign_schnorr(key, taproot.sighash(i, tr_hashtype))
+                if tr_hashtype != SIGHASH_DEFAULT:
+                    sig += bytes([tr_hashtype])
+                self._set_witness(tx, i, [sig])
+                continue
+            if kind == P2WPKH:
+                # BIP143: el script code de P2WPKH es el script P2PKH del hash
+                script_code = keyhash_to_p2pkh_script(hash160(pubkey))
+                if segwit is None:
+                    segwit = SegwitV0Sighash(tx)
+                sighash = segwit.sighash(i, script_code, txout.nValue, hashtype)
+                sig = key.sign_ecdsa(sighash) + bytes([hashtype])
+                self._set_witness(tx, i, [sig, pubkey])
+                continue
+            if legacy is None:
+                legacy = LegacySighashCache(tx)
+            if kind == P2SH:
+                # En P2SH se firma el redeem script, no el scriptPubKey
+                redeem_script = pubkey
+                sighash = legacy.sighash(i, redeem_script, hashtype)
+                sigs = [k.sign_ecdsa(sighash) + bytes([hashtype]) for k in key]
+                if is_multisig(redeem_script):
+                    # OP_0 por el elemento de más que consume OP_CHECKMULTISIG
+                    sigs = [OP_0] + sigs
+                tx.vin[i].scriptSig = CScript(sigs + [redeem_script])
+                continue
+            sig = key.sign_ecdsa(legacy.sighash(i, txout.scriptPubKey, hashtype)) + bytes([hashtype])
+            if kind == P2PK:
+                tx.vin[i].scriptSig = CScript([sig])
+            else:
+                tx.vin[i].scriptSig = CScript([sig, pubkey])
+        tx.rehash()
+        return tx
+
+    @staticmethod
+    def _set_witness(tx, index, stack):
+        while len(tx.wit.vtxinwit) < len(tx.vin):
+            tx.wit.vtxinwit.append(CTxInWitness())
+        tx.wit.vtxinwit[index].scriptWitness.stack = stack
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Índice local e incremental de UTXOs por scriptPubKey.
+
+Los ejemplos confirman sus salidas con scantxoutset, que recorre todo el UTXO
+set del nodo en cada llamada. UTXOIndex se alimenta bloque por bloque (con
+getblock en crudo o con los mensajes block de la interfaz P2P) y guarda los
+UTXOs en diccionarios por outpoint y por scriptPubKey, así que una consulta
+cuesta O(1) sin importar el tamaño de la cadena. Las consultas por
+descriptor se resuelven a scriptPubKeys una sola vez y quedan en caché.
+
+Para soportar reorganizaciones cada bloque conectado guarda sus datos de
+deshacer (los UTXOs que gastó y los que creó); disconnect_tip() los revierte.
+UTXOIndexListener pide por P2P los padres que le falten cuando el nodo solo
+anuncia la punta de varios bloques nuevos o de una reorganización.
+
+Uso:
+    index = UTXOIndex()
+    index.sync(self.nodes[0])
+    utxos = index.lookup_descriptor(descriptor)
+
+    # Un índice para toda la prueba que sigue los bloques nuevos por P2P
+    listener = UTXOIndex().follow(self.nodes[0])
+    listener.catch_up(self.nodes[0])
+    utxos = listener.lookup_descriptor(descriptor)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+import re
+
+from test_framework.address import base58_to_byte, hash160
+from test_framework.messages import CBlock, CInv, MSG_BLOCK, from_hex, msg_getdata
+from test_framework.p2p import P2PInterface, p2p_lock
+from test_framework.script import (CScript, CScriptOp, OP_0, OP_1,
+                                   OP_CHECKMULTISIG, OP_RETURN, TaggedHash)
+from test_framework.key import tweak_add_pubkey
+from test_framework.script_util import (key_to_p2pk_script,
+                                        key_to_p2wpkh_script,
+                                        keyhash_to_p2pkh_script,
+                                        scripthash_to_p2sh_script)
+from test_framework.segwit_addr import decode_segwit_address
+
+from derivacion_local import DESCRIPTOR_RE, DescriptorDeriver
+from rpc_lotes import RPCBatch
+
+# Bloques por lote JSON-RPC al sincronizar con el nodo
+SYNC_BATCH_SIZE = 500
+
+
+def split_args(expr):
+    """'sh(multi(2,a,b))' -> ('sh', ['multi(2,a,b)'])"""
+    name, rest = expr.split("(", 1)
+    assert rest.endswith(")"), "descriptor mal formado: {}".format(expr)
+    args, depth, current = [], 0, ""
+    for c in rest[:-1]:
+        if c == "," and depth == 0:
+            args.append(current)
+            current = ""
+            continue
+        depth += (c == "(") - (c == ")")
+        current += c
+    args.append(current)
+    return name, args
+
+
+def address_to_script(address):
+    """scriptPubKey de una dirección base58 o bech32/bech32m"""
+    for hrp in ["bcrt", "tb", "bc"]:
+        if address.lower().startswith(hrp + "1"):
+            version, program = decode_segwit_address(hrp, address)
+            assert version is not None, "dirección bech32 inválida: {}".format(address)
+            return CScript([CScriptOp.encode_op_n(version), bytes(program)])
+    payload, version = base58_to_byte(address)
+    if version in (0, 111):
+        return keyhash_to_p2pkh_script(payload)
+    assert version in (5, 196), "versión base58 desconocida: {}".format(version)
+    return scripthash_to_p2sh_script(payload)
+
+
+def descriptor_script(expr):
+    """scriptPubKey (o script interno) de un descriptor sin rango con llaves
+    en hex: raw, addr, pk, pkh, wpkh, sh, wsh, multi, sortedmulti y tr con
+    una llave x-only sin árbol de scripts"""
+    name, args = split_args(expr)
+    if name == "raw":
+        return CScript(bytes.fromhex(args[0]))
+    if name == "addr":
+        return address_to_script(args[0])
+    if name in ("multi", "sortedmulti"):
+        keys = [bytes.fromhex(k) for k in args[1:]]
+        if name == "sortedmulti":
+            keys.sort()
+        return CScript([CScriptOp.encode_op_n(int(args[0]))] + keys +
+                       [CScriptOp.encode_op_n(len(keys)), OP_CHECKMULTISIG])
+    if name == "sh":
+        return scripthash_to_p2sh_script(hash160(descriptor_script(args[0])))
+    if name == "wsh":
+        return CScript([OP_0, hashlib.sha256(descriptor_script(args[0])).digest()])
+    key = bytes.fromhex(args[0])
+    if name == "pk":
+        return key_to_p2pk_script(key)
+    if name == "pkh":
+        return keyhash_to_p2pkh_script(hash160(key))
+    if name == "wpkh":
+        return key_to_p2wpkh_script(key)
+    if name == "tr" and len(args) == 1:
+        xonly = key[-32:]
+        output_key, _ = tweak_add_pubkey(xonly, TaggedHash("TapTweak", xonly))
+        return CScript([OP_1, output_key])
+    raise AssertionError("descriptor no soportado: {}".format(expr))
+
+
+def descriptor_scripts(descriptor, range_end=1000):
+    """Lista de scriptPubKeys de un descriptor. Los descriptores con llaves
+    extendidas se derivan con DescriptorDeriver, los índices [0, range_end)
+    si tienen rango"""
+    descriptor = descriptor.split("#")[0]
+    if DESCRIPTOR_RE.match(descriptor):
+        deriver = DescriptorDeriver(descriptor)
+        return deriver.derive_scripts(0, range_end if deriver.ranged else 1)
+    # El origen [fingerprint/ruta] no cambia el script
+    return [descriptor_script(re.sub(r"\[[^\]]*\]", "", descriptor))]
+
+
+class UTXOIndex():
+    """UTXO set local alimentado bloque por bloque, con consultas O(1) por
+    outpoint, scriptPubKey o descriptor"""
+
+    def __init__(self):
+        # (txid entero, n) -> (scriptPubKey, monto en sats, altura, coinbase)
+        self._by_outpoint = {}
+        # scriptPubKey -> {(txid entero, n), ...}
+        self._by_script = {}
+        # Cadena conectada: hash de bloque (entero) por altura
+        self._chain = []
+        self._heights = {}
+        # hash de bloque -> (UTXOs gastados, outpoints creados)
+        self._undo = {}
+        self._descriptor_cache = {}
+
+    @property
+    def tip_height(self):
+        return len(self._chain) - 1
+
+    @property
+    def tip(self):
+        return self._chain[-1] if self._chain else None
+
+    def has_block(self, block_hash):
+        """Si el bloque está en la cadena del índice"""
+        return block_hash in self._heights
+
+    def _add(self, outpoint, entry):
+        self._by_outpoint[outpoint] = entry
+        self._by_script.setdefault(entry[0], set()).add(outpoint)
+
+    def _remove(self, outpoint):
+        entry = self._by_outpoint.pop(outpoint, None)
+        if entry is not None:
+            outpoints = self._by_script[entry[0]]
+            outpoints.discard(outpoint)
+            if not outpoints:
+                del self._by_script[entry[0]]
+        return entry
+
+    def connect_block(self, block):
+        """Conectar un CBlock sobre la punta. Si el bloque extiende un bloque
+        anterior de nuestra cadena (una reorganización), primero se
+        desconectan los bloques que sobran."""
+        block.rehash()
+        if block.sha256 in self._heights:
+            return
+        if self._chain and block.hashPrevBlock != self.tip:
+            assert block.hashPrevBlock in self._heights, "el bloque no se conecta a la cadena del índice"
+            while self.tip != block.hashPrevBlock:
+                self.disconnect_tip()
+        height = len(self._chain)
+        spent, created = [], []
+        for i, tx in enumerate(block.vtx):
+            tx.calc_sha256()
+            if i > 0:
+                for txin in tx.vin:
+                    outpoint = (txin.prevout.hash, txin.prevout.n)
+                    entry = self._remove(outpoint)
+                    if entry is not None:
+                        spent.append((outpoint, entry))
+            for n, txout in enumerate(tx.vout):
+                script = bytes(txout.scriptPubKey)
+                # Las salidas OP_RETURN no se pueden gastar, no entran al UTXO set
+                if script[:1] == bytes([OP_RETURN]):
+                    continue
+                outpoint = (tx.sha256, n)
+                self._add(outpoint, (script, txout.nValue, height, i == 0))
+                created.append(outpoint)
+        self._undo[block.sha256] = (spent, created)
+        self._heights[block.sha256] = height
+        self._chain.append(block.sha256)
+
+    def disconnect_tip(self):
+        """Revertir el último bloque conectado"""
+        block_hash = self._chain.pop()
+        del self._heights[block_hash]
+        spent, created = self._undo.pop(block_hash)
+        for outpoint in reversed(created):
+            self._remove(outpoint)
+        for outpoint, entry in reversed(spent):
+            self._add(outpoint, entry)
+
+    def sync(self, node):
+        """Alcanzar la punta del nodo pidiendo los bloques en crudo en lotes
+        JSON-RPC, desconectando primero los bloques que el nodo ya no tiene
+        en su cadena activa"""
+        while self._chain and node.getblockheader("{:064x}".format(self.tip))["confirmations"] < 0:
+            self.disconnect_tip()
+        node_height = node.getblockcount()
+        for start in range(len(self._chain), node_height + 1, SYNC_BATCH_SIZE):
+            heights = range(start, min(start + SYNC_BATCH_SIZE, node_height + 1))
+            batch = RPCBatch(node)
+            hashes = [batch.getblockhash(h) for h in heights]
+            blocks = [batch.getblock(h.result(), 0) for h in hashes]
+            for raw in blocks:
+                self.connect_block(from_hex(CBlock(), raw.result()))
+
+    def follow(self, node):
+        """Sincronizar con sync() y después seguir la punta del nodo con un
+        UTXOIndexListener, que se regresa. Los bloques nuevos llegan por P2P
+        sin ninguna llamada RPC."""
+        self.sync(node)
+        return node.add_p2p_connection(UTXOIndexListener(self))
+
+    def lookup_outpoint(self, txid, n):
+        entry = self._by_outpoint.get((int(txid, 16), n))
+        return None if entry is None else self._format((int(txid, 16), n), entry)
+
+    def lookup_script(self, script_pubkey):
+        """UTXOs de un scriptPubKey"""
+        outpoints = self._by_script.get(bytes(script_pubkey), ())
+        return [self._format(outpoint, self._by_outpoint[outpoint]) for outpoint in outpoints]
+
+    def lookup_descriptor(self, descriptor, range_end=1000):
+        """UTXOs de un descriptor, como los 'unspents' de scantxoutset"""
+        scripts = self._descriptor_cache.get((descriptor, range_end))
+        if scripts is None:
+            scripts = [bytes(s) for s in descriptor_scripts(descriptor, range_end)]
+            self._descriptor_cache[(descriptor, range_end)] = scripts
+        return [utxo for script in scripts for utxo in self.lookup_script(script)]
+
+    def _format(self, outpoint, entry):
+        script, value, height, coinbase = entry
+        return {
+            "txid": "{:064x}".format(outpoint[0]),
+            "vout": outpoint[1],
+            "scriptPubKey": script.hex(),
+            "amount": value,
+            "height": height,
+            "coinbase": coinbase,
+        }
+
+
+class UTXOIndexListener(P2PInterface):
+    """Conexión P2P que alimenta un UTXOIndex con los bloques que anuncia el
+    nodo. El índice debe sincronizarse primero con sync(). Los callbacks
+    corren en el hilo de red, las consultas desde la prueba deben hacerse con
+    p2p_lock."""
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+        # hashPrevBlock -> bloque que llegó antes que su padre
+        self._orphans = {}
+
+    def on_block(self, message):
+        block = message.block
+        block.rehash()
+        if self.index.has_block(block.sha256):
+            return
+        if self.index.tip is not None and not self.index.has_block(block.hashPrevBlock):
+            # Si el nodo conectó varios bloques seguidos (o una reorganización
+            # de más de un bloque) solo anuncia la punta: se guarda el bloque
+            # y se piden sus padres hasta llegar a uno que esté en el índice
+            self._orphans[block.hashPrevBlock] = block
+            self.send_message(msg_getdata([CInv(MSG_BLOCK, block.hashPrevBlock)]))
+            return
+        self.index.connect_block(block)
+        while block.sha256 in self._orphans:
+            block = self._orphans.pop(block.sha256)
+            self.index.connect_block(block)
+
+    def catch_up(self, node, timeout=60):
+        """Esperar a que el índice llegue a la punta actual del nodo"""
+        best = int(node.getbestblockhash(), 16)
+        self.wait_until(lambda: self.index.tip == best, timeout=timeout)
+
+    def lookup_descriptor(self, descriptor, range_end=1000):
+        with p2p_lock:
+            return self.index.lookup_descriptor(descriptor, range_end)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Medición de tiempos por fase y por llamada RPC en los ejemplos.
+
+TimingMixin envuelve la conexión RPC de cada nodo (también las de las
+wallets que se obtienen con get_wallet_rpc y los lotes de rpc_lotes.py) y
+registra la latencia de cada llamada por método. run_test marca sus fases
+con el context manager self.phase(nombre), que se pueden anidar; cada
+llamada RPC se atribuye a la fase en curso.
+
+Al terminar main() se escribe en el log un resumen estilo flame graph (el
+árbol de fases con su tiempo y las llamadas RPC de cada una) y, con
+--timings=ARCHIVO, el detalle en JSON: histogramas por método RPC y el
+tiempo de cada fase. Con --timings también se escribe ARCHIVO.folded en el
+formato de pilas plegadas de flamegraph.pl.
+
+Uso:
+    class ExampleTest(TimingMixin, SnapshotMixin, BitcoinTestFramework):
+        def run_test(self):
+            with self.phase("minar"):
+                self.generate(self.nodes[0], 101)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from estadisticas import summarize
+
+# Límites superiores (en segundos) de las cubetas de los histogramas RPC
+HISTOGRAM_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+# Ancho de la barra del resumen en texto
+BAR_WIDTH = 40
+
+
+def histogram(values):
+    """Conteo por cubeta, la llave es el límite superior en milisegundos"""
+    counts = {"<={}ms".format(b * 1000): 0 for b in HISTOGRAM_BUCKETS}
+    counts["inf"] = 0
+    for value in values:
+        for bucket in HISTOGRAM_BUCKETS:
+            if value <= bucket:
+                counts["<={}ms".format(bucket * 1000)] += 1
+                break
+        else:
+            counts["inf"] += 1
+    return counts
+
+
+class TimingRecorder():
+    """Acumula las latencias RPC por método y el tiempo de cada fase. Las
+    llamadas pueden venir de varios hilos; las fases se abren desde el hilo
+    principal de la prueba."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stack = []
+        # método -> latencias
+        self.rpc = {}
+        # ruta de fases (tupla) -> [veces, segundos], en orden de apertura
+        self.spans = {}
+
+    @contextmanager
+    def phase(self, name):
+        self._stack.append(name)
+        path = tuple(self._stack)
+        # Registrar la ruta al abrirla conserva el orden cronológico
+        with self._lock:
+            self.spans.setdefault(path, [0, 0.0])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            self._add_span(path, elapsed)
+
+    def record_rpc(self, method, elapsed):
+        with self._lock:
+            self.rpc.setdefault(method, []).append(elapsed)
+            path = tuple(self._stack) + ("rpc:" + method,)
+        self._add_span(path, elapsed)
+
+    def _add_span(self, path, elapsed):
+        with self._lock:
+            span = self.spans.setdefault(path, [0, 0.0])
+            span[0] += 1
+            span[1] += elapsed
+
+    def to_json(self):
+        with self._lock:
+            rpc = {method: dict(summarize(values), histogram=histogram(values))
+                   for method, values in sorted(self.rpc.items())}
+        phases = [{"path": ";".join(path), "count": count, "total": total}
+                  for path, (count, total) in self._tree()]
+        return {"rpc": rpc, "phases": phases}
+
+    def _tree(self):
+        """Rutas en orden de árbol: cada fase seguida de sus hijas, en el
+        orden en que se abrieron"""
+        with self._lock:
+            spans = dict(self.spans)
+        order = list(spans)
+
+        def walk(prefix):
+            for path in order:
+                if len(path) == len(prefix) + 1 and path[:-1] == prefix:
+                    yield path
+                    yield from walk(path)
+        return [(path, spans[path]) for path in walk(())]
+
+    def folded(self):
+        """Pilas plegadas para flamegraph.pl. El valor es el tiempo propio de
+        cada ruta en microsegundos, sin el de sus hijas."""
+        spans = self._tree()
+        lines = []
+        for path, (_, total) in spans:
+            children = sum(t for p, (_, t) in spans if len(p) == len(path) + 1 and p[:-1] == path)
+            lines.append("{} {}".format(";".join(path), max(0, int((total - children) * 1e6))))
+        return lines
+
+    def flame_text(self):
+        """Árbol de fases con el tiempo total, las veces que se ejecutó y una
+        barra proporcional a la fase más larga"""
+        spans = self._tree()
+        if not spans:
+            return []
+        longest = max(total for _, (_, total) in spans)
+        lines = []
+        for path, (count, total) in spans:
+            bar = "#" * max(1, int(BAR_WIDTH * total / longest)) if longest else ""
+            lines.append("{:<48} {:9.3f}s x{:<6} {}".format(
+                "  " * (len(path) - 1) + path[-1], total, count, bar))
+        return lines
+
+
+class TimedMethod():
+    """Método RPC que mide cada llamada; get_request no se mide porque solo
+    arma la petición de un lote"""
+
+    def __init__(self, method, name, recorder):
+        self._method = method
+        self._name = name
+        self._recorder = recorder
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._method(*args, **kwargs)
+        finally:
+            self._recorder.record_rpc(self._name, time.perf_counter() - start)
+
+    def get_request(self, *args, **kwargs):
+        return self._method.get_request(*args, **kwargs)
+
+
+class TimedRPC():
+    """Envoltura de un AuthServiceProxy que registra la latencia de cada
+    método en un TimingRecorder"""
+
+    def __init__(self, proxy, recorder):
+        self._proxy = proxy
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return TimedMethod(getattr(self._proxy, name), name, self._recorder)
+
+    def __truediv__(self, relative_uri):
+        # get_wallet_rpc: la wallet comparte la conexión y el registro
+        return TimedRPC(self._proxy / relative_uri, self._recorder)
+
+    def batch(self, requests):
+        start = time.perf_counter()
+        try:
+            return self._proxy.batch(requests)
+        finally:
+            self._recorder.record_rpc("batch", time.perf_counter() - start)
+
+
+class TimingMixin():
+    """Mixin para BitcoinTestFramework que instrumenta los nodos y exporta
+    los tiempos al terminar. Debe ir antes de BitcoinTestFramework (y de
+    SnapshotMixin) en la lista de clases base."""
+
+    @property
+    def timings(self):
+        if not hasattr(self, "_timings"):
+            self._timings = TimingRecorder()
+        return self._timings
+
+    def phase(self, name):
+        return self.timings.phase(name)
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--timings", dest="timings", default=None,
+                            help="Archivo JSON donde guardar los tiempos por fase y por método RPC")
+
+    def _instrument_nodes(self):
+        for node in self.nodes:
+            rpc = getattr(node, "rpc", None)
+            if rpc is not None and not isinstance(rpc, TimedRPC):
+                node.rpc = TimedRPC(rpc, self.timings)
+
+    def start_node(self, i, *args, **kwargs):
+        with self.phase("start_node"):
+            super().start_node(i, *args, **kwargs)
+        self._instrument_nodes()
+
+    def start_nodes(self, *args, **kwargs):
+        with self.phase("start_nodes"):
+            super().start_nodes(*args, **kwargs)
+        self._instrument_nodes()
+
+    def shutdown(self):
+        self.report_timings()
+        return super().shutdown()
+
+    def report_timings(self):
+        self.log.info("Tiempos por fase y por llamada RPC:")
+        for line in self.timings.flame_text():
+            self.log.info(line)
+        path = getattr(self.options, "timings", None)
+        if path:
+            with open(path, "w", encoding="utf8") as f:
+                json.dump(self.timings.to_json(), f, indent=2)
+            with open(path + ".folded", "w", encoding="utf8") as f:
+                f.write("\n".join(self.timings.folded()) + "\n")
+            self.log.info("Tiempos guardados en {}".format(path))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark de árboles de scripts taproot grandes: taproot_construct del
+framework contra TaprootTree de arbol_taproot.py. No necesita nodos.
+
+Las hojas alternan scripts con timelock (<bloques> OP_CSV OP_DROP <llave>
+OP_CHECKSIG) y multifirmas 2-de-3 de tapscript (OP_CHECKSIGADD). Se mide
+armar el árbol balanceado y el de Huffman (con pesos tipo Zipf: pocas hojas
+muy probables), generar control blocks de hojas al azar y cambiar una hoja.
+Con pesos, las hojas a gastar se eligen según su peso y se reporta el tamaño
+promedio del control block en cada árbol.
+
+Uso:
+    ./mi_benchmark_arbol_taproot.py --leaves 100000 --samples 2000
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import random
+
+# Evitar importaciones wildcard *
+from test_framework.key import compute_xonly_pubkey
+from test_framework.script import (CScript, OP_2, OP_CHECKSEQUENCEVERIFY, OP_CHECKSIG,
+                                   OP_CHECKSIGADD, OP_DROP, OP_NUMEQUAL, taproot_construct)
+
+from arbol_taproot import TaprootTree, check_control_block
+from estadisticas import timed
+
+
+def leaf_scripts(count, rng):
+    """Alternativas con timelock y multifirmas 2-de-3 con llaves al azar"""
+    scripts = []
+    for i in range(count):
+        if i % 2:
+            keys = [rng.randbytes(32) for _ in range(3)]
+            scripts.append(CScript([keys[0], OP_CHECKSIG, keys[1], OP_CHECKSIGADD,
+                                    keys[2], OP_CHECKSIGADD, OP_2, OP_NUMEQUAL]))
+        else:
+            scripts.append(CScript([144 * (1 + i % 52), OP_CHECKSEQUENCEVERIFY, OP_DROP,
+                                    rng.randbytes(32), OP_CHECKSIG]))
+    return scripts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--leaves", type=int, default=16384, help="Hojas del árbol")
+    parser.add_argument("--samples", type=int, default=1000,
+                        help="Control blocks y cambios de hoja a medir")
+    parser.add_argument("--framework-max", type=int, default=65536,
+                        help="Con más hojas no se mide taproot_construct")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    internal_key, _ = compute_xonly_pubkey(rng.randbytes(32))
+    scripts = leaf_scripts(args.leaves, rng)
+    # Zipf: el peso de la hoja de rango r es 1/r, en orden al azar
+    weights = [args.leaves // r for r in range(1, args.leaves + 1)]
+    rng.shuffle(weights)
+    uniform = [rng.randrange(args.leaves) for _ in range(args.samples)]
+    weighted = rng.choices(range(args.leaves), weights=weights, k=args.samples)
+
+    balanced, build_balanced = timed(lambda: TaprootTree(scripts, internal_key))
+    huffman, build_huffman = timed(lambda: TaprootTree(scripts, internal_key, weights))
+    rows = [("TaprootTree balanceado", build_balanced), ("TaprootTree Huffman", build_huffman)]
+
+    blocks, control_time = timed(lambda: [balanced.control_block(i) for i in uniform])
+    for i, control_block in zip(uniform[:20], blocks):
+        assert check_control_block(control_block, scripts[i], balanced.output_key)
+
+    framework_time = None
+    if args.leaves <= args.framework_max:
+        nested = balanced.to_nested()
+        info, framework_time = timed(lambda: taproot_construct(internal_key, nested))
+        rows.insert(0, ("taproot_construct", framework_time))
+        # Mismo árbol, mismos control blocks
+        assert info.scriptPubKey == bytes(balanced.script_pubkey)
+        for i, control_block in zip(uniform, blocks):
+            leaf = info.leaves["leaf{}".format(i)]
+            assert control_block == bytes([leaf.version + info.negflag]) + info.internal_pubkey + leaf.merklebranch
+
+    print("{} hojas, profundidad del árbol balanceado {}".format(args.leaves, balanced.depth(0)))
+    print("{:<24} {:>12}".format("armar el árbol", "tiempo (s)"))
+    for name, elapsed in rows:
+        print("{:<24} {:>12.3f}".format(name, elapsed))
+
+    print("Control blocks: {:.1f}us cada uno ({} hojas al azar)".format(control_time / args.samples * 1e6, args.samples))
+    for name, tree in [("balanceado", balanced), ("Huffman", huffman)]:
+        size = sum(len(tree.control_block(i)) for i in weighted) / args.samples
+        print("  {:<11} tamaño promedio gastando según los pesos: {:.1f} bytes".format(name, size))
+
+    replacements = leaf_scripts(args.samples, rng)
+    _, update_time = timed(lambda: [balanced.update_leaf(i, s) for i, s in zip(uniform, replacements)])
+    for i, s in zip(uniform, replacements):
+        scripts[i] = s
+    assert balanced.merkle_root == TaprootTree(scripts, internal_key).merkle_root
+    print("Cambiar una hoja: {:.1f}us (reconstruir: {:.3f}s{})".format(
+        update_time / args.samples * 1e6, build_balanced,
+        ", taproot_construct: {:.3f}s".format(framework_time) if framework_time is not None else ""))
+
+
+if __name__ == '__main__':
+    main()
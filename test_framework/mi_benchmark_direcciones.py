@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark del codec de direcciones por lotes (codec_direcciones.py)
+contra las funciones de una dirección por llamada del framework:
+byte_to_base58/base58_to_byte para P2PKH y P2SH, y
+encode_segwit_address/decode_segwit_address para P2WPKH (bech32) y P2TR
+(bech32m). No necesita nodos, solo las librerías del framework.
+
+Uso:
+    ./mi_benchmark_direcciones.py --count 100000
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import random
+
+# Evitar importaciones wildcard *
+from test_framework.address import base58_to_byte, byte_to_base58
+from test_framework.segwit_addr import decode_segwit_address, encode_segwit_address
+
+from codec_direcciones import (decode_base58check, decode_segwit,
+                               encode_base58check, encode_segwit)
+from estadisticas import timed
+
+HRP = "bcrt"
+
+
+def normalize(decoded):
+    """decode_segwit_address regresa el programa como lista de enteros"""
+    return [tuple(x if isinstance(x, int) else bytes(x) for x in item) for item in decoded]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--count", type=int, default=100000,
+                        help="Número de direcciones de cada tipo")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    hashes = [rng.randbytes(20) for _ in range(args.count)]
+    programs = [rng.randbytes(32) for _ in range(args.count)]
+    # Un buffer contiguo de hash160, como los que se leen de un archivo
+    buffer = b"".join(hashes)
+
+    cases = [
+        ("P2PKH", lambda: [byte_to_base58(h, 111) for h in hashes],
+         lambda: encode_base58check(buffer, 111),
+         lambda addresses: [base58_to_byte(a) for a in addresses],
+         lambda addresses: decode_base58check(addresses)),
+        ("P2SH", lambda: [byte_to_base58(h, 196) for h in hashes],
+         lambda: encode_base58check(hashes, 196),
+         lambda addresses: [base58_to_byte(a) for a in addresses],
+         lambda addresses: decode_base58check(addresses)),
+        ("P2WPKH", lambda: [encode_segwit_address(HRP, 0, h) for h in hashes],
+         lambda: encode_segwit(hashes, HRP, 0),
+         lambda addresses: [decode_segwit_address(HRP, a) for a in addresses],
+         lambda addresses: decode_segwit(addresses, HRP)),
+        ("P2TR", lambda: [encode_segwit_address(HRP, 1, p) for p in programs],
+         lambda: encode_segwit(programs, HRP, 1),
+         lambda addresses: [decode_segwit_address(HRP, a) for a in addresses],
+         lambda addresses: decode_segwit(addresses, HRP)),
+    ]
+
+    print("{:>8} {:>10} {:>14} {:>14} {:>10}".format("tipo", "operación", "framework (s)", "lote (s)", "aceler."))
+    for name, encode_one, encode_batch, decode_one, decode_batch in cases:
+        expected, one = timed(encode_one)
+        addresses, batch = timed(encode_batch)
+        # Ambos caminos deben producir exactamente las mismas direcciones
+        assert addresses == expected, "{}: las direcciones no coinciden".format(name)
+        print("{:>8} {:>10} {:>14.4f} {:>14.4f} {:>9.1f}x".format(name, "codificar", one, batch, one / batch))
+
+        expected, one = timed(lambda: decode_one(addresses))
+        decoded, batch = timed(lambda: decode_batch(addresses))
+        assert normalize(decoded) == normalize(expected), "{}: la decodificación no coincide".format(name)
+        print("{:>8} {:>10} {:>14.4f} {:>14.4f} {:>9.1f}x".format(name, "decodificar", one, batch, one / batch))
+
+
+if __name__ == '__main__':
+    main()
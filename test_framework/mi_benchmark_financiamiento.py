@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark del financiamiento colectivo con SIGHASH_ALL|ANYONECANPAY
+(financiamiento_colectivo.py). No necesita nodos.
+
+Prepara aportaciones P2WPKH y P2TR firmadas con ALL|ANYONECANPAY que gastan
+outpoints inventados y, para cada número de participantes, mide:
+
+- el tiempo de aceptar cada aportación en CrowdfundAggregator;
+- el tiempo de finalize() contra armar la CTransaction completa y volver a
+  verificar todas las entradas al final;
+- con pocos participantes, volver a verificar toda la transacción después de
+  cada aportación (cuadrático);
+- la memoria que retiene el agregador contra la de la CTransaction completa,
+  con tracemalloc.
+
+Al final comprueba que la transacción agregada es la misma que la armada con
+el framework, que el peso coincide con get_weight() y que las firmas siguen
+siendo válidas con todas las entradas juntas.
+
+Uso:
+    ./mi_benchmark_financiamiento.py --contributors 100,1000,5000 --naive-max 300
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import copy
+import random
+import time
+import tracemalloc
+
+# Evitar importaciones wildcard *
+from test_framework.key import ECKey
+from test_framework.messages import COutPoint, CTxIn, CTxInWitness, CTxOut
+from test_framework.script import SIGHASH_ALL
+from test_framework.script_util import key_to_p2wpkh_script
+
+from estadisticas import summarize, timed
+from financiamiento_colectivo import CROWDFUND_HASHTYPE, CrowdfundAggregator
+from firmador_local import LocalSigner, p2tr_script, taproot_tweak_keypair
+from pool_llaves import generate_batch
+from verificador_script import ScriptVerifier
+
+# Margen de vbytes por entrada para fijar la meta (P2WPKH ~68, P2TR ~58)
+INPUT_VBYTES = 70
+TX_VBYTES = 100
+
+
+def make_contributions(count, num_keys, fee_rate, rng):
+    """Regresa las salidas de la campaña, la lista de aportaciones (tx,
+    [CTxOut gastado]) y el firmador. La meta se fija para que todas las
+    aportaciones juntas paguen la comisión."""
+    signer = LocalSigner()
+    scripts = []
+    for i, (priv, pubkey) in enumerate(generate_batch(num_keys)):
+        key = ECKey()
+        key.set(priv, True)
+        signer.add_key(key, taproot=i % 2 == 1, pubkey=pubkey)
+        if i % 2:
+            scripts.append(p2tr_script(taproot_tweak_keypair(priv)[1]))
+        else:
+            scripts.append(key_to_p2wpkh_script(pubkey))
+    amounts = [rng.randrange(100000, 1000000) for _ in range(count)]
+    campaign = ECKey()
+    campaign.generate()
+    goal = sum(amounts) - fee_rate * (TX_VBYTES + INPUT_VBYTES * count)
+    outputs = [CTxOut(goal, key_to_p2wpkh_script(campaign.get_pubkey().get_bytes()))]
+
+    template = CrowdfundAggregator(outputs).template()
+    contributions = []
+    for i, amount in enumerate(amounts):
+        tx = copy.deepcopy(template)
+        tx.vin.append(CTxIn(COutPoint(rng.getrandbits(256), rng.randrange(4))))
+        spent = [CTxOut(amount, scripts[i % num_keys])]
+        signer.sign_tx(tx, spent, CROWDFUND_HASHTYPE)
+        contributions.append((tx, spent))
+    return outputs, contributions, signer
+
+
+def assemble(outputs, contributions):
+    """La transacción completa con objetos del framework"""
+    tx = CrowdfundAggregator(outputs).template()
+    spent = []
+    for contribution, contribution_spent in contributions:
+        tx.vin += copy.deepcopy(contribution.vin)
+        for i in range(len(contribution.vin)):
+            witness = CTxInWitness()
+            if i < len(contribution.wit.vtxinwit):
+                witness.scriptWitness.stack = list(contribution.wit.vtxinwit[i].scriptWitness.stack)
+            tx.wit.vtxinwit.append(witness)
+        spent += contribution_spent
+    tx.rehash()
+    return tx, spent
+
+
+def retained_memory(fn):
+    """Bytes que siguen reservados por el resultado de fn()"""
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, current - base
+
+
+def aggregate(outputs, contributions, latencies=None):
+    aggregator = CrowdfundAggregator(outputs)
+    for tx, spent in contributions:
+        start = time.perf_counter()
+        aggregator.add(tx, spent)
+        if latencies is not None:
+            latencies.append(time.perf_counter() - start)
+    return aggregator
+
+
+def naive_incremental(outputs, contributions):
+    """Volver a verificar todas las entradas después de cada aportación"""
+    for n in range(1, len(contributions) + 1):
+        tx, spent = assemble(outputs, contributions[:n])
+        ScriptVerifier(sig_cache_size=0, script_cache_size=0).check_tx(tx, spent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--contributors", default="100,1000,3000",
+                        help="Números de participantes a medir, separados por comas")
+    parser.add_argument("--keys", type=int, default=200,
+                        help="Llaves distintas entre los participantes")
+    parser.add_argument("--naive-max", type=int, default=200,
+                        help="Con más participantes no se mide la verificación completa en cada aportación")
+    parser.add_argument("--fee-rate", type=int, default=2, help="sat/vB")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sizes = sorted(int(n) for n in args.contributors.split(","))
+
+    rng = random.Random(args.seed)
+    (outputs, contributions, signer), prepare = timed(
+        lambda: make_contributions(sizes[-1], min(args.keys, sizes[-1]), args.fee_rate, rng))
+    print("{} aportaciones firmadas con ALL|ANYONECANPAY en {:.1f}s".format(sizes[-1], prepare))
+
+    # Una firma SIGHASH_ALL dejaría de ser válida al agregar otra entrada
+    tx, spent = copy.deepcopy(contributions[0])
+    signer.sign_tx(tx, spent, SIGHASH_ALL)
+    try:
+        CrowdfundAggregator(outputs).add(tx, spent)
+    except AssertionError as e:
+        assert "ANYONECANPAY" in str(e), e
+    else:
+        raise AssertionError("se aceptó una firma SIGHASH_ALL")
+
+    print("{:>7} {:>10} {:>10} {:>12} {:>13} {:>11} {:>11} {:>10}".format(
+        "aport.", "add p50", "finalize", "reverificar", "cada aport.", "mem. agr.", "mem. tx", "meta"))
+    for n in sizes:
+        subset = contributions[:n]
+        latencies = []
+        aggregator = aggregate(outputs, subset, latencies)
+        raw, finalize_time = timed(aggregator.finalize)
+
+        def reverify():
+            tx, spent = assemble(outputs, subset)
+            ScriptVerifier(sig_cache_size=0, script_cache_size=0).check_tx(tx, spent)
+            return tx.serialize()
+        _, reverify_time = timed(reverify)
+        naive = "-"
+        if n <= args.naive_max:
+            naive = "{:.2f}s".format(timed(lambda: naive_incremental(outputs, subset))[1])
+
+        _, aggregator_memory = retained_memory(lambda: aggregate(outputs, subset))
+        _, tx_memory = retained_memory(lambda: assemble(outputs, subset))
+
+        # Misma transacción que la armada con el framework
+        tx, spent = assemble(outputs, subset)
+        assert raw == tx.serialize()
+        assert aggregator.weight == tx.get_weight()
+        if n == sizes[0]:
+            ScriptVerifier().check_tx(aggregator.to_tx(), spent)
+
+        print("{:>7} {:>8.0f}us {:>8.1f}ms {:>10.1f}ms {:>13} {:>9.0f}KB {:>9.0f}KB {:>10}".format(
+            n, summarize(latencies)["p50"] * 1e6, finalize_time * 1000, reverify_time * 1000, naive,
+            aggregator_memory / 1024, tx_memory / 1024,
+            "lista" if aggregator.missing(args.fee_rate) == 0 else "faltan"))
+
+
+if __name__ == '__main__':
+    main()
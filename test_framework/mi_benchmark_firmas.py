@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark del firmador local por lotes (firmador_local.py) contra la firma
+por RPC con signrawtransactionwithkey, una llamada y un viaje en hex por
+transacción.
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import time
+
+# Evitar importaciones wildcard *
+from test_framework.blocktools import COINBASE_MATURITY
+from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint, COIN
+from test_framework.script_util import (key_to_p2pk_script,
+                                        key_to_p2wpkh_script,
+                                        keyhash_to_p2pkh_script)
+
+from test_framework.test_framework import BitcoinTestFramework
+from test_framework.util import assert_equal
+from test_framework.address import hash160, key_to_p2pkh
+from test_framework.key import ECKey
+from test_framework.wallet_util import bytes_to_wif
+
+from firmador_local import LocalSigner
+
+SCRIPT_TYPES = ["p2pk", "p2pkh", "p2wpkh"]
+# Tarifa de los gastos en sat/vB, con margen sobre el mínimo de 1 sat/vB
+# porque el tamaño de las firmas ECDSA varía en un byte
+FEE_RATE = 2
+# Tarifa del reparto en sat/vB, calculada sobre un tamaño estimado por salida
+FANOUT_FEE_RATE = 10
+FANOUT_BYTES_PER_OUTPUT = 60
+
+
+class SigningBenchmark(BitcoinTestFramework):
+
+    def set_test_params(self):
+        # Cadena nueva y un solo nodo, no necesitamos wallet porque todas las
+        # llaves son locales
+        self.setup_clean_chain = True
+        self.num_nodes = 1
+        self.extra_args = [[]]
+
+    def add_options(self, parser):
+        parser.add_argument("--txs", dest="txs", type=int, default=500,
+                            help="Número de transacciones a firmar")
+        parser.add_argument("--inputs", dest="inputs", type=int, default=1,
+                            help="Entradas por transacción")
+        parser.add_argument("--type", dest="script_type", default="p2pkh", choices=SCRIPT_TYPES,
+                            help="Tipo de salida que se gasta")
+
+    def run_test(self):
+        node = self.nodes[0]
+        num_txs, num_inputs = self.options.txs, self.options.inputs
+        num_outputs = num_txs * num_inputs
+        # El reparto es una sola transacción, debe quedar bajo el límite de peso estándar
+        assert num_outputs <= 2000, "máximo 2000 salidas en total (txs * inputs)"
+
+        key = ECKey()
+        key.generate()
+        pubkey = key.get_pubkey().get_bytes()
+        signer = LocalSigner()
+        signer.add_key(key, taproot=False)
+        script_pubkey = {
+            "p2pk": key_to_p2pk_script(pubkey),
+            "p2pkh": keyhash_to_p2pkh_script(hash160(pubkey)),
+            "p2wpkh": key_to_p2wpkh_script(pubkey),
+        }[self.options.script_type]
+
+        self.log.info("Minar los coinbase directamente a nuestra llave local")
+        blocks = self.generatetoaddress(node, COINBASE_MATURITY + 1, key_to_p2pkh(pubkey, main=False))
+        coinbase = node.getblock(blocks[0], 2)["tx"][0]
+        coinbase_out = CTxOut(int(coinbase["vout"][0]["value"] * COIN),
+                              keyhash_to_p2pkh_script(hash160(pubkey)))
+
+        self.log.info("Repartir el coinbase en {} salidas {}".format(num_outputs, self.options.script_type))
+        fanout_fee = FANOUT_FEE_RATE * FANOUT_BYTES_PER_OUTPUT * (num_outputs + 2)
+        value = (coinbase_out.nValue - fanout_fee) // num_outputs
+        fanout = CTransaction()
+        fanout.vin = [CTxIn(COutPoint(int(coinbase["txid"], 16), 0))]
+        fanout.vout = [CTxOut(value, script_pubkey) for _ in range(num_outputs)]
+        signer.sign_batch([fanout], [[coinbase_out]])
+        node.sendrawtransaction(fanout.serialize().hex())
+        self.generate(node, 1)
+
+        def build_spends(fee):
+            txs, spent = [], []
+            for t in range(num_txs):
+                tx = CTransaction()
+                tx.vin = [CTxIn(COutPoint(fanout.sha256, t * num_inputs + i)) for i in range(num_inputs)]
+                tx.vout = [CTxOut(value * num_inputs - fee, script_pubkey)]
+                txs.append(tx)
+                spent.append([fanout.vout[t * num_inputs + i] for i in range(num_inputs)])
+            return txs, spent
+
+        # Todos los gastos tienen la misma forma, la tarifa se calcula con el
+        # tamaño de uno de prueba
+        probe, probe_spent = build_spends(0)
+        signer.sign_batch(probe[:1], probe_spent[:1])
+        fee = probe[0].get_vsize() * FEE_RATE
+
+        self.log.info("Firma por RPC: signrawtransactionwithkey por transacción")
+        txs, _ = build_spends(fee)
+        wif = bytes_to_wif(key.get_bytes())
+        start = time.perf_counter()
+        rpc_signed = [node.signrawtransactionwithkey(tx.serialize().hex(), [wif])["hex"] for tx in txs]
+        rpc_time = time.perf_counter() - start
+
+        self.log.info("Firma local por lotes")
+        txs, spent = build_spends(fee)
+        start = time.perf_counter()
+        signer.sign_batch(txs, spent)
+        local_time = time.perf_counter() - start
+
+        # Ambos caminos deben producir transacciones válidas para el nodo
+        for tx_hex in [rpc_signed[0], txs[0].serialize().hex()]:
+            assert_equal(node.testmempoolaccept([tx_hex])[0]["allowed"], True)
+
+        self.log.info("Resultados ({} tx de {} entradas {}):".format(num_txs, num_inputs, self.options.script_type))
+        self.log.info("RPC:   {:8.3f}s  {:8.1f} tx/s".format(rpc_time, num_txs / rpc_time))
+        self.log.info("Local: {:8.3f}s  {:8.1f} tx/s".format(local_time, num_txs / local_time))
+        self.log.info("Aceleración: {:.2f}x".format(rpc_time / local_time))
+
+
+if __name__ == '__main__':
+    SigningBenchmark().main()
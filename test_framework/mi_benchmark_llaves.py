@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark de la generación de pares de llaves: ECKey().generate() y
+get_pubkey() del framework contra la tabla de base fija de pool_llaves.py,
+en el proceso y con KeyPool en procesos de fondo. No necesita nodos.
+
+Uso:
+    ./mi_benchmark_llaves.py --count 2000 --workers 4
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import time
+
+# Evitar importaciones wildcard *
+from test_framework.key import ECKey
+
+from pool_llaves import KeyPool, fixed_base_table, generate_batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--count", type=int, default=2000, help="Pares de llaves a generar")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos del pool (default: número de CPUs)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.count):
+        key = ECKey()
+        key.generate()
+        key.get_pubkey().get_bytes()
+    framework = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fixed_base_table()
+    table = time.perf_counter() - start
+    start = time.perf_counter()
+    pairs = generate_batch(args.count)
+    local = time.perf_counter() - start
+
+    # La pubkey de la tabla debe coincidir con la del framework
+    for priv, pubkey in pairs[:20]:
+        key = ECKey()
+        key.set(priv, True)
+        assert key.get_pubkey().get_bytes() == pubkey
+
+    with KeyPool(workers=args.workers) as pool:
+        pool.refill(args.count)
+        start = time.perf_counter()
+        pool.take(args.count)
+        pooled = time.perf_counter() - start
+
+    print("Tabla de base fija: {:.3f}s (una vez por proceso)".format(table))
+    print("{:<28} {:>10} {:>14} {:>9}".format("método", "total (s)", "por llave", "aceler."))
+    for name, elapsed in [("ECKey.generate + get_pubkey", framework), ("tabla de base fija", local),
+                          ("KeyPool (procesos)", pooled)]:
+        print("{:<28} {:>10.3f} {:>12.1f}us {:>8.1f}x".format(
+            name, elapsed, elapsed / args.count * 1e6, framework / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark del mempool con grafos de transacciones sin confirmar
+(cadenas_mempool.py).
+
+Se mina un coinbase maduro a una llave P2WPKH local, se reparte en muchas
+salidas confirmadas y desde cada una se arma una forma:
+
+- chain: cadena CPFP de --depth transacciones.
+- tree: árbol de reparto binario con tantos niveles como quepan en --depth.
+- diamond: un padre, --depth - 2 hijos y un nieto que los junta.
+- fan_in: cuatro cadenas cortas y una transacción que junta sus puntas.
+
+Todas se envían en orden de dependencias sin minar entre ellas, así el
+mempool crece durante la prueba. Se reporta la latencia p50 de
+sendrawtransaction por número de ancestros y por tamaño del mempool, y al
+final se comprueba que el nodo rechaza la transacción que rebasa el límite
+de ancestros.
+
+Uso:
+    ./mi_benchmark_mempool.py --repeat=20 --shapes=chain,diamond --background=500
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+from collections import defaultdict
+
+# Evitar importaciones wildcard *
+from test_framework.blocktools import COINBASE_MATURITY
+from test_framework.key import ECKey
+from test_framework.messages import CTxOut, COIN
+from test_framework.script_util import key_to_p2wpkh_script
+
+from test_framework.test_framework import BitcoinTestFramework
+from test_framework.util import assert_equal, assert_raises_rpc_error
+
+from cadenas_mempool import (Coin, DEFAULT_ANCESTOR_LIMIT, MempoolGraphBuilder,
+                             check_limits, dependency_order, submit_in_order)
+from estadisticas import summarize
+from fabrica_bloques import BlockFactory
+from firmador_local import LocalSigner
+
+SHAPES = ["chain", "tree", "diamond", "fan_in"]
+# Salidas por transacción de reparto, lejos del límite de peso estándar
+MAX_FANOUT = 2000
+# Ramas de la forma fan_in
+FAN_IN_BRANCHES = 4
+
+
+class MempoolChainsBenchmark(BitcoinTestFramework):
+
+    def set_test_params(self):
+        self.setup_clean_chain = True
+        self.num_nodes = 1
+        self.extra_args = [[]]
+
+    def add_options(self, parser):
+        parser.add_argument("--repeat", dest="repeat", type=int, default=10,
+                            help="Veces que se arma cada forma")
+        parser.add_argument("--depth", dest="depth", type=int, default=DEFAULT_ANCESTOR_LIMIT,
+                            help="Transacciones por cadena, como máximo el límite de ancestros (25)")
+        parser.add_argument("--shapes", dest="shapes", default=",".join(SHAPES),
+                            help="Formas a enviar: {}".format(", ".join(SHAPES)))
+        parser.add_argument("--background", dest="background", type=int, default=0,
+                            help="Transacciones independientes que se envían antes, para empezar con el mempool lleno")
+        parser.add_argument("--bucket", dest="bucket", type=int, default=100,
+                            help="Ancho de los grupos por tamaño del mempool")
+
+    def run_test(self):
+        node = self.nodes[0]
+        depth = self.options.depth
+        shapes = self.options.shapes.split(",")
+        for shape in shapes:
+            assert shape in SHAPES, "forma no soportada: {}".format(shape)
+        assert FAN_IN_BRANCHES + 1 <= depth <= DEFAULT_ANCESTOR_LIMIT, \
+            "la profundidad debe estar entre {} y {}".format(FAN_IN_BRANCHES + 1, DEFAULT_ANCESTOR_LIMIT)
+
+        signer = LocalSigner()
+        key = ECKey()
+        key.generate()
+        script_pubkey = key_to_p2wpkh_script(signer.add_key(key, taproot=False))
+        self.builder = MempoolGraphBuilder(signer, script_pubkey)
+
+        # Una salida confirmada por cada forma, rama de fan_in y transacción
+        # de fondo, más una para la cadena que rebasa el límite
+        roots_per_shape = {"chain": 1, "tree": 1, "diamond": 1, "fan_in": FAN_IN_BRANCHES}
+        num_roots = self.options.repeat * sum(roots_per_shape[s] for s in shapes) + self.options.background + 1
+        num_fanouts = -(-num_roots // MAX_FANOUT)
+
+        self.log.info("Minar {} coinbase maduros y repartirlos en {} salidas".format(num_fanouts, num_roots))
+        factory = BlockFactory(node, script_pubkey=script_pubkey)
+        blocks = factory.mine(COINBASE_MATURITY + num_fanouts)
+        fanouts = []
+        for i, block_hash in enumerate(blocks[:num_fanouts]):
+            coinbase = node.getblock(block_hash, 2)["tx"][0]
+            txout = CTxOut(int(coinbase["vout"][0]["value"] * COIN), script_pubkey)
+            outputs = min(MAX_FANOUT, num_roots - i * MAX_FANOUT)
+            fanouts.append(self.builder.spend([Coin.confirmed(coinbase["txid"], 0, txout)], outputs))
+        for g in fanouts:
+            node.sendrawtransaction(g.tx.serialize().hex())
+        factory.mine_transactions([g.tx for g in fanouts])
+        assert_equal(node.getrawmempool(), [])
+        roots = [Coin.confirmed(c.txid, c.n, c.txout) for g in fanouts for c in g.coins]
+
+        graphs = []
+        if self.options.background:
+            graphs.append(("fondo", [self.builder.spend([roots.pop()]) for _ in range(self.options.background)]))
+        for _ in range(self.options.repeat):
+            for shape in shapes:
+                coins = [roots.pop() for _ in range(roots_per_shape[shape])]
+                graphs.append((shape, self.build_shape(shape, coins, depth)))
+
+        self.log.info("Enviar {} grafos en orden de dependencias".format(len(graphs)))
+        by_ancestors = defaultdict(list)
+        by_mempool = defaultdict(list)
+        by_shape = defaultdict(list)
+        submitted = []
+        for shape, txs in graphs:
+            check_limits(txs)
+            for ancestors, mempool_size, latency in submit_in_order(node, txs, len(submitted)):
+                by_ancestors[ancestors].append(latency)
+                by_mempool[mempool_size // self.options.bucket].append(latency)
+                by_shape[shape].append(latency)
+            submitted += [g.tx for g in dependency_order(txs)]
+        assert_equal(node.getmempoolinfo()["size"], len(submitted))
+
+        self.log.info("Latencia de sendrawtransaction por forma:")
+        self.report(by_shape, "forma", lambda shape: shape)
+        self.log.info("Por número de ancestros (incluyéndose):")
+        self.report(by_ancestors, "ancestros", str)
+        self.log.info("Por tamaño del mempool antes del envío:")
+        bucket = self.options.bucket
+        self.report(by_mempool, "mempool", lambda b: "{}-{}".format(b * bucket, (b + 1) * bucket - 1))
+
+        self.log.info("La transacción {} de una cadena rebasa el límite de ancestros".format(
+            DEFAULT_ANCESTOR_LIMIT + 1))
+        chain = self.builder.chain(roots.pop(), DEFAULT_ANCESTOR_LIMIT + 1)
+        *accepted, rejected = chain
+        submit_in_order(node, accepted)
+        assert_raises_rpc_error(-26, "too-long-mempool-chain", node.sendrawtransaction,
+                                rejected.tx.serialize().hex())
+        submitted += [g.tx for g in accepted]
+
+        self.log.info("Minar las {} transacciones del mempool".format(len(submitted)))
+        factory.mine_transactions(submitted)
+        assert_equal(node.getrawmempool(), [])
+
+    def build_shape(self, shape, coins, depth):
+        if shape == "chain":
+            return self.builder.chain(coins[0], depth)
+        if shape == "tree":
+            # Árbol binario de 2^levels - 1 transacciones, todas
+            # descendientes de la raíz
+            levels = (depth + 1).bit_length() - 1
+            return self.builder.tree(coins[0], 2, levels)
+        if shape == "diamond":
+            return self.builder.diamond(coins[0], depth - 2)
+        # fan_in: la transacción que junta las puntas tiene depth ancestros
+        # contándose a sí misma
+        length = (depth - 1) // FAN_IN_BRANCHES
+        branches = [self.builder.chain(coin, length) for coin in coins]
+        return [g for branch in branches for g in branch] + \
+            self.builder.fan_in([branch[-1].coins[0] for branch in branches])
+
+    def report(self, groups, title, label):
+        self.log.info("{:>10} {:>7} {:>10} {:>10} {:>10}".format(title, "n", "p50", "p99", "max"))
+        for group in sorted(groups):
+            s = summarize(groups[group])
+            self.log.info("{:>10} {:>7} {:8.3f}ms {:8.3f}ms {:8.3f}ms".format(
+                label(group), s["n"], s["p50"] * 1000, s["p99"] * 1000, s["max"] * 1000))
+
+
+if __name__ == '__main__':
+    MempoolChainsBenchmark().main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark de gastos multifirma m-de-n con PSBT (multifirma_psbt.py):
+latencia de la firma en paralelo, de combinar y finalizar, y tamaño en
+vbytes, desde 2-de-3 hasta 15-de-15 para legacy (P2SH), P2WSH y taproot
+(multi_a).
+
+Los cosignatarios son wallets repartidas entre los nodos, cada una firma en
+su propio hilo con su propia conexión RPC.
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+
+# Evitar importaciones wildcard *
+from test_framework.blocktools import COINBASE_MATURITY
+from test_framework.messages import COIN
+
+from test_framework.test_framework import BitcoinTestFramework
+from test_framework.util import assert_equal
+
+from multifirma_psbt import (MULTISIG_TYPES, TAPROOT, MultisigSpender,
+                             multisig_descriptor, wallet_proxy)
+from rpc_lotes import RPCBatch
+
+DEFAULT_CONFIGS = "2-3,3-5,5-7,7-10,10-15,15-15"
+# Monto de cada salida multifirma y tarifa fija del gasto, 10,000 sats
+# cubren el mínimo de 15-de-15 legacy (~1,650 vbytes)
+OUTPUT_AMOUNT = 1
+SPEND_FEE = 10000
+
+
+class MultisigBenchmark(BitcoinTestFramework):
+
+    def set_test_params(self):
+        self.setup_clean_chain = True
+        self.num_nodes = 3
+        # Hasta 15 firmas simultáneas repartidas en 3 nodos
+        self.extra_args = [["-rpcthreads=16"]] * self.num_nodes
+
+    def add_options(self, parser):
+        parser.add_argument("--configs", dest="configs", default=DEFAULT_CONFIGS,
+                            help="Lista de m-n separadas por comas (default: {})".format(DEFAULT_CONFIGS))
+        parser.add_argument("--types", dest="types", default=",".join(MULTISIG_TYPES),
+                            help="Tipos de multifirma: {}".format(", ".join(MULTISIG_TYPES)))
+
+    def skip_test_if_missing_module(self):
+        self.skip_if_no_wallet()
+
+    def run_test(self):
+        node0 = self.nodes[0]
+        configs = [tuple(int(x) for x in c.split("-")) for c in self.options.configs.split(",")]
+        types = self.options.types.split(",")
+        for m, n in configs:
+            assert 1 <= m <= n <= 15, "configuración no soportada: {}-de-{}".format(m, n)
+        if TAPROOT in types and not getattr(self.options, "descriptors", True):
+            # Las wallets legacy no firman entradas taproot
+            self.log.info("Omitir taproot: requiere wallets de descriptores")
+            types.remove(TAPROOT)
+
+        self.generate(node0, COINBASE_MATURITY + 1)
+        max_n = max(n for _, n in configs)
+        self.log.info("Crear {} wallets cosignatarias en {} nodos".format(max_n, self.num_nodes))
+        signers, infos = [], []
+        for i in range(max_n):
+            node = self.nodes[i % self.num_nodes]
+            name = "cosigner{}".format(i)
+            node.createwallet(wallet_name=name)
+            signers.append(wallet_proxy(node, name))
+            batch = RPCBatch(signers[-1])
+            address = batch.getnewaddress()
+            infos.append(batch.getaddressinfo(address.result()).result())
+
+        funder = node0.get_wallet_rpc(self.default_wallet_name)
+        results = []
+        for multisig_type in types:
+            self.log.info("Fondear las salidas {}".format(multisig_type))
+            descriptors = {(m, n): multisig_descriptor(m, infos[:n], multisig_type) for m, n in configs}
+            addresses = {config: node0.deriveaddresses(desc)[0] for config, desc in descriptors.items()}
+            txid = funder.sendmany("", {address: OUTPUT_AMOUNT for address in addresses.values()})
+            funding = funder.gettransaction(txid, True, True)["decoded"]
+            self.generate(node0, 1)
+            vouts = {v["scriptPubKey"]["address"]: v["n"] for v in funding["vout"]}
+
+            for m, n in configs:
+                # Solo se necesitan m firmas, firman los primeros m cosignatarios
+                spender = MultisigSpender(node0, signers[:m], funder=funder)
+                return_addr = funder.getnewaddress()
+                amount = (OUTPUT_AMOUNT * COIN - SPEND_FEE) / COIN
+                spend = spender.spend(descriptors[(m, n)],
+                                      {"txid": txid, "vout": vouts[addresses[(m, n)]]},
+                                      {return_addr: amount})
+                vsize = node0.decoderawtransaction(spend["hex"])["vsize"]
+                results.append((multisig_type, m, n, spend["timings"], vsize))
+            self.generate(node0, 1)
+            assert_equal(node0.getrawmempool(), [])
+
+        self.log.info("Resultados:")
+        self.log.info("{:8} {:>6} {:>9} {:>9} {:>9} {:>9} {:>7}".format(
+            "tipo", "m-n", "crear", "firmar", "combinar", "finalizar", "vbytes"))
+        for multisig_type, m, n, timings, vsize in results:
+            self.log.info("{:8} {:>6} {:8.3f}s {:8.3f}s {:8.3f}s {:8.3f}s {:7}".format(
+                multisig_type, "{}-{}".format(m, n), timings["create"], timings["sign"],
+                timings["combine"], timings["finalize"], vsize))
+
+
+if __name__ == '__main__':
+    MultisigBenchmark().main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark del parser sobre memoryview (parser_streaming.py) contra
+CBlock.deserialize del framework, en bloques sintéticos de miles de
+transacciones legacy y segwit.
+
+Se miden dos recorridos: solo leer el bloque, y leerlo sumando los montos de
+todas las salidas y calculando todos los txid. No necesita nodos, solo las
+librerías del framework.
+
+Uso:
+    ./mi_benchmark_parser.py --txs 5000 10000
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import random
+from io import BytesIO
+
+# Evitar importaciones wildcard *
+from test_framework.messages import (CBlock, CTransaction, CTxIn,
+                                     CTxInWitness, CTxOut, COutPoint)
+from test_framework.script_util import key_to_p2wpkh_script, keyhash_to_p2pkh_script
+
+from estadisticas import timed
+from parser_streaming import BlockView
+
+
+def build_block(num_txs, rng):
+    """Bloque con transacciones de 1 a 3 entradas y 1 a 3 salidas, la
+    mitad segwit (P2WPKH con testigo) y la mitad legacy (P2PKH)"""
+    block = CBlock()
+    block.hashPrevBlock = rng.getrandbits(256)
+    block.nBits = 0x207fffff
+    for t in range(num_txs):
+        tx = CTransaction()
+        segwit = t % 2 == 0
+        for _ in range(rng.randint(1, 3)):
+            script_sig = b"" if segwit else rng.randbytes(107)
+            tx.vin.append(CTxIn(COutPoint(rng.getrandbits(256), rng.randrange(4)), script_sig))
+            if segwit:
+                witness = CTxInWitness()
+                witness.scriptWitness.stack = [rng.randbytes(72), rng.randbytes(33)]
+                tx.wit.vtxinwit.append(witness)
+        for _ in range(rng.randint(1, 3)):
+            script = key_to_p2wpkh_script(rng.randbytes(33)) if segwit else keyhash_to_p2pkh_script(rng.randbytes(20))
+            tx.vout.append(CTxOut(rng.randrange(1, 10**8), script))
+        block.vtx.append(tx)
+    return block.serialize()
+
+
+def framework_parse(data, analyze):
+    block = CBlock()
+    block.deserialize(BytesIO(data))
+    if not analyze:
+        return None
+    total = 0
+    txids = []
+    for tx in block.vtx:
+        total += sum(out.nValue for out in tx.vout)
+        tx.calc_sha256()
+        txids.append(tx.hash)
+    return total, txids
+
+
+def streaming_parse(data, analyze):
+    block = BlockView(data)
+    if not analyze:
+        for _ in block.transactions():
+            pass
+        return None
+    total = 0
+    txids = []
+    for tx in block.transactions():
+        total += sum(out.value for out in tx.outputs)
+        txids.append(tx.txid)
+    return total, txids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--txs", type=int, nargs="+", default=[5000, 10000],
+                        help="Número de transacciones de cada bloque")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print("{:>8} {:>10} {:>18} {:>18} {:>10}".format(
+        "txs", "MB", "framework (s)", "memoryview (s)", "aceler."))
+    for num_txs in args.txs:
+        data = build_block(num_txs, rng)
+        # Ambos recorridos deben dar los mismos montos y txids
+        expected, _ = timed(framework_parse, data, True)
+        assert streaming_parse(data, True) == expected
+
+        for label, analyze in [("leer", False), ("leer+txids", True)]:
+            _, naive = timed(framework_parse, data, analyze)
+            _, stream = timed(streaming_parse, data, analyze)
+            print("{:>8} {:>10.2f} {:>18.4f} {:>18.4f} {:>9.1f}x  {}".format(
+                num_txs, len(data) / 1e6, naive, stream, naive / stream, label))
+
+
+if __name__ == '__main__':
+    main()
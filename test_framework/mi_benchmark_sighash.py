@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark del sighash BIP143 con caché (sighash_bip143.py) contra
+SegwitV0SignatureHash del framework, calculando el sighash de todas las
+entradas de transacciones cada vez más grandes.
+
+Con la caché el tiempo por entrada se mantiene constante (escala lineal con
+el número de entradas), mientras que sin ella crece con el tamaño de la
+transacción (escala cuadrática). No necesita nodos, solo las librerías del
+framework.
+
+Uso:
+    ./mi_benchmark_sighash.py --sizes 10 100 500 1000
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import random
+import time
+
+# Evitar importaciones wildcard *
+from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint
+from test_framework.script import SegwitV0SignatureHash, SIGHASH_ALL
+from test_framework.script_util import keyhash_to_p2pkh_script, key_to_p2wpkh_script
+
+from sighash_bip143 import SIGHASH_FLAGS, SegwitV0Sighash
+
+
+def build_tx(num_inputs, rng):
+    tx = CTransaction()
+    tx.vin = [CTxIn(COutPoint(rng.getrandbits(256), rng.randrange(4)), nSequence=0xfffffffd)
+              for _ in range(num_inputs)]
+    tx.vout = [CTxOut(10000 + i, key_to_p2wpkh_script(rng.randbytes(33))) for i in range(num_inputs)]
+    return tx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200, 500, 1000],
+                        help="Número de entradas de cada transacción")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    script_code = keyhash_to_p2pkh_script(bytes(20))
+    amount = 50000
+
+    # Primero comprobar que ambos cálculos coinciden en las seis banderas
+    tx = build_tx(8, rng)
+    cache = SegwitV0Sighash(tx)
+    for i in range(len(tx.vin)):
+        for hashtype in SIGHASH_FLAGS:
+            assert cache.sighash(i, script_code, amount, hashtype) == \
+                SegwitV0SignatureHash(script_code, tx, i, hashtype, amount)
+
+    print("{:>8} {:>14} {:>14} {:>16} {:>16} {:>10}".format(
+        "entradas", "framework (s)", "caché (s)", "framework/entr.", "caché/entr.", "aceler."))
+    for size in args.sizes:
+        tx = build_tx(size, rng)
+
+        start = time.perf_counter()
+        for i in range(size):
+            SegwitV0SignatureHash(script_code, tx, i, SIGHASH_ALL, amount)
+        naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cache = SegwitV0Sighash(tx)
+        for i in range(size):
+            cache.sighash(i, script_code, amount, SIGHASH_ALL)
+        cached = time.perf_counter() - start
+
+        print("{:>8} {:>14.4f} {:>14.4f} {:>14.1f}us {:>14.1f}us {:>9.1f}x".format(
+            size, naive, cached, naive / size * 1e6, cached / size * 1e6, naive / cached))
+
+
+if __name__ == '__main__':
+    main()
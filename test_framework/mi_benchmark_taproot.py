@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark de la firma local taproot por el key path (firmador_local.py y
+sighash_bip341.py) contra signrawtransactionwithwallet, con transacciones de
+muchas entradas P2TR.
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import time
+
+# Evitar importaciones wildcard *
+from test_framework.address import hash160, key_to_p2pkh
+from test_framework.blocktools import COINBASE_MATURITY
+from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint, COIN
+from test_framework.script_util import keyhash_to_p2pkh_script
+
+from test_framework.test_framework import BitcoinTestFramework
+from test_framework.util import assert_equal
+from test_framework.descriptors import descsum_create
+from test_framework.key import ECKey
+from test_framework.wallet_util import bytes_to_wif
+
+from firmador_local import LocalSigner, p2tr_script, taproot_tweak_keypair
+from pool_llaves import KeyPool
+
+# Tarifa de los gastos en sat/vB, con margen sobre el mínimo de 1 sat/vB
+FEE_RATE = 2
+# Tarifa del reparto en sat/vB, calculada sobre un tamaño estimado por salida
+FANOUT_FEE_RATE = 10
+FANOUT_BYTES_PER_OUTPUT = 60
+
+
+class TaprootSigningBenchmark(BitcoinTestFramework):
+
+    def set_test_params(self):
+        self.setup_clean_chain = True
+        self.num_nodes = 1
+        self.extra_args = [[]]
+
+    def add_options(self, parser):
+        parser.add_argument("--txs", dest="txs", type=int, default=10,
+                            help="Número de transacciones a firmar")
+        parser.add_argument("--inputs", dest="inputs", type=int, default=50,
+                            help="Entradas P2TR por transacción")
+
+    def skip_test_if_missing_module(self):
+        self.skip_if_no_wallet()
+
+    def run_test(self):
+        node = self.nodes[0]
+        num_txs, num_inputs = self.options.txs, self.options.inputs
+        num_outputs = num_txs * num_inputs
+        assert num_outputs <= 2000, "máximo 2000 salidas en total (txs * inputs)"
+
+        self.log.info("Generar {} llaves internas y sus salidas P2TR".format(num_outputs))
+        signer = LocalSigner()
+        funding_key = ECKey()
+        funding_key.generate()
+        funding_pubkey = signer.add_key(funding_key, taproot=False)
+        keys, scripts = [], []
+        # Los pares de llaves salen de procesos de fondo con la tabla de base
+        # fija de pool_llaves.py
+        with KeyPool() as pool:
+            for key, pubkey in pool.take(num_outputs):
+                signer.add_key(key, pubkey=pubkey)
+                keys.append(key)
+                scripts.append(p2tr_script(taproot_tweak_keypair(key.get_bytes())[1]))
+
+        self.log.info("Minar a una llave local y repartir el coinbase en las salidas P2TR")
+        blocks = self.generatetoaddress(node, COINBASE_MATURITY + 1, key_to_p2pkh(funding_pubkey, main=False))
+        coinbase = node.getblock(blocks[0], 2)["tx"][0]
+        coinbase_out = CTxOut(int(coinbase["vout"][0]["value"] * COIN),
+                              keyhash_to_p2pkh_script(hash160(funding_pubkey)))
+        fanout_fee = FANOUT_FEE_RATE * FANOUT_BYTES_PER_OUTPUT * (num_outputs + 2)
+        value = (coinbase_out.nValue - fanout_fee) // num_outputs
+        fanout = CTransaction()
+        fanout.vin = [CTxIn(COutPoint(int(coinbase["txid"], 16), 0))]
+        fanout.vout = [CTxOut(value, script) for script in scripts]
+        signer.sign_tx(fanout, [coinbase_out])
+        node.sendrawtransaction(fanout.serialize().hex())
+        self.generate(node, 1)
+
+        self.log.info("Importar las llaves como descriptores tr() en una wallet para el camino RPC")
+        node.createwallet(wallet_name="bench", descriptors=True, blank=True)
+        wallet = node.get_wallet_rpc("bench")
+        res = wallet.importdescriptors([{"desc": descsum_create("tr({})".format(bytes_to_wif(key.get_bytes()))),
+                                         "timestamp": "now"} for key in keys])
+        assert all(r["success"] for r in res)
+
+        def build_spends(fee):
+            txs, spent = [], []
+            for t in range(num_txs):
+                indexes = range(t * num_inputs, (t + 1) * num_inputs)
+                tx = CTransaction()
+                tx.vin = [CTxIn(COutPoint(fanout.sha256, i)) for i in indexes]
+                tx.vout = [CTxOut(value * num_inputs - fee, scripts[t * num_inputs])]
+                txs.append(tx)
+                spent.append([fanout.vout[i] for i in indexes])
+            return txs, spent
+
+        # Todos los gastos tienen la misma forma, la tarifa se calcula con el
+        # tamaño de uno de prueba
+        probe, probe_spent = build_spends(0)
+        signer.sign_batch(probe[:1], probe_spent[:1])
+        fee = probe[0].get_vsize() * FEE_RATE
+
+        self.log.info("Firma por RPC: signrawtransactionwithwallet por transacción")
+        txs, _ = build_spends(fee)
+        start = time.perf_counter()
+        rpc_signed = [wallet.signrawtransactionwithwallet(tx.serialize().hex())["hex"] for tx in txs]
+        rpc_time = time.perf_counter() - start
+
+        self.log.info("Firma local: sighash BIP341 compartido y Schnorr en una pasada")
+        txs, spent = build_spends(fee)
+        start = time.perf_counter()
+        signer.sign_batch(txs, spent)
+        local_time = time.perf_counter() - start
+
+        for tx_hex in [rpc_signed[0], txs[0].serialize().hex()]:
+            assert_equal(node.testmempoolaccept([tx_hex])[0]["allowed"], True)
+
+        total_inputs = num_txs * num_inputs
+        self.log.info("Resultados ({} tx de {} entradas P2TR):".format(num_txs, num_inputs))
+        self.log.info("RPC:   {:8.3f}s  {:8.1f} entradas/s".format(rpc_time, total_inputs / rpc_time))
+        self.log.info("Local: {:8.3f}s  {:8.1f} entradas/s".format(local_time, total_inputs / local_time))
+        self.log.info("Aceleración: {:.2f}x".format(rpc_time / local_time))
+
+
+if __name__ == '__main__':
+    TaprootSigningBenchmark().main()
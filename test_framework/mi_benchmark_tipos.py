@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark comparativo de los tipos de salida de los ejemplos: P2PK,
+P2PKH, P2SH (de una llave), multifirma 2-de-3 en P2SH y P2TR (key path).
+
+Para cada tipo se crean --outputs salidas con una transacción de reparto y
+después se gasta cada una en su propia transacción. Se reporta el tamaño en
+vbytes y la tarifa del gasto, y el tiempo (p50) de construirlo, firmarlo
+(firmador_local.py) y verificarlo (verificador_script.py) en el proceso y de
+que el nodo lo acepte con sendrawtransaction.
+
+Los resultados se guardan en --baseline (JSON). Si el archivo ya existe la
+ejecución se compara contra él y falla si el tamaño o la tarifa de algún
+gasto crecieron; en ese caso la línea base no se sobreescribe salvo con
+--update-baseline. Los tiempos son de microsegundos y varían entre
+ejecuciones, así que solo se reportan como advertencia cuando crecen más que
+--tolerance y más que TIME_FLOOR.
+
+Uso:
+    ./mi_benchmark_tipos.py --outputs=500 --baseline=base_tipos.json
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import json
+import os
+import time
+
+# Evitar importaciones wildcard *
+from test_framework.address import hash160
+from test_framework.blocktools import COINBASE_MATURITY
+from test_framework.key import ECKey
+from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint, COIN
+from test_framework.script import CScript, OP_2, OP_3, OP_CHECKMULTISIG
+from test_framework.script_util import key_to_p2pk_script, keyhash_to_p2pkh_script
+
+from test_framework.test_framework import BitcoinTestFramework
+from test_framework.util import assert_equal
+
+from estadisticas import summarize
+from fabrica_bloques import BlockFactory
+from firmador_local import LocalSigner, p2tr_script, taproot_tweak_keypair
+from pool_llaves import KeyPool
+from verificador_script import ScriptVerifier
+
+TYPES = ["p2pk", "p2pkh", "p2sh", "multisig", "p2tr"]
+# Tarifa de los gastos en sat/vB, con margen sobre el mínimo de 1 sat/vB
+# porque el tamaño de las firmas ECDSA varía en un byte
+FEE_RATE = 2
+# Tarifa del reparto en sat/vB, calculada sobre un tamaño estimado por salida
+FANOUT_FEE_RATE = 10
+FANOUT_BYTES_PER_OUTPUT = 60
+# Métricas que se comparan contra la línea base. Las de tamaño fallan con
+# SIZE_TOLERANCE; las de tiempo solo se advierten si crecen más que
+# --tolerance y además más de TIME_FLOOR segundos
+TIME_METRICS = ["build", "sign", "verify", "accept"]
+SIZE_METRICS = ["vbytes", "fee"]
+SIZE_TOLERANCE = 0.01
+TIME_FLOOR = 0.001
+
+
+def find_regressions(baseline, results, metrics, tolerance, floor=0):
+    """Lista de (tipo, métrica, antes, ahora) de las métricas que crecieron
+    más que tolerance (relativo) y más que floor (absoluto) respecto a la
+    línea base. Los tipos que no están en ambas se ignoran."""
+    regressions = []
+    for kind, current in results.items():
+        previous = baseline.get(kind)
+        if previous is None:
+            continue
+        for metric in metrics:
+            before, now = previous[metric], current[metric]
+            if before > 0 and now > before * (1 + tolerance) and now - before > floor:
+                regressions.append((kind, metric, before, now))
+    return regressions
+
+
+class OutputTypesBenchmark(BitcoinTestFramework):
+
+    def set_test_params(self):
+        self.setup_clean_chain = True
+        self.num_nodes = 1
+        self.extra_args = [[]]
+
+    def add_options(self, parser):
+        parser.add_argument("--outputs", dest="outputs", type=int, default=200,
+                            help="Número de salidas a crear y gastar por tipo")
+        parser.add_argument("--types", dest="types", default=",".join(TYPES),
+                            help="Tipos a comparar: {}".format(", ".join(TYPES)))
+        parser.add_argument("--baseline", dest="baseline", default="baseline_tipos.json",
+                            help="Archivo JSON con la línea base (default: baseline_tipos.json)")
+        parser.add_argument("--tolerance", dest="tolerance", type=float, default=1.0,
+                            help="Aumento relativo de los tiempos p50 que se advierte (no falla)")
+        parser.add_argument("--update-baseline", dest="update_baseline", default=False, action="store_true",
+                            help="Guardar los resultados como línea base aunque haya regresiones")
+        parser.add_argument("--keypool", dest="keypool", default=None,
+                            help="Archivo del pool de llaves, para que las siguientes ejecuciones no las generen")
+
+    def run_test(self):
+        node = self.nodes[0]
+        num_outputs = self.options.outputs
+        types = self.options.types.split(",")
+        for kind in types:
+            assert kind in TYPES, "tipo no soportado: {}".format(kind)
+        # Una transacción estándar no puede pesar más de 400,000 WU
+        assert 1 <= num_outputs <= 2000, "entre 1 y 2000 salidas por tipo"
+
+        self.signer = LocalSigner()
+        # Cada gasto es nuevo, sin caché para medir la verificación completa
+        self.verifier = ScriptVerifier(sig_cache_size=0, script_cache_size=0)
+        funding_key = ECKey()
+        funding_key.generate()
+        funding_pubkey = self.signer.add_key(funding_key, taproot=False)
+        self.funding_script = keyhash_to_p2pkh_script(hash160(funding_pubkey))
+
+        self.log.info("Minar un coinbase maduro por tipo a una llave local")
+        self.factory = BlockFactory(node, script_pubkey=self.funding_script)
+        blocks = self.factory.mine(COINBASE_MATURITY + len(types))
+
+        results = {}
+        # Las llaves de las salidas salen de un pool que las genera en
+        # procesos de fondo mientras se mide cada tipo
+        with KeyPool(self.options.keypool) as self.keys:
+            for kind, block_hash in zip(types, blocks):
+                coinbase = node.getblock(block_hash, 2)["tx"][0]
+                results[kind] = self.run_type(kind, coinbase, num_outputs)
+
+        self.log.info("Resultados ({} salidas por tipo, tiempos p50):".format(num_outputs))
+        self.log.info("{:9} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10}".format(
+            "tipo", "salida", "vbytes", "tarifa", "construir", "firmar", "verificar", "aceptar"))
+        for kind, r in results.items():
+            self.log.info("{:9} {:>7}B {:>8} {:>8} {:8.3f}ms {:8.3f}ms {:8.3f}ms {:8.3f}ms".format(
+                kind, r["output_bytes"], r["vbytes"], r["fee"], r["build"] * 1000,
+                r["sign"] * 1000, r["verify"] * 1000, r["accept"] * 1000))
+
+        self.check_baseline(results)
+
+    def new_output(self, kind):
+        """Llaves nuevas registradas en el firmador y el scriptPubKey del tipo"""
+        key, pubkey = self.keys.get()
+        if kind == "p2tr":
+            self.signer.add_key(key, pubkey=pubkey)
+            return p2tr_script(taproot_tweak_keypair(key.get_bytes())[1])
+        self.signer.add_key(key, taproot=False, pubkey=pubkey)
+        if kind == "p2pk":
+            return key_to_p2pk_script(pubkey)
+        if kind == "p2pkh":
+            return keyhash_to_p2pkh_script(hash160(pubkey))
+        if kind == "p2sh":
+            return self.signer.add_p2sh(key_to_p2pk_script(pubkey), [key])
+        # multisig 2-de-3, firman las dos primeras llaves
+        keys, pubkeys = zip((key, pubkey), *self.keys.take(2))
+        return self.signer.add_p2sh(CScript([OP_2, *pubkeys, OP_3, OP_CHECKMULTISIG]), keys[:2])
+
+    def spend(self, fanout, n, fee):
+        tx = CTransaction()
+        tx.vin = [CTxIn(COutPoint(fanout.sha256, n))]
+        tx.vout = [CTxOut(fanout.vout[n].nValue - fee, self.funding_script)]
+        return tx
+
+    def run_type(self, kind, coinbase, num_outputs):
+        node = self.nodes[0]
+        self.log.info("{}: crear {} salidas".format(kind, num_outputs))
+        scripts = [self.new_output(kind) for _ in range(num_outputs)]
+        coinbase_out = CTxOut(int(coinbase["vout"][0]["value"] * COIN), self.funding_script)
+        fanout_fee = FANOUT_FEE_RATE * FANOUT_BYTES_PER_OUTPUT * (num_outputs + 2)
+        value = (coinbase_out.nValue - fanout_fee) // num_outputs
+        fanout = CTransaction()
+        fanout.vin = [CTxIn(COutPoint(int(coinbase["txid"], 16), 0))]
+        fanout.vout = [CTxOut(value, script) for script in scripts]
+        self.signer.sign_tx(fanout, [coinbase_out])
+        node.sendrawtransaction(fanout.serialize().hex())
+        self.factory.mine_transactions([fanout])
+
+        # Todos los gastos tienen la misma forma, la tarifa se calcula con el
+        # tamaño de uno de prueba
+        probe = self.spend(fanout, 0, 0)
+        self.signer.sign_tx(probe, [fanout.vout[0]])
+        fee = probe.get_vsize() * FEE_RATE
+
+        self.log.info("{}: construir, firmar, verificar y enviar {} gastos".format(kind, num_outputs))
+        times = {metric: [] for metric in TIME_METRICS}
+        spends, vsizes = [], []
+        for n in range(num_outputs):
+            t0 = time.perf_counter()
+            tx = self.spend(fanout, n, fee)
+            spent = [fanout.vout[n]]
+            t1 = time.perf_counter()
+            self.signer.sign_tx(tx, spent)
+            t2 = time.perf_counter()
+            self.verifier.check_tx(tx, spent)
+            t3 = time.perf_counter()
+            node.sendrawtransaction(tx.serialize().hex())
+            t4 = time.perf_counter()
+            for metric, elapsed in zip(TIME_METRICS, [t1 - t0, t2 - t1, t3 - t2, t4 - t3]):
+                times[metric].append(elapsed)
+            spends.append(tx)
+            vsizes.append(tx.get_vsize())
+        self.factory.mine_transactions(spends)
+        assert_equal(node.getrawmempool(), [])
+
+        result = {
+            "output_bytes": len(fanout.vout[0].serialize()),
+            "vbytes": max(vsizes),
+            "fee": fee,
+        }
+        for metric, values in times.items():
+            result[metric] = summarize(values)["p50"]
+            result[metric + "_summary"] = summarize(values)
+        return result
+
+    def check_baseline(self, results):
+        path = self.options.baseline
+        regressions, drift = [], []
+        if os.path.exists(path):
+            with open(path, encoding="utf8") as f:
+                baseline = json.load(f)
+            if baseline["outputs"] != self.options.outputs:
+                self.log.info("La línea base {} es de {} salidas, no se compara".format(
+                    path, baseline["outputs"]))
+            else:
+                regressions = find_regressions(baseline["results"], results, SIZE_METRICS, SIZE_TOLERANCE)
+                drift = find_regressions(baseline["results"], results, TIME_METRICS,
+                                         self.options.tolerance, TIME_FLOOR)
+                for kind, metric, before, now in regressions:
+                    self.log.warning("Regresión {} {}: {:.6g} -> {:.6g} ({:+.1f}%)".format(
+                        kind, metric, before, now, (now / before - 1) * 100))
+                for kind, metric, before, now in drift:
+                    self.log.warning("Tiempo {} {} más lento: {:.3f}ms -> {:.3f}ms ({:+.1f}%)".format(
+                        kind, metric, before * 1000, now * 1000, (now / before - 1) * 100))
+                if not regressions and not drift:
+                    self.log.info("Sin regresiones respecto a {}".format(path))
+
+        # Con tiempos más lentos no falla, pero se conserva la línea base
+        if (not regressions and not drift) or self.options.update_baseline:
+            with open(path, "w", encoding="utf8") as f:
+                json.dump({"outputs": self.options.outputs, "results": results}, f, indent=2)
+            self.log.info("Línea base guardada en {}".format(path))
+        assert not regressions or self.options.update_baseline, \
+            "{} regresiones respecto a {}".format(len(regressions), path)
+
+
+if __name__ == '__main__':
+    OutputTypesBenchmark().main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark de la propagación de transacciones y bloques en una red de
+varios nodos (topologia.py).
+
+Arranca --nodes nodos conectados en línea, anillo, estrella o al azar,
+inyecta transacciones con sendrawtransaction y bloques con submitblock en
+los nodos de --sources (por turnos) y mide cuánto tarda cada nodo en
+anunciarlos. Reporta la latencia y un histograma por número de saltos desde
+el nodo de origen, para ver cómo cambia el relay al crecer la red.
+
+Uso:
+    ./mi_benchmark_topologia.py --nodes=8 --topology=ring --txs=50 --blocks=10
+    ./mi_benchmark_topologia.py --nodes=12 --topology=random --degree=3 --sources=0,5 --json=red.json
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import json
+import time
+
+# Evitar importaciones wildcard *
+from test_framework.blocktools import COINBASE_MATURITY
+from test_framework.key import ECKey
+from test_framework.messages import CTxOut, COIN
+from test_framework.script_util import key_to_p2wpkh_script
+
+from test_framework.test_framework import BitcoinTestFramework
+from test_framework.util import assert_equal
+
+from cadenas_mempool import Coin, MempoolGraphBuilder
+from estadisticas import format_histogram, summarize
+from fabrica_bloques import BlockFactory
+from firmador_local import LocalSigner
+from notificador_p2p import WHITELIST_ARG
+from topologia import SHAPES, PropagationTracker, edges
+
+KINDS = {"tx": "transacciones", "block": "bloques"}
+
+
+class TopologyBenchmark(BitcoinTestFramework):
+
+    def set_test_params(self):
+        self.setup_clean_chain = True
+        # Las opciones ya están leídas cuando se llama este método
+        self.num_nodes = self.options.nodes
+        self.extra_args = [[WHITELIST_ARG] for _ in range(self.num_nodes)]
+        self.edges = edges(self.options.topology, self.num_nodes, self.options.degree, self.options.seed)
+
+    def add_options(self, parser):
+        parser.add_argument("--nodes", dest="nodes", type=int, default=6,
+                            help="Número de nodos de la red")
+        parser.add_argument("--topology", dest="topology", default="line",
+                            help="Forma de la red: {}".format(", ".join(SHAPES)))
+        parser.add_argument("--degree", dest="degree", type=int, default=3,
+                            help="Grado promedio de la topología random")
+        parser.add_argument("--seed", dest="seed", type=int, default=0,
+                            help="Semilla de la topología random")
+        parser.add_argument("--sources", dest="sources", default="0",
+                            help="Nodos donde se inyecta, separados por comas, se usan por turnos")
+        parser.add_argument("--txs", dest="txs", type=int, default=20,
+                            help="Transacciones a inyectar")
+        parser.add_argument("--blocks", dest="blocks", type=int, default=5,
+                            help="Bloques a inyectar, incluyen las transacciones inyectadas")
+        parser.add_argument("--json", dest="json", default=None,
+                            help="Archivo donde guardar las latencias por número de saltos")
+
+    def setup_network(self):
+        self.setup_nodes()
+        for a, b in self.edges:
+            self.connect_nodes(a, b)
+        self.sync_all()
+
+    def run_test(self):
+        sources = [int(s) for s in self.options.sources.split(",")]
+        for source in sources:
+            assert 0 <= source < self.num_nodes, "nodo de origen inválido: {}".format(source)
+        assert self.options.blocks >= 1, "hace falta al menos un bloque para confirmar las transacciones"
+        # Las salidas salen de una sola transacción de reparto
+        assert self.options.txs <= 2000, "como máximo 2000 transacciones"
+        self.log.info("Topología {} de {} nodos: {}".format(self.options.topology, self.num_nodes, self.edges))
+
+        signer = LocalSigner()
+        key = ECKey()
+        key.generate()
+        self.script_pubkey = key_to_p2wpkh_script(signer.add_key(key, taproot=False))
+        builder = MempoolGraphBuilder(signer, self.script_pubkey)
+
+        self.log.info("Preparar una salida confirmada por transacción a inyectar")
+        factory = BlockFactory(self.nodes[0], script_pubkey=self.script_pubkey)
+        block_hash = factory.mine(COINBASE_MATURITY + 1, sync_fun=self.sync_all)[0]
+        coinbase = self.nodes[0].getblock(block_hash, 2)["tx"][0]
+        txout = CTxOut(int(coinbase["vout"][0]["value"] * COIN), self.script_pubkey)
+        fanout = builder.spend([Coin.confirmed(coinbase["txid"], 0, txout)], max(1, self.options.txs))
+        self.nodes[0].sendrawtransaction(fanout.tx.serialize().hex())
+        factory.mine_transactions([fanout.tx], sync_fun=self.sync_all)
+        roots = [Coin.confirmed(c.txid, c.n, c.txout) for c in fanout.coins]
+
+        tracker = PropagationTracker(self.nodes, self.edges)
+
+        self.log.info("Inyectar {} transacciones".format(self.options.txs))
+        txs = []
+        for i in range(self.options.txs):
+            source = sources[i % len(sources)]
+            tx = builder.spend([roots[i]]).tx
+            tx_hex = tx.serialize().hex()
+            start = time.perf_counter()
+            self.nodes[source].sendrawtransaction(tx_hex)
+            # Los pares con wtxidrelay anuncian por wtxid
+            tracker.record("tx", source, [tx.calc_sha256(True), tx.sha256], start)
+            txs.append(tx)
+
+        self.log.info("Inyectar {} bloques".format(self.options.blocks))
+        for i in range(self.options.blocks):
+            source = sources[i % len(sources)]
+            # Las transacciones ya están en el mempool de todos los nodos, se
+            # reparten entre los bloques
+            block = BlockFactory(self.nodes[source], script_pubkey=self.script_pubkey).create_block(
+                txs[i::self.options.blocks])
+            block_hex = block.serialize().hex()
+            start = time.perf_counter()
+            assert_equal(self.nodes[source].submitblock(block_hex), None)
+            tracker.record("block", source, [block.sha256], start)
+        self.sync_all()
+        for node in self.nodes:
+            assert_equal(node.getrawmempool(), [])
+
+        self.report(tracker.samples)
+
+    def report(self, samples):
+        results = {}
+        for kind, title in KINDS.items():
+            by_hops = samples.get(kind, {})
+            results[kind] = {hops: summarize(by_hops[hops]) for hops in sorted(by_hops)}
+            self.log.info("Latencia de propagación de {} por número de saltos:".format(title))
+            for hops, s in results[kind].items():
+                self.log.info("{} saltos: n={} p50={:.1f}ms p99={:.1f}ms max={:.1f}ms".format(
+                    hops, s["n"], s["p50"] * 1000, s["p99"] * 1000, s["max"] * 1000))
+                for line in format_histogram(by_hops[hops]):
+                    self.log.info("    " + line)
+        if self.options.json:
+            with open(self.options.json, "w", encoding="utf8") as f:
+                json.dump({
+                    "topology": self.options.topology,
+                    "nodes": self.num_nodes,
+                    "edges": self.edges,
+                    "samples": {kind: dict(by_hops) for kind, by_hops in samples.items()},
+                    "summary": results,
+                }, f, indent=2)
+            self.log.info("Latencias guardadas en {}".format(self.options.json))
+
+
+if __name__ == '__main__':
+    TopologyBenchmark().main()
@@ -17,8 +17,16 @@ from test_framework.blocktools import COINBASE_MATURITY
 from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import assert_equal
 
+from fabrica_bloques import BlockFactory
+from indice_utxos import UTXOIndex
+from instrumentacion import TimingMixin
+from multifirma_psbt import LEGACY, MultisigSpender, multisig_descriptor, wallet_proxy
+from pool_nodos import NodePoolMixin
+from rpc_lotes import RPCBatch, collect_pubkeys
+from snapshot_cadena import SnapshotMixin
+
 # Mi clase de prueba hereda de BitcoinTestFramework
-class ExampleTest(BitcoinTestFramework):
+class ExampleTest(TimingMixin, NodePoolMixin, SnapshotMixin, BitcoinTestFramework):
 
     def set_test_params(self):
         """Este método debe ser sobrescrito para setear los parámetros de la
@@ -36,8 +44,16 @@ class ExampleTest(BitcoinTestFramework):
     def run_test(self):
         """Main test logic"""
         self.log.info("Prueba iniciando!")
-        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")        
-        blocks = self.generate(self.nodes[0], COINBASE_MATURITY + 1)
+        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")
+        # La primera vez se minan y se guardan en un snapshot, las siguientes
+        # ejecuciones restauran la cadena del disco sin minar
+        with self.phase("minar"):
+            blocks = self.prepare_chain(
+                lambda: BlockFactory(self.nodes[0]).mine(COINBASE_MATURITY + 1, sync_fun=self.sync_all))
+
+        # Un solo índice de UTXOs para toda la prueba: se sincroniza una vez
+        # y después sigue los bloques nuevos por P2P
+        self.utxo_listener = UTXOIndex().follow(self.nodes[0])
 
         # Después de generar 101 bloques  hay un UTXO del bloque 1 por 50BTC
         utxos = self.nodes[0].listunspent()
@@ -45,60 +61,94 @@ class ExampleTest(BitcoinTestFramework):
         assert_equal(utxos[0]["amount"], 50) 
 
         node0, node1, node2 = self.nodes
-        publicK0 = node0.getaddressinfo(node0.getnewaddress())['pubkey']
-        publicK1 = node1.getaddressinfo(node1.getnewaddress())['pubkey']
-        publicK2 = node2.getaddressinfo(node2.getnewaddress())['pubkey']
-        keys=[publicK0, publicK1, publicK2]
-        # Crear la transacción multifirma con 2 de las 3 llaves (2/3)
-        multi_sig = node0.createmultisig(2, keys, 'legacy')
-        # obtener la dirección de destino
-        destination_addr = multi_sig['address']
-        # obtener el descritor para las verificaciones
-        descriptor = multi_sig['descriptor']
-        target_address = self.nodes[0].deriveaddresses(descriptor)
-        assert_equal(target_address[0], destination_addr)
-        self.log.info("Destination Address: {}".format(destination_addr))
-
-        txid = node0.sendtoaddress(destination_addr, 40)
-        tx = node0.getrawtransaction(txid, True)
-        self.log.info("Transacción Decodificada: {}".format(tx))
+        # Recolectar una llave de cada nodo: getnewaddress y getaddressinfo
+        # en lotes, atendiendo a los 3 nodos en paralelo
+        with self.phase("derivar"):
+            infos, stats = collect_pubkeys(self.nodes)
+            self.log.info("Llaves recolectadas: {} llamadas en {} peticiones HTTP ({} ahorradas), {} etapas secuenciales".format(
+                stats["calls"], stats["round_trips"], stats["saved_round_trips"], stats["sequential_stages"]))
+            keys = [info[0]['pubkey'] for info in infos]
+            # Crear la transacción multifirma con 2 de las 3 llaves (2/3)
+            multi_sig = node0.createmultisig(2, keys, 'legacy')
+            # obtener la dirección de destino
+            destination_addr = multi_sig['address']
+            # obtener el descritor para las verificaciones
+            descriptor = multi_sig['descriptor']
+            target_address = self.nodes[0].deriveaddresses(descriptor)
+            assert_equal(target_address[0], destination_addr)
+            self.log.info("Destination Address: {}".format(destination_addr))
+
+        with self.phase("enviar"):
+            txid = node0.sendtoaddress(destination_addr, 40)
+            # Las siguientes consultas son independientes, van en un solo lote
+            batch = RPCBatch(node0)
+            tx = batch.getrawtransaction(txid, True)
+            mempool = batch.getrawmempool()
+            tx = tx.result()
+            self.log.info("Transacción Decodificada: {}".format(tx))
         
-        # buscar la destination_addr en los vouts de la tx
-        vout = [v["n"] for v in tx["vout"] if destination_addr == v["scriptPubKey"]["address"]]
-        assert len(vout) == 1
-        vout = vout[0]
-        tx_address = tx["vout"][vout]["scriptPubKey"]["address"]
-        # validar que la dirección de la transacción es igual a la de destino
-        assert_equal(tx_address,destination_addr)
-
-        mempool = self.nodes[0].getrawmempool()
-        # asegurar que nuestra transacción está en el mempool
-        assert_equal(mempool[0], txid)
-
-        self.log.info("Generar un bloque para que se procese nuestra transacción")        
-        self.generate(node0, 1)
+            # buscar la destination_addr en los vouts de la tx
+            vout = [v["n"] for v in tx["vout"] if destination_addr == v["scriptPubKey"]["address"]]
+            assert len(vout) == 1
+            vout = vout[0]
+            tx_address = tx["vout"][vout]["scriptPubKey"]["address"]
+            # validar que la dirección de la transacción es igual a la de destino
+            assert_equal(tx_address,destination_addr)
+
+            # asegurar que nuestra transacción está en el mempool
+            assert_equal(mempool.result()[0], txid)
+
+        with self.phase("confirmar"):
+            self.log.info("Generar un bloque para que se procese nuestra transacción")        
+            self.generate(node0, 1)
         
-        # Asegurar que nuestra transacción se minó
-        mempool = self.nodes[0].getrawmempool()
-        assert len(mempool) == 0
+            mempool = batch.getrawmempool()
+            transactions = batch.listtransactions()
+            utxos = batch.listunspent(minconf=0)
+            # Asegurar que nuestra transacción se minó
+            assert len(mempool.result()) == 0
 
         # Verificar que nuestra transacción movió los BTC a la dirección
         # de destino
-        transactions = self.nodes[0].listtransactions()
-        assert_equal(transactions[8]["address"], destination_addr)
+        assert_equal(transactions.result()[8]["address"], destination_addr)
         
         # TODO entender por qué que nuestra transacción no aparece en los UTXOs 
         # de esta wallet
-        utxos = self.nodes[0].listunspent(minconf=0)
+        utxos = utxos.result()
         assert len(utxos) > 0
         self.log.info("UTXOs disponibles: {}".format(utxos))
 
-        # Escanear el UTXOs set usando el descriptor
-        utxo_esperado = self.nodes[0].scantxoutset(action="start", scanobjects=[{'desc': descriptor}])
-        utxo_address = self.nodes[0].deriveaddresses(utxo_esperado['unspents'][0]['desc'])
-        # Verificar que la dirección de destino coincide con la dirección del descriptor
-        assert_equal(utxo_address[0], destination_addr)
-        self.log.info("UTXO esperado: {}".format(utxo_esperado['unspents'][0]['desc']))
+        # Buscar el descriptor en un índice local del UTXO set en lugar de
+        # escanearlo completo con scantxoutset
+        with self.phase("verificar"):
+            self.utxo_listener.catch_up(node0)
+            utxo_esperado = self.utxo_listener.lookup_descriptor(descriptor)
+            assert_equal(len(utxo_esperado), 1)
+            # Verificar que el UTXO es la salida a la dirección de destino
+            assert_equal((utxo_esperado[0]['txid'], utxo_esperado[0]['vout']), (txid, vout))
+            assert_equal(utxo_esperado[0]['scriptPubKey'], tx["vout"][vout]["scriptPubKey"]["hex"])
+        self.log.info("UTXO esperado: {}".format(utxo_esperado[0]))
+        self.log.info("Lotes RPC: {} llamadas en {} peticiones, {} viajes ahorrados".format(
+            batch.calls, batch.round_trips, batch.saved_round_trips))
+
+        self.log.info("Gastar desde la dirección multifirma con un PSBT firmado en paralelo")
+        # El mismo 2/3 pero con el origen de cada llave, así cada wallet sabe
+        # que una de las llaves es suya
+        with self.phase("gastar con PSBT"):
+            spend_descriptor = multisig_descriptor(2, [info[0] for info in infos], LEGACY)
+            assert_equal(node0.deriveaddresses(spend_descriptor)[0], destination_addr)
+            # Una conexión RPC por cosignatario para firmar desde varios hilos
+            spender = MultisigSpender(node0, [wallet_proxy(node) for node in self.nodes], funder=node0)
+            return_addr = node0.getnewaddress()
+            spend = spender.spend(spend_descriptor, {"txid": txid, "vout": vout}, {return_addr: 39.9999})
+            timings = spend["timings"]
+            self.log.info("PSBT: crear {:.3f}s, firmar en paralelo {:.3f}s (cosignatarios: {}), combinar {:.3f}s, finalizar {:.3f}s".format(
+                timings["create"], timings["sign"], ", ".join("{:.3f}s".format(t) for t in timings["signers"]),
+                timings["combine"], timings["finalize"]))
+            assert_equal(node0.getrawmempool(), [spend["txid"]])
+            self.generate(node0, 1)
+            self.utxo_listener.catch_up(node0)
+            assert_equal(self.utxo_listener.lookup_descriptor(descriptor), [])
 
 if __name__ == '__main__':
     ExampleTest().main()
\ No newline at end of file
@@ -12,7 +12,6 @@ del framework.
 
 
 # Evitar importaciones wildcard *
-from test_framework.descriptors import drop_origins
 from test_framework.blocktools import COINBASE_MATURITY
 from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint, COIN
 from test_framework.script_util import key_to_p2pk_script
@@ -21,8 +20,16 @@ from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import assert_equal
 from test_framework.key import ECKey
 
+from fabrica_bloques import BlockFactory
+from firmador_local import LocalSigner, wif_to_key
+from indice_utxos import UTXOIndex
+from instrumentacion import TimingMixin
+from pool_nodos import NodePoolMixin
+from snapshot_cadena import SnapshotMixin
+from verificador_script import ScriptVerifier, verify_spend
+
 # Mi clase de prueba hereda de BitcoinTestFramework
-class ExampleTest(BitcoinTestFramework):
+class ExampleTest(TimingMixin, NodePoolMixin, SnapshotMixin, BitcoinTestFramework):
 
     def set_test_params(self):
         """Este método debe ser sobrescrito para setear los parámetros de la
@@ -33,6 +40,12 @@ class ExampleTest(BitcoinTestFramework):
         self.num_nodes = 1
         self.extra_args = [[]]
 
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--local-sign", dest="local_sign", default=False, action="store_true",
+                            help="Firmar en el proceso con firmador_local y la llave determinista del nodo "
+                                 "en lugar de signrawtransactionwithwallet")
+
     def skip_test_if_missing_module(self):
         self.skip_if_no_wallet()
 
@@ -40,8 +53,17 @@ class ExampleTest(BitcoinTestFramework):
     def run_test(self):
         """Main test logic"""
         self.log.info("Prueba iniciando!")
-        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")        
-        blocks = self.generate(self.nodes[0], COINBASE_MATURITY + 1)
+        # Un solo verificador para toda la prueba, con sus cachés de firmas
+        self.verifier = ScriptVerifier()
+        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")
+        # La primera vez se minan y se guardan en un snapshot, las siguientes
+        # ejecuciones restauran la cadena del disco sin minar
+        with self.phase("minar"):
+            blocks = self.prepare_chain(lambda: BlockFactory(self.nodes[0]).mine(COINBASE_MATURITY + 1))
+
+        # Un solo índice de UTXOs para toda la prueba: se sincroniza una vez
+        # y después sigue los bloques nuevos por P2P
+        self.utxo_listener = UTXOIndex().follow(self.nodes[0])
 
         # Después de generar 101 bloques  hay un UTXO del bloque 1 por 50BTC
         utxos = self.nodes[0].listunspent()
@@ -53,31 +75,47 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info("UTXOs selecionado: {}".format(utxo))
 
 
-        # Crear la llave privada y obtener la llave pública 
-        key = ECKey()
-        key.generate()
-        pubkey = key.get_pubkey()
+        with self.phase("construir"):
+            # Crear la llave privada y obtener la llave pública 
+            key = ECKey()
+            key.generate()
+            pubkey = key.get_pubkey()
        
 
-        # Crear el script que debe ser <pubKey> OP_CHECKSIG
-        script_pubkey = key_to_p2pk_script(pubkey.get_bytes())
-        self.log.info("P2SH Script: {}".format(repr(script_pubkey)))
-
-        self.log.info("Crear la transacción")
-        self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
-        # COIN = 100,000,000 de sats por BTC
-        value = int((utxo["amount"] - self.relayfee) * COIN)
-        # Crear la transacción, las entradas y las salidas con ayuda de las
-        # clases primitivs de message.py
-        tx = CTransaction()
-        tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
-        tx.vout = [CTxOut(value, script_pubkey)]
-        tx.rehash() # hacer el hasing de la Tx
-        self.log.info("Transacción: {}".format(tx))
-
-        self.log.info("Firmar la transacción")
-        tx_hex = self.nodes[0].signrawtransactionwithwallet(tx.serialize().hex())["hex"]
-        self.log.info("Transacción HEX: {}".format(tx_hex))
+            # Crear el script que debe ser <pubKey> OP_CHECKSIG
+            script_pubkey = key_to_p2pk_script(pubkey.get_bytes())
+            self.log.info("P2SH Script: {}".format(repr(script_pubkey)))
+
+            self.log.info("Crear la transacción")
+            self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
+            # COIN = 100,000,000 de sats por BTC
+            value = int((utxo["amount"] - self.relayfee) * COIN)
+            # Crear la transacción, las entradas y las salidas con ayuda de las
+            # clases primitivs de message.py
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
+            tx.vout = [CTxOut(value, script_pubkey)]
+            tx.rehash() # hacer el hasing de la Tx
+            self.log.info("Transacción: {}".format(tx))
+
+        with self.phase("firmar"):
+            self.log.info("Firmar la transacción")
+            if self.options.local_sign:
+                # El coinbase que gastamos paga a la llave determinista del
+                # nodo, la misma que usa la wallet
+                signer = LocalSigner()
+                signer.add_key(wif_to_key(self.nodes[0].get_deterministic_priv_key().key), taproot=False)
+                spent = [CTxOut(int(utxo["amount"] * COIN), bytes.fromhex(utxo["scriptPubKey"]))]
+                assert signer.can_sign(spent[0].scriptPubKey), "el UTXO no es de la llave determinista"
+                tx_hex = signer.sign_tx(tx, spent).serialize().hex()
+            else:
+                tx_hex = self.nodes[0].signrawtransactionwithwallet(tx.serialize().hex())["hex"]
+            self.log.info("Transacción HEX: {}".format(tx_hex))
+
+        with self.phase("verificar firma"):
+            # Validar en el proceso las firmas contra la salida que se gasta,
+            # un error se detecta aquí sin esperar el rechazo del nodo
+            verify_spend(self.verifier, tx_hex, utxo)
 
         decrawtx = self.nodes[0].decoderawtransaction(tx_hex, True)
         descriptor = decrawtx['vout'][0]['scriptPubKey']['desc']
@@ -85,20 +123,22 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info("descriptor: {}".format(descriptor))
         self.log.info("Transacción Decodificada: {}".format(decrawtx))
 
-        # Enviar la transacción al nodo para ser incuida en el mempool
-        txid = self.nodes[0].sendrawtransaction(tx_hex)
-        self.log.info("Id de Transacción: {}".format(txid))
+        with self.phase("enviar"):
+            # Enviar la transacción al nodo para ser incuida en el mempool
+            txid = self.nodes[0].sendrawtransaction(tx_hex)
+            self.log.info("Id de Transacción: {}".format(txid))
         
-        mempool = self.nodes[0].getrawmempool()
-        # asegurar que nuestra transacción está en el mempool
-        assert_equal(mempool[0], txid)
+            mempool = self.nodes[0].getrawmempool()
+            # asegurar que nuestra transacción está en el mempool
+            assert_equal(mempool[0], txid)
 
-        self.log.info("Generar un bloque para que se procese nuestra transacción")        
-        blocks = self.generate(self.nodes[0], 1)
+        with self.phase("confirmar"):
+            self.log.info("Generar un bloque para que se procese nuestra transacción")        
+            blocks = self.generate(self.nodes[0], 1)
         
-        # Asegurar que nuestra transacción se minó
-        mempool = self.nodes[0].getrawmempool()
-        assert len(mempool) == 0
+            # Asegurar que nuestra transacción se minó
+            mempool = self.nodes[0].getrawmempool()
+            assert len(mempool) == 0
 
         # TODO entender porque nuestra transacción no aparece en los UTXOs 
         # de esta wallet
@@ -106,10 +146,19 @@ class ExampleTest(BitcoinTestFramework):
         assert len(utxos) > 0
         self.log.info("UTXOs disponibles: {}".format(utxos))
 
-        # Sin embargo si aparece al escanear el UTXOs set usando el descriptor
-        utxo_esperado = self.nodes[0].scantxoutset(action="start", scanobjects=[{'desc': descriptor}])
-        descriptor_utxo = drop_origins(utxo_esperado['unspents'][0]['desc'])
-        assert_equal(descriptor_utxo, descriptor)
+        # Sin embargo si aparece en el UTXO set. En lugar de escanearlo
+        # completo con scantxoutset buscamos el descriptor en un índice local
+        # que sigue los bloques del nodo
+        with self.phase("verificar"):
+            self.utxo_listener.catch_up(self.nodes[0])
+            utxo_esperado = self.utxo_listener.lookup_descriptor(descriptor)
+            assert_equal(len(utxo_esperado), 1)
+            assert_equal(utxo_esperado[0]['txid'], txid)
+            # Los descriptores de listunspent llevan la llave en hex con su
+            # origen [fingerprint/ruta], también se resuelven en el índice
+            for utxo in utxos:
+                encontrados = [(u['txid'], u['vout']) for u in self.utxo_listener.lookup_descriptor(utxo['desc'])]
+                assert (utxo['txid'], utxo['vout']) in encontrados
         self.log.info("Fin de la prueba")
 
 if __name__ == '__main__':
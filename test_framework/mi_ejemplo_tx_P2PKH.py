@@ -9,28 +9,59 @@ del framework.
 """
 # Imports en orden PEP8 std library primero, después de terceros y 
 # finalmente locales
-
+import time
 
 # Evitar importaciones wildcard *
 from test_framework.blocktools import COINBASE_MATURITY
-from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint, COIN
+from test_framework.messages import CTransaction, CTxIn, CTxOut, COutPoint, COIN, tx_from_hex
 from test_framework.script_util import keyhash_to_p2pkh_script
 
 from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import assert_equal
 from test_framework.address import hash160, byte_to_base58
+from test_framework.key import ECKey
+from test_framework.wallet_util import bytes_to_wif
+
+from estadisticas import format_summary
+from fabrica_bloques import BlockFactory
+from firmador_local import LocalSigner
+from indice_utxos import UTXOIndex
+from instrumentacion import TimingMixin
+from notificador_p2p import TxNotifier, WHITELIST_ARG
+from pool_nodos import NodePoolMixin
+from snapshot_cadena import SnapshotMixin
+from verificador_script import ScriptVerifier, verify_spend
+
+# Máximo de salidas P2PKH por transacción de reparto (fan-out), 2000 salidas
+# de 34 bytes quedan por debajo del límite de peso estándar (400,000 WU)
+MAX_FANOUT_OUTPUTS = 2000
 
 # Mi clase de prueba hereda de BitcoinTestFramework
-class ExampleTest(BitcoinTestFramework):
+class ExampleTest(TimingMixin, NodePoolMixin, SnapshotMixin, BitcoinTestFramework):
 
     def set_test_params(self):
         """Este método debe ser sobrescrito para setear los parámetros de la
         prueba."""
-        # Cadena nueva, 1 solo nodo de bitcoind y no hay parámetros en la línea de
-        # comandos para el nodo
+        # Cadena nueva y 1 solo nodo de bitcoind. El nodo anuncia sin retraso
+        # las transacciones a nuestra conexión P2P (permiso noban)
         self.setup_clean_chain = True
         self.num_nodes = 1
-        self.extra_args = [[]]
+        self.extra_args = [[WHITELIST_ARG]]
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--bulk", dest="bulk", type=int, default=0,
+                            help="Modo masivo: número de gastos P2PKH a construir, firmar y enviar (0 = ejemplo normal)")
+        parser.add_argument("--local-sign", dest="local_sign", default=False, action="store_true",
+                            help="Modo masivo: firmar en el proceso con firmador_local en lugar de signrawtransactionwithkey")
+        parser.add_argument("--local-verify", dest="local_verify", default=False, action="store_true",
+                            help="Modo masivo: verificar cada gasto en el proceso con verificador_script antes de enviarlo")
+
+    def snapshot_recipe(self):
+        # El modo masivo mina un bloque extra por cada transacción de reparto
+        if self.options.bulk > 0:
+            return "generate-{}".format(COINBASE_MATURITY + -(-self.options.bulk // MAX_FANOUT_OUTPUTS))
+        return super().snapshot_recipe()
 
     def skip_test_if_missing_module(self):
         self.skip_if_no_wallet()
@@ -39,8 +70,20 @@ class ExampleTest(BitcoinTestFramework):
     def run_test(self):
         """Main test logic"""
         self.log.info("Prueba iniciando!")
-        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")        
-        blocks = self.generate(self.nodes[0], COINBASE_MATURITY + 1)
+        # Un solo verificador para toda la prueba, con sus cachés de firmas
+        self.verifier = ScriptVerifier()
+        if self.options.bulk > 0:
+            self.run_bulk(self.options.bulk)
+            return
+        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")
+        # La primera vez se minan y se guardan en un snapshot, las siguientes
+        # ejecuciones restauran la cadena del disco sin minar
+        with self.phase("minar"):
+            blocks = self.prepare_chain(lambda: BlockFactory(self.nodes[0]).mine(COINBASE_MATURITY + 1))
+
+        # Un solo índice de UTXOs para toda la prueba: se sincroniza una vez
+        # y después sigue los bloques nuevos por P2P
+        self.utxo_listener = UTXOIndex().follow(self.nodes[0])
 
         # Después de generar 101 bloques  hay un UTXO del bloque 1 por 50BTC
         utxos = self.nodes[0].listunspent()
@@ -52,34 +95,42 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info("UTXOs selecionado: {}".format(utxo))
 
 
-        address = self.nodes[0].getnewaddress()
-        pubkey = self.nodes[0].getaddressinfo(address)['pubkey']
-        pubkey_hash = hash160(pubkey.encode()) # .encode() se requiere para convertir a bytes
-        script_pubkey = keyhash_to_p2pkh_script(pubkey_hash) 
-        # Nuestro Script en un Pay to Public to Key Hash
-        # OP_DUP OP_HASH160 <pubkey_hash> OP_EQUALVERIFY OP_CHECKSIG
-        self.log.info("P2SH Script: {}".format(repr(script_pubkey)))
-        # 111 = version bytes de testnet para la conversion a base 58
-        # fuente: https://en.bitcoin.it/wiki/Base58Check_encoding#Encoding_a_Bitcoin_address
-        destination_address = byte_to_base58(pubkey_hash, 111) 
-        # La dirección de destino es el pubkey_hash del pubkey en base58    
-        self.log.info("Destination address: {}".format(destination_address))
-
-        self.log.info("Crear la transacción")
-        self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
-        # COIN = 100,000,000 de sats por BTC
-        value = int((utxo["amount"] - self.relayfee) * COIN)
-        # Crear la transacción, las entradas y las salidas con ayuda de las
-        # clases primitivs de message.py
-        tx = CTransaction()
-        tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
-        tx.vout = [CTxOut(value, script_pubkey)]
-        tx.rehash() # hacer el hasing de la Tx
-        self.log.info("Transacción: {}".format(tx))
-
-        self.log.info("Firmar la transacción")
-        tx_hex = self.nodes[0].signrawtransactionwithwallet(tx.serialize().hex())["hex"]
-        self.log.info("Transacción HEX: {}".format(tx_hex))
+        with self.phase("derivar"):
+            address = self.nodes[0].getnewaddress()
+            pubkey = self.nodes[0].getaddressinfo(address)['pubkey']
+            pubkey_hash = hash160(pubkey.encode()) # .encode() se requiere para convertir a bytes
+            script_pubkey = keyhash_to_p2pkh_script(pubkey_hash) 
+            # Nuestro Script en un Pay to Public to Key Hash
+            # OP_DUP OP_HASH160 <pubkey_hash> OP_EQUALVERIFY OP_CHECKSIG
+            self.log.info("P2SH Script: {}".format(repr(script_pubkey)))
+            # 111 = version bytes de testnet para la conversion a base 58
+            # fuente: https://en.bitcoin.it/wiki/Base58Check_encoding#Encoding_a_Bitcoin_address
+            destination_address = byte_to_base58(pubkey_hash, 111) 
+            # La dirección de destino es el pubkey_hash del pubkey en base58    
+            self.log.info("Destination address: {}".format(destination_address))
+
+        with self.phase("construir"):
+            self.log.info("Crear la transacción")
+            self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
+            # COIN = 100,000,000 de sats por BTC
+            value = int((utxo["amount"] - self.relayfee) * COIN)
+            # Crear la transacción, las entradas y las salidas con ayuda de las
+            # clases primitivs de message.py
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
+            tx.vout = [CTxOut(value, script_pubkey)]
+            tx.rehash() # hacer el hasing de la Tx
+            self.log.info("Transacción: {}".format(tx))
+
+        with self.phase("firmar"):
+            self.log.info("Firmar la transacción")
+            tx_hex = self.nodes[0].signrawtransactionwithwallet(tx.serialize().hex())["hex"]
+            self.log.info("Transacción HEX: {}".format(tx_hex))
+
+        with self.phase("verificar firma"):
+            # Validar en el proceso las firmas contra la salida que se gasta,
+            # un error se detecta aquí sin esperar el rechazo del nodo
+            verify_spend(self.verifier, tx_hex, utxo)
 
         decrawtx = self.nodes[0].decoderawtransaction(tx_hex, True)
         descriptor = decrawtx['vout'][0]['scriptPubKey']['desc']
@@ -87,20 +138,22 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info("descriptor: {}".format(descriptor))
         self.log.info("Transacción Decodificada: {}".format(decrawtx))
 
-        # Enviar la transacción al nodo para ser incuida en el mempool
-        txid = self.nodes[0].sendrawtransaction(tx_hex)
-        self.log.info("Id de Transacción: {}".format(txid))
+        with self.phase("enviar"):
+            # Enviar la transacción al nodo para ser incuida en el mempool
+            txid = self.nodes[0].sendrawtransaction(tx_hex)
+            self.log.info("Id de Transacción: {}".format(txid))
         
-        mempool = self.nodes[0].getrawmempool()
-        # asegurar que nuestra transacción está en el mempool
-        assert_equal(mempool[0], txid)
+            mempool = self.nodes[0].getrawmempool()
+            # asegurar que nuestra transacción está en el mempool
+            assert_equal(mempool[0], txid)
 
-        self.log.info("Generar un bloque para que se procese nuestra transacción")        
-        blocks = self.generate(self.nodes[0], 1)
+        with self.phase("confirmar"):
+            self.log.info("Generar un bloque para que se procese nuestra transacción")        
+            blocks = self.generate(self.nodes[0], 1)
         
-        # Asegurar que nuestra transacción se minó
-        mempool = self.nodes[0].getrawmempool()
-        assert len(mempool) == 0
+            # Asegurar que nuestra transacción se minó
+            mempool = self.nodes[0].getrawmempool()
+            assert len(mempool) == 0
 
         # Verificar que nuestra transacción movió los BTC a la dirección
         # de destino
@@ -116,8 +169,127 @@ class ExampleTest(BitcoinTestFramework):
         utxos = self.nodes[0].listunspent(minconf=0)
         assert len(utxos) > 0
         self.log.info("UTXOs disponibles: {}".format(utxos))
-        # Sin embargo si aparece al escanear el UTXOs set usando el descriptor
-        utxo_esperado = self.nodes[0].scantxoutset(action="start", scanobjects=[{'desc': descriptor}])
+        # Sin embargo si aparece en el UTXO set, lo buscamos por descriptor en
+        # un índice local en lugar de escanearlo completo con scantxoutset
+        with self.phase("verificar"):
+            self.utxo_listener.catch_up(self.nodes[0])
+            utxo_esperado = self.utxo_listener.lookup_descriptor(descriptor)
+            assert_equal(utxo_esperado[0]['txid'], txid)
+
+    def run_bulk(self, num_spends):
+        """Modo masivo para pruebas de carga del mempool: repartir los coinbase
+        en miles de salidas P2PKH y después construir, firmar y enviar
+        num_spends gastos, midiendo cada etapa."""
+        node = self.nodes[0]
+        num_fanouts = -(-num_spends // MAX_FANOUT_OUTPUTS)
+        self.log.info("Modo masivo: {} gastos en {} transacciones de reparto".format(num_spends, num_fanouts))
+
+        # Un coinbase maduro por cada transacción de reparto. Los bloques se
+        # arman en el proceso y se envían por P2P en lugar de generate
+        with self.phase("minar"):
+            self.prepare_chain(lambda: BlockFactory(node).mine(COINBASE_MATURITY + num_fanouts))
+        factory = BlockFactory(node)
+        coinbases = node.listunspent()
+        assert len(coinbases) >= num_fanouts
+
+        # Llave local para las salidas P2PKH, así no dependemos de la wallet
+        # para firmar los gastos
+        key = ECKey()
+        key.generate()
+        wif = bytes_to_wif(key.get_bytes())
+        signer = LocalSigner()
+        signer.add_key(key, taproot=False)
+        pubkey_hash = hash160(key.get_pubkey().get_bytes())
+        script_pubkey = keyhash_to_p2pkh_script(pubkey_hash)
+        self.log.info("Dirección de las salidas: {}".format(byte_to_base58(pubkey_hash, 111)))
+
+        self.relayfee = node.getnetworkinfo()["relayfee"]
+        # Tarifa fija por gasto de 1 entrada y 1 salida (~192 vbytes), el
+        # relayfee es por kvB así que sobra para cubrir el mínimo
+        spend_fee = int(self.relayfee * COIN)
+
+        with self.phase("repartir"):
+            self.log.info("Repartir los coinbase en salidas P2PKH")
+            outpoints = []
+            fanouts = []
+            remaining = num_spends
+            for utxo in coinbases[:num_fanouts]:
+                count = min(remaining, MAX_FANOUT_OUTPUTS)
+                remaining -= count
+                tx = CTransaction()
+                tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
+                tx.vout = [CTxOut(0, script_pubkey)] * count
+                # Tarifa del reparto: el doble del mínimo para su tamaño, con
+                # margen para la firma de la entrada
+                fanout_fee = int(self.relayfee * COIN * (len(tx.serialize()) + 200) * 2 / 1000)
+                value = (int(utxo["amount"] * COIN) - fanout_fee) // count
+                tx.vout = [CTxOut(value, script_pubkey) for _ in range(count)]
+                tx_hex = node.signrawtransactionwithwallet(tx.serialize().hex())["hex"]
+                txid = node.sendrawtransaction(tx_hex)
+                fanouts.append(tx_from_hex(tx_hex))
+                outpoints += [(int(txid, 16), n, value) for n in range(count)]
+            # Confirmar los repartos, de lo contrario sus hijos rebasarían el
+            # límite de descendientes del mempool
+            factory.mine_transactions(fanouts)
+            assert_equal(len(node.getrawmempool()), 0)
+
+        # Las esperas de mempool y confirmación se resuelven con los anuncios
+        # P2P del nodo en lugar de sondear con getrawmempool
+        notifier = node.add_p2p_connection(TxNotifier())
+
+        self.log.info("Construir, firmar y enviar {} gastos".format(num_spends))
+        build_times, sign_times, verify_times, submit_times = [], [], [], []
+        txids = []
+        spends = []
+        start = time.perf_counter()
+        with self.phase("construir, firmar y enviar"):
+            for prev_txid, n, value in outpoints:
+                t0 = time.perf_counter()
+                tx = CTransaction()
+                tx.vin = [CTxIn(COutPoint(prev_txid, n))]
+                tx.vout = [CTxOut(value - spend_fee, script_pubkey)]
+                tx.rehash()
+                t1 = time.perf_counter()
+                if self.options.local_sign:
+                    signer.sign_tx(tx, [CTxOut(value, script_pubkey)])
+                    tx_hex = tx.serialize().hex()
+                else:
+                    tx_hex = node.signrawtransactionwithkey(tx.serialize().hex(), [wif])["hex"]
+                    tx = tx_from_hex(tx_hex)
+                t2 = time.perf_counter()
+                if self.options.local_verify:
+                    self.verifier.check_tx(tx, [CTxOut(value, script_pubkey)])
+                t3 = time.perf_counter()
+                txid = node.sendrawtransaction(tx_hex)
+                t4 = time.perf_counter()
+                notifier.mark_submitted(txid, at=t3)
+                build_times.append(t1 - t0)
+                sign_times.append(t2 - t1)
+                verify_times.append(t3 - t2)
+                submit_times.append(t4 - t3)
+                txids.append(txid)
+                spends.append(tx)
+        elapsed = time.perf_counter() - start
+        with self.phase("aceptar"):
+            for txid in txids:
+                notifier.wait_for_accept(txid)
+
+        self.log.info("Minar los gastos en bloques locales de peso máximo")
+        with self.phase("confirmar"):
+            factory.mine_transactions(spends)
+            for txid in txids:
+                notifier.wait_for_confirm(txid)
+            assert_equal(len(node.getrawmempool()), 0)
+        accept_times, confirm_times = notifier.latencies()
+
+        self.log.info("Resultados del modo masivo:")
+        self.log.info("Throughput sostenido: {:.1f} tx/s ({} tx en {:.3f}s)".format(num_spends / elapsed, num_spends, elapsed))
+        stages = [("build", build_times), ("sign", sign_times)]
+        if self.options.local_verify:
+            stages.append(("verify", verify_times))
+        stages += [("submit", submit_times), ("accept", accept_times), ("confirm", confirm_times)]
+        for name, values in stages:
+            self.log.info(format_summary(name, values))
 
 if __name__ == '__main__':
     ExampleTest().main()
\ No newline at end of file
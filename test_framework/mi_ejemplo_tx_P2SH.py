@@ -22,8 +22,16 @@ from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import assert_equal
 from test_framework.address import hash160, byte_to_base58
 
+from fabrica_bloques import BlockFactory
+from firmador_local import LocalSigner, wif_to_key
+from indice_utxos import UTXOIndex
+from instrumentacion import TimingMixin
+from pool_nodos import NodePoolMixin
+from snapshot_cadena import SnapshotMixin
+from verificador_script import ScriptVerifier, verify_spend
+
 # Mi clase de prueba hereda de BitcoinTestFramework
-class ExampleTest(BitcoinTestFramework):
+class ExampleTest(TimingMixin, NodePoolMixin, SnapshotMixin, BitcoinTestFramework):
 
     def set_test_params(self):
         """Este método debe ser sobrescrito para setear los parámetros de la
@@ -34,6 +42,12 @@ class ExampleTest(BitcoinTestFramework):
         self.num_nodes = 1
         self.extra_args = [[]]
 
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--local-sign", dest="local_sign", default=False, action="store_true",
+                            help="Firmar en el proceso con firmador_local y la llave determinista del nodo "
+                                 "en lugar de signrawtransactionwithwallet")
+
     def skip_test_if_missing_module(self):
         self.skip_if_no_wallet()
 
@@ -41,8 +55,17 @@ class ExampleTest(BitcoinTestFramework):
     def run_test(self):
         """Main test logic"""
         self.log.info("Prueba iniciando!")
-        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")        
-        blocks = self.generate(self.nodes[0], COINBASE_MATURITY + 1)
+        # Un solo verificador para toda la prueba, con sus cachés de firmas
+        self.verifier = ScriptVerifier()
+        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")
+        # La primera vez se minan y se guardan en un snapshot, las siguientes
+        # ejecuciones restauran la cadena del disco sin minar
+        with self.phase("minar"):
+            blocks = self.prepare_chain(lambda: BlockFactory(self.nodes[0]).mine(COINBASE_MATURITY + 1))
+
+        # Un solo índice de UTXOs para toda la prueba: se sincroniza una vez
+        # y después sigue los bloques nuevos por P2P
+        self.utxo_listener = UTXOIndex().follow(self.nodes[0])
 
         # Después de generar 101 bloques  hay un UTXO del bloque 1 por 50BTC
         utxos = self.nodes[0].listunspent()
@@ -54,36 +77,52 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info("UTXOs selecionado: {}".format(utxo))
 
 
-        # Crear el script
-        script = CScript([OP_TRUE])
-        # Obtener el hasd del script
-        script_hash = hash160(script)
-        # Obtener la dirección de destino de los Bitcoins convitiendo a Base58
-        # el hash del script (script_hash) 
-        # 196 = version bytes de testnet para la conversion a base58 de una dirección P2SH
-        # fuente: https://en.bitcoin.it/wiki/Base58Check_encoding#Encoding_a_Bitcoin_address
-        destination_address = byte_to_base58(script_hash, 196) # 196, Bitcoin testnet script hash
-        self.log.info("Destination Address: {}".format(destination_address))
-        # Armar el script_pubkey con el hash del script
-        # El script debe ser: OP_HASH160 <hash> OP_EQUAL
-        script_pubkey = scripthash_to_p2sh_script(script_hash)
-        self.log.info("P2SH Script: {}".format(repr(script_pubkey)))    
+        with self.phase("construir"):
+            # Crear el script
+            script = CScript([OP_TRUE])
+            # Obtener el hasd del script
+            script_hash = hash160(script)
+            # Obtener la dirección de destino de los Bitcoins convitiendo a Base58
+            # el hash del script (script_hash) 
+            # 196 = version bytes de testnet para la conversion a base58 de una dirección P2SH
+            # fuente: https://en.bitcoin.it/wiki/Base58Check_encoding#Encoding_a_Bitcoin_address
+            destination_address = byte_to_base58(script_hash, 196) # 196, Bitcoin testnet script hash
+            self.log.info("Destination Address: {}".format(destination_address))
+            # Armar el script_pubkey con el hash del script
+            # El script debe ser: OP_HASH160 <hash> OP_EQUAL
+            script_pubkey = scripthash_to_p2sh_script(script_hash)
+            self.log.info("P2SH Script: {}".format(repr(script_pubkey)))    
         
-        self.log.info("Crear la transacción")
-        self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
-        # COIN = 100,000,000 de sats por BTC
-        value = int((utxo["amount"] - self.relayfee) * COIN)
-        # Crear la transacción, las entradas y las salidas con ayuda de las
-        # clases primitivas de message.py
-        tx = CTransaction()
-        tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
-        tx.vout = [CTxOut(value, script_pubkey)]
-        tx.rehash() # hacer el hasing de la Tx
-        self.log.info("Transacción: {}".format(tx))
-
-        self.log.info("Firmar la transacción")
-        tx_hex = self.nodes[0].signrawtransactionwithwallet(tx.serialize().hex())["hex"]
-        self.log.info("Transacción HEX: {}".format(tx_hex))
+            self.log.info("Crear la transacción")
+            self.relayfee = self.nodes[0].getnetworkinfo()["relayfee"]
+            # COIN = 100,000,000 de sats por BTC
+            value = int((utxo["amount"] - self.relayfee) * COIN)
+            # Crear la transacción, las entradas y las salidas con ayuda de las
+            # clases primitivas de message.py
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(int(utxo["txid"], 16), utxo["vout"]))]
+            tx.vout = [CTxOut(value, script_pubkey)]
+            tx.rehash() # hacer el hasing de la Tx
+            self.log.info("Transacción: {}".format(tx))
+
+        with self.phase("firmar"):
+            self.log.info("Firmar la transacción")
+            if self.options.local_sign:
+                # El coinbase que gastamos paga a la llave determinista del
+                # nodo, la misma que usa la wallet
+                signer = LocalSigner()
+                signer.add_key(wif_to_key(self.nodes[0].get_deterministic_priv_key().key), taproot=False)
+                spent = [CTxOut(int(utxo["amount"] * COIN), bytes.fromhex(utxo["scriptPubKey"]))]
+                assert signer.can_sign(spent[0].scriptPubKey), "el UTXO no es de la llave determinista"
+                tx_hex = signer.sign_tx(tx, spent).serialize().hex()
+            else:
+                tx_hex = self.nodes[0].signrawtransactionwithwallet(tx.serialize().hex())["hex"]
+            self.log.info("Transacción HEX: {}".format(tx_hex))
+
+        with self.phase("verificar firma"):
+            # Validar en el proceso las firmas contra la salida que se gasta,
+            # un error se detecta aquí sin esperar el rechazo del nodo
+            verify_spend(self.verifier, tx_hex, utxo)
 
         decrawtx = self.nodes[0].decoderawtransaction(tx_hex, True)
         descriptor = decrawtx['vout'][0]['scriptPubKey']['desc']
@@ -91,20 +130,22 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info("descriptor: {}".format(descriptor))
         self.log.info("Transacción Decodificada: {}".format(decrawtx))
 
-        # Enviar la transacción al nodo para ser incuida en el mempool
-        txid = self.nodes[0].sendrawtransaction(tx_hex)
-        self.log.info("Id de Transacción: {}".format(txid))
+        with self.phase("enviar"):
+            # Enviar la transacción al nodo para ser incuida en el mempool
+            txid = self.nodes[0].sendrawtransaction(tx_hex)
+            self.log.info("Id de Transacción: {}".format(txid))
         
-        mempool = self.nodes[0].getrawmempool()
-        # asegurar que nuestra transacción está en el mempool
-        assert_equal(mempool[0], txid)
+            mempool = self.nodes[0].getrawmempool()
+            # asegurar que nuestra transacción está en el mempool
+            assert_equal(mempool[0], txid)
 
-        self.log.info("Generar un bloque para que se procese nuestra transacción")        
-        blocks = self.generate(self.nodes[0], 1)
+        with self.phase("confirmar"):
+            self.log.info("Generar un bloque para que se procese nuestra transacción")        
+            blocks = self.generate(self.nodes[0], 1)
         
-        # Asegurar que nuestra transacción se minó
-        mempool = self.nodes[0].getrawmempool()
-        assert len(mempool) == 0
+            # Asegurar que nuestra transacción se minó
+            mempool = self.nodes[0].getrawmempool()
+            assert len(mempool) == 0
 
         # Verificar que nuestra transacción movió los BTC a la dirección
         # de destino
@@ -117,10 +158,13 @@ class ExampleTest(BitcoinTestFramework):
         utxos = self.nodes[0].listunspent(minconf=0)
         assert len(utxos) > 0
         self.log.info("UTXOs disponibles: {}".format(utxos))
-        # Sin embargo si aparece al escanear el UTXOs set usando el descriptor
-        utxo_esperado = self.nodes[0].scantxoutset(action="start", scanobjects=[{'desc': descriptor}])
-        # La dirección de destino coincide con la dirección de descriptor
-        self.log.info("UTXO esperado: {}".format(utxo_esperado['unspents'][0]['desc']))
+        # Sin embargo si aparece en el UTXO set, lo buscamos por descriptor en
+        # un índice local en lugar de escanearlo completo con scantxoutset
+        with self.phase("verificar"):
+            self.utxo_listener.catch_up(self.nodes[0])
+            utxo_esperado = self.utxo_listener.lookup_descriptor(descriptor)
+            assert_equal(utxo_esperado[0]['txid'], txid)
+        self.log.info("UTXO esperado: {}".format(utxo_esperado[0]))
 
 if __name__ == '__main__':
     ExampleTest().main()
\ No newline at end of file
@@ -14,14 +14,30 @@ del framework.
 # Evitar importaciones wildcard *
 from audioop import add
 from test_framework.blocktools import COINBASE_MATURITY
-from test_framework.messages import COIN
+from test_framework.messages import (CTransaction, CTxIn, CTxOut, COutPoint,
+                                     COIN, tx_from_hex)
 
 from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import assert_equal
 from test_framework.descriptors import descsum_create
+from test_framework.address import program_to_witness
+from test_framework.key import ECKey
+
+from derivacion_local import DescriptorDeriver
+from firmador_local import LocalSigner, p2tr_script, taproot_tweak_keypair
+from instrumentacion import TimingMixin
+from pool_nodos import NodePoolMixin
+from snapshot_cadena import SnapshotMixin
+from verificador_script import ScriptVerifier, verify_spend
+
+# importamos la semilla y el XPRIV usando la página https://iancoleman.io/bip39/
+SEED = 'ca7d2af0ab7a04857c22bddf064dedc54945f9d6485970b91253ebe0adf132370fee5eb76a123179edc504158bad630c5070a429becdf8a1cbf90595a07591cc'
+XPRIV = 'tprv8ZgxMBicQKsPf2h5QMyUYcsbeu8jfz6tR7a7jJpvhBaPJsddMfZdYdhH7mrXPve58KTicWsrJPGEC1XSkHMhHoMxyUuauDWVtvAFvQFNsrM'
+# Derivation path de taproot
+DERIVATION_PATH = "/86'/1'/0'/0/*"
 
 # Mi clase de prueba hereda de BitcoinTestFramework
-class ExampleTest(BitcoinTestFramework):
+class ExampleTest(TimingMixin, NodePoolMixin, SnapshotMixin, BitcoinTestFramework):
 
     def set_test_params(self):
         """Este método debe ser sobrescrito para setear los parámetros de la
@@ -32,20 +48,17 @@ class ExampleTest(BitcoinTestFramework):
         self.num_nodes = 1
         self.extra_args = [["-vbparams=taproot:1:1", "-addresstype=bech32m", "-changetype=bech32m"]]
 
-    def run_test(self):
-        """Main test logic"""
-        self.log.info("Prueba iniciando!")
+    def snapshot_recipe(self):
+        return "taproot-descriptor-wallet-{}".format(COINBASE_MATURITY + 1)
 
+    def build_chain(self):
+        """Preparar la billetera TapRoot y minar los primeros bloques a una
+        dirección de la billetera"""
         self.log.info("Creamos billetera que funciona con descriptores")
         self.nodes[0].createwallet(wallet_name="TapRoot", descriptors=True, blank=True)
 
-        # importamos la semilla y el XPRIV usando la página https://iancoleman.io/bip39/
-        seed = 'ca7d2af0ab7a04857c22bddf064dedc54945f9d6485970b91253ebe0adf132370fee5eb76a123179edc504158bad630c5070a429becdf8a1cbf90595a07591cc'
-        xpriv = 'tprv8ZgxMBicQKsPf2h5QMyUYcsbeu8jfz6tR7a7jJpvhBaPJsddMfZdYdhH7mrXPve58KTicWsrJPGEC1XSkHMhHoMxyUuauDWVtvAFvQFNsrM'
-        # Derivation path de taproot
-        derivation_path = "/86'/1'/0'/0/*"
         # Crear descriptor
-        descriptor = f"tr({xpriv}{derivation_path})"
+        descriptor = f"tr({XPRIV}{DERIVATION_PATH})"
         # generar el checksum
         descriptor_checksum = descsum_create(descriptor)
 
@@ -63,8 +76,21 @@ class ExampleTest(BitcoinTestFramework):
         # Generar una direccion para recibir los fondos de la transaccion COINBASE
         address = wallet.getnewaddress(address_type='bech32m')
 
-        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")  
-        blocks = self.generatetoaddress(self.nodes[0], COINBASE_MATURITY + 1, address)      
+        self.log.info("Crear algunos bloques 101 y hacer que madure el bloque1")
+        self.generatetoaddress(self.nodes[0], COINBASE_MATURITY + 1, address)
+        return address
+
+    def run_test(self):
+        """Main test logic"""
+        self.log.info("Prueba iniciando!")
+        # Un solo verificador para toda la prueba, con sus cachés de firmas
+        self.verifier = ScriptVerifier()
+
+        # La billetera, el descriptor y los 101 bloques se preparan una sola
+        # vez y se guardan en un snapshot, las siguientes ejecuciones los
+        # restauran del disco
+        with self.phase("minar"):
+            address = self.prepare_chain(self.build_chain)
 
         # Después de generar 101 bloques  hay un UTXO del bloque 1 por 50BTC
         utxos = self.nodes[0].listunspent()
@@ -76,31 +102,50 @@ class ExampleTest(BitcoinTestFramework):
         self.log.info(f"UTXOs selecionado: {utxo}")
 
         # Generar la dirección de destino de nuestra nuva transacción
-        destination_address = self.nodes[0].getnewaddress(address_type='bech32m')
-
-        tx = self.nodes[0].createrawtransaction([{"txid": utxo["txid"], "vout": utxo["vout"]}], {destination_address: 49.999})
-        signed_tx = self.nodes[0].signrawtransactionwithwallet(tx)['hex']
-        self.log.info(f"Transacción HEX firmada: {tx}")
-        txid = self.nodes[0].sendrawtransaction(signed_tx)
-        self.log.info(f"Transacción Id: {txid}")
+        with self.phase("derivar"):
+            destination_address = self.nodes[0].getnewaddress(address_type='bech32m')
+
+            # Las mismas direcciones se pueden derivar localmente del descriptor,
+            # sin RPC: la del coinbase es el índice 0 y la de destino el 1
+            deriver = DescriptorDeriver(descsum_create(f"tr({XPRIV}{DERIVATION_PATH})"))
+            assert_equal(deriver.address(0), address)
+            assert_equal(deriver.address(1), destination_address)
+            # Derivar un rango grande y verificar una muestra con deriveaddresses
+            local_addresses = deriver.derive_addresses(0, 100)
+            deriver.verify_sample(self.nodes[0], [0, 50, 99])
+            self.log.info(f"{len(local_addresses)} direcciones derivadas localmente")
+
+        with self.phase("firmar"):
+            tx = self.nodes[0].createrawtransaction([{"txid": utxo["txid"], "vout": utxo["vout"]}], {destination_address: 49.999})
+            signed_tx = self.nodes[0].signrawtransactionwithwallet(tx)['hex']
+            self.log.info(f"Transacción HEX firmada: {tx}")
+
+        with self.phase("verificar firma"):
+            # Validar en el proceso las firmas contra la salida que se gasta,
+            # un error se detecta aquí sin esperar el rechazo del nodo
+            verify_spend(self.verifier, signed_tx, utxo)
+        with self.phase("enviar"):
+            txid = self.nodes[0].sendrawtransaction(signed_tx)
+            self.log.info(f"Transacción Id: {txid}")
       
-        decrawtx = self.nodes[0].decoderawtransaction(signed_tx, True)
-        descriptor = decrawtx['vout'][0]['scriptPubKey']['desc']
-        # Guardemos el descriptor
-        self.log.info(f"descriptor: {descriptor}".format(descriptor))
-        self.log.info(f"Transacción Decodificada: { decrawtx }")
+            decrawtx = self.nodes[0].decoderawtransaction(signed_tx, True)
+            descriptor = decrawtx['vout'][0]['scriptPubKey']['desc']
+            # Guardemos el descriptor
+            self.log.info(f"descriptor: {descriptor}".format(descriptor))
+            self.log.info(f"Transacción Decodificada: { decrawtx }")
         
-        mempool = self.nodes[0].getrawmempool()
-        # asegurar que nuestra transacción está en el mempool
-        assert_equal(mempool[0], txid)
-
-        self.log.info("Generar un bloque para que se procese nuestra transacción")        
-        blocks = self.generate(self.nodes[0], 1)
-        self.log.info(f"Bloque: {blocks}")
+            mempool = self.nodes[0].getrawmempool()
+            # asegurar que nuestra transacción está en el mempool
+            assert_equal(mempool[0], txid)
+
+        with self.phase("confirmar"):
+            self.log.info("Generar un bloque para que se procese nuestra transacción")        
+            blocks = self.generate(self.nodes[0], 1)
+            self.log.info(f"Bloque: {blocks}")
         
-        # Asegurar que nuestra transacción se minó
-        mempool = self.nodes[0].getrawmempool()
-        assert len(mempool) == 0
+            # Asegurar que nuestra transacción se minó
+            mempool = self.nodes[0].getrawmempool()
+            assert len(mempool) == 0
 
         # Verificar que nuestra transacción movió los BTC a la dirección
         # de destino
@@ -117,5 +162,38 @@ class ExampleTest(BitcoinTestFramework):
         assert_equal(utxos[0]["address"], destination_address)
         self.log.info(f"UTXOs de nuestra transacción: {utxos[0]}")
 
+        with self.phase("firma local"):
+            self.log.info("Firmar localmente un gasto P2TR por el key path")
+            # Llave interna local, el tweak de BIP341 nos da la llave de salida
+            # que va en el scriptPubKey y la llave privada que firma
+            key = ECKey()
+            key.generate()
+            signer = LocalSigner()
+            signer.add_key(key)
+            _, output_key = taproot_tweak_keypair(key.get_bytes())
+            local_script = p2tr_script(output_key)
+            local_address = program_to_witness(1, output_key)
+            self.log.info(f"Dirección P2TR local: {local_address}")
+
+            # La billetera solo tiene el descriptor externo y no puede generar
+            # direcciones de cambio, así que gastamos el UTXO completo
+            funding = self.nodes[0].createrawtransaction([{"txid": utxos[0]["txid"], "vout": utxos[0]["vout"]}], {local_address: 49.998})
+            funding = self.nodes[0].signrawtransactionwithwallet(funding)["hex"]
+            funding_txid = self.nodes[0].sendrawtransaction(funding)
+            self.generate(self.nodes[0], 1)
+            funding_tx = tx_from_hex(funding)
+            vout = 0
+
+            tx = CTransaction()
+            tx.vin = [CTxIn(COutPoint(int(funding_txid, 16), vout))]
+            tx.vout = [CTxOut(funding_tx.vout[vout].nValue - 10000, local_script)]
+            # Sin signrawtransactionwithwallet: sighash BIP341 y firma Schnorr en
+            # el proceso
+            signer.sign_tx(tx, [funding_tx.vout[vout]])
+            self.verifier.check_tx(tx, [funding_tx.vout[vout]])
+            txid = self.nodes[0].sendrawtransaction(tx.serialize().hex())
+            assert_equal(self.nodes[0].getrawmempool(), [txid])
+            self.log.info(f"Transacción firmada localmente: {txid}")
+
 if __name__ == '__main__':
     ExampleTest().main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Gasto de salidas multifirma m-de-n con un PSBT firmado en paralelo.
+
+El flujo es el de BIP174: un coordinador crea el PSBT (createpsbt), lo
+completa con los scripts y las rutas de derivación de las llaves a partir
+del descriptor (utxoupdatepsbt), cada cosignatario lo firma con su wallet
+(walletprocesspsbt) y el coordinador combina las firmas (combinepsbt) y
+finaliza la transacción (finalizepsbt).
+
+Las firmas de los cosignatarios son independientes, así que MultisigSpender
+las pide todas al mismo tiempo desde un pool de hilos. Cada hilo usa su
+propia conexión HTTP: las wallets que regresa get_wallet_rpc comparten la
+conexión del nodo y no se pueden usar desde varios hilos.
+
+Uso:
+    descriptor = multisig_descriptor(2, infos, "legacy")
+    spender = MultisigSpender(node0, [wallet_proxy(n) for n in self.nodes])
+    result = spender.spend(descriptor, {"txid": txid, "vout": vout}, {address: amount})
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from test_framework.descriptors import descsum_create
+from test_framework.util import assert_equal, get_rpc_proxy
+
+# Tipos de multifirma: scriptPubKey y descriptor de cada uno
+LEGACY = "legacy"
+P2WSH = "p2wsh"
+TAPROOT = "taproot"
+MULTISIG_TYPES = [LEGACY, P2WSH, TAPROOT]
+
+# Llave interna sin llave privada conocida (punto NUMS de BIP341), obliga a
+# gastar la salida taproot por el script multi_a
+NUMS_KEY = "50929b74c1a04954b78b4b6035e97a5e078a5a0f28ec96d547bfee9ace803ac0"
+
+
+def wallet_proxy(node, wallet_name=None):
+    """Conexión RPC nueva a un nodo, o a una de sus wallets, que se puede
+    usar desde otro hilo"""
+    url = node.url
+    if wallet_name is not None:
+        url += "/wallet/" + urllib.parse.quote(wallet_name, safe="")
+    return get_rpc_proxy(url, node.index, timeout=node.rpc_timeout, coveragedir=node.coverage_dir)
+
+
+def key_origin(info, xonly=False):
+    """Llave con su origen [fingerprint/ruta] a partir de getaddressinfo,
+    para que walletprocesspsbt encuentre la llave de cada cosignatario"""
+    pubkey = info["pubkey"][2:] if xonly else info["pubkey"]
+    return "[{}{}]{}".format(info["hdmasterfingerprint"], info["hdkeypath"][1:], pubkey)
+
+
+def multisig_descriptor(m, infos, multisig_type):
+    """Descriptor con checksum de una multifirma m-de-n con las llaves de
+    infos (resultados de getaddressinfo), en el orden dado"""
+    if multisig_type == TAPROOT:
+        # En tapscript las llaves son x-only
+        keys = [key_origin(info, xonly=True) for info in infos]
+        return descsum_create("tr({},multi_a({},{}))".format(NUMS_KEY, m, ",".join(keys)))
+    keys = [key_origin(info) for info in infos]
+    multi = "multi({},{})".format(m, ",".join(keys))
+    if multisig_type == P2WSH:
+        return descsum_create("wsh({})".format(multi))
+    assert_equal(multisig_type, LEGACY)
+    return descsum_create("sh({})".format(multi))
+
+
+class MultisigSpender():
+    """Coordinador de un gasto multifirma. node hace las llamadas que no
+    necesitan wallet; signers son conexiones RPC a las wallets de los
+    cosignatarios (ver wallet_proxy), una por hilo."""
+
+    def __init__(self, node, signers, funder=None):
+        self.node = node
+        self.signers = signers
+        # Wallet que creó la salida: llena la transacción completa que se
+        # gasta (non_witness_utxo), necesaria en las entradas legacy porque
+        # utxoupdatepsbt solo la toma del UTXO set para segwit
+        self.funder = funder
+
+    def sign_concurrently(self, psbt):
+        """Firmar el PSBT en todos los cosignatarios al mismo tiempo. Regresa
+        los PSBT firmados y el tiempo de cada firma."""
+        def sign(signer):
+            start = time.perf_counter()
+            result = signer.walletprocesspsbt(psbt=psbt, sign=True, finalize=False)
+            return result["psbt"], time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=len(self.signers)) as executor:
+            results = list(executor.map(sign, self.signers))
+        return [psbt for psbt, _ in results], [elapsed for _, elapsed in results]
+
+    def spend(self, descriptor, utxo, outputs, send=True):
+        """Crear, firmar en paralelo, combinar, finalizar y (si send)
+        publicar el gasto de utxo ({"txid", "vout"}) a outputs. Regresa un
+        diccionario con la transacción final, su txid y los tiempos de cada
+        etapa."""
+        timings = {}
+        start = time.perf_counter()
+        psbt = self.node.createpsbt([utxo], outputs)
+        psbt = self.node.utxoupdatepsbt(psbt, [descriptor])
+        if self.funder is not None:
+            psbt = self.funder.walletprocesspsbt(psbt=psbt, sign=False)["psbt"]
+        timings["create"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        signed, timings["signers"] = self.sign_concurrently(psbt)
+        timings["sign"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        combined = self.node.combinepsbt(signed)
+        timings["combine"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        final = self.node.finalizepsbt(combined)
+        timings["finalize"] = time.perf_counter() - start
+        assert final["complete"], "el PSBT no tiene las firmas suficientes"
+
+        result = {"hex": final["hex"], "timings": timings}
+        if send:
+            result["txid"] = self.node.sendrawtransaction(final["hex"])
+        return result
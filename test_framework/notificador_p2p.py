@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Espera por eventos de mempool y confirmación sobre la interfaz P2P.
+
+Los ejemplos confirman que una transacción entró al mempool o se minó
+llamando getrawmempool después de sendrawtransaction y de generate. Con
+muchas transacciones ese sondeo por RPC agrega latencia y CPU. TxNotifier es
+una conexión P2PInterface que escucha los anuncios inv de transacciones y
+los bloques que el nodo anuncia, y despierta a quien espera en cuanto llega
+el evento.
+
+El nodo retrasa los inv de transacciones a sus pares entrantes (en promedio
+5 segundos) salvo que tengan el permiso noban, por eso el nodo debe
+arrancar con -whitelist=noban@127.0.0.1.
+
+Uso:
+    notifier = self.nodes[0].add_p2p_connection(TxNotifier())
+    notifier.mark_submitted(tx.hash)
+    self.nodes[0].sendrawtransaction(tx.serialize().hex())
+    notifier.wait_for_accept(tx.hash)
+    self.generate(self.nodes[0], 1)
+    notifier.wait_for_confirm(tx.hash, depth=1)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import threading
+import time
+
+from test_framework.messages import CInv, MSG_BLOCK, MSG_TX, MSG_WTX, msg_getdata
+from test_framework.p2p import P2PInterface
+from test_framework.script import CScript
+
+# Argumento para que el nodo anuncie las transacciones sin retraso
+WHITELIST_ARG = "-whitelist=noban@127.0.0.1"
+
+
+def coinbase_height(block):
+    """Altura del bloque según BIP34: el primer elemento del scriptSig del
+    coinbase"""
+    height = next(iter(CScript(block.vtx[0].vin[0].scriptSig)))
+    if isinstance(height, int):
+        return height
+    return int.from_bytes(height, "little")
+
+
+class TxNotifier(P2PInterface):
+    """Registra cuándo el nodo anuncia cada transacción (aceptada en el
+    mempool) y en qué bloque se minó, y mide las latencias desde el envío"""
+
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition()
+        # txid (entero) -> momento en que se envió al nodo
+        self._submitted = {}
+        # wtxid -> txid, para los inv MSG_WTX de transacciones segwit
+        self._wtxids = {}
+        # txid -> momento del inv
+        self._accepted = {}
+        # txid -> (hash del bloque, momento en que llegó el bloque)
+        self._mined = {}
+        # hash de bloque -> altura, y la cadena activa vista: altura -> hash
+        self._block_heights = {}
+        self._active = {}
+        self._first_height = None
+        self.tip_height = -1
+
+    def mark_submitted(self, txid, wtxid=None, at=None):
+        """Registrar el envío de una transacción. Conviene llamarlo antes de
+        sendrawtransaction (o pasar el momento del envío en at) porque el inv
+        puede llegar antes de que regrese la llamada RPC."""
+        txid = int(txid, 16)
+        with self._cond:
+            self._submitted[txid] = time.perf_counter() if at is None else at
+            if wtxid is not None:
+                self._wtxids[int(wtxid, 16)] = txid
+
+    def on_version(self, message):
+        super().on_version(message)
+        # Los bloques anteriores a la conexión no nos interesan, solo se piden
+        # hacia atrás los que falten desde esta altura
+        with self._cond:
+            if self._first_height is None:
+                self._first_height = message.nStartingHeight
+
+    def on_inv(self, message):
+        # No pedimos el cuerpo de las transacciones, el inv basta para saber
+        # que el nodo la aceptó; solo pedimos los bloques
+        now = time.perf_counter()
+        want = msg_getdata()
+        with self._cond:
+            for inv in message.inv:
+                if inv.type in (MSG_TX, MSG_WTX):
+                    txid = self._wtxids.get(inv.hash, inv.hash)
+                    self._accepted.setdefault(txid, now)
+                elif inv.type == MSG_BLOCK and inv.hash not in self._block_heights:
+                    want.inv.append(inv)
+            self._cond.notify_all()
+        if want.inv:
+            self.send_message(want)
+
+    def on_block(self, message):
+        now = time.perf_counter()
+        block = message.block
+        block.rehash()
+        height = coinbase_height(block)
+        with self._cond:
+            if self._first_height is None:
+                self._first_height = height - 1
+            self._block_heights[block.sha256] = height
+            self._active[height] = block.sha256
+            if height >= self.tip_height:
+                # Después de una reorganización los bloques más altos de la
+                # cadena anterior ya no son parte de la cadena activa
+                for stale in [h for h in self._active if h > height]:
+                    del self._active[stale]
+                self.tip_height = height
+            for tx in block.vtx[1:]:
+                tx.calc_sha256()
+                self._mined[tx.sha256] = (block.sha256, now)
+                self._accepted.setdefault(tx.sha256, now)
+            self._cond.notify_all()
+            # Si el nodo conectó varios bloques seguidos solo anuncia la
+            # punta, pedimos hacia atrás los bloques que faltan desde la
+            # altura que tenía al conectarnos
+            missing = block.hashPrevBlock not in self._block_heights and self._first_height < height - 1
+        if missing:
+            self.send_message(msg_getdata([CInv(MSG_BLOCK, block.hashPrevBlock)]))
+
+    def is_accepted(self, txid):
+        with self._cond:
+            return int(txid, 16) in self._accepted
+
+    def confirmations(self, txid):
+        with self._cond:
+            return self._confirmations(int(txid, 16))
+
+    def _confirmations(self, txid):
+        mined = self._mined.get(txid)
+        if mined is None:
+            return 0
+        height = self._block_heights[mined[0]]
+        if self._active.get(height) != mined[0]:
+            return 0
+        return self.tip_height - height + 1
+
+    def _wait(self, predicate, timeout, what):
+        with self._cond:
+            if not self._cond.wait_for(predicate, timeout):
+                raise AssertionError("{} no ocurrió en {} segundos".format(what, timeout))
+
+    def wait_for_accept(self, txid, timeout=60):
+        txid_int = int(txid, 16)
+        self._wait(lambda: txid_int in self._accepted, timeout,
+                   "La aceptación de {}".format(txid))
+
+    def wait_for_confirm(self, txid, depth=1, timeout=60):
+        txid_int = int(txid, 16)
+        self._wait(lambda: self._confirmations(txid_int) >= depth, timeout,
+                   "La confirmación a profundidad {} de {}".format(depth, txid))
+
+    def wait_for_block(self, block_hash, timeout=60):
+        block_int = int(block_hash, 16)
+        self._wait(lambda: block_int in self._block_heights, timeout,
+                   "La llegada del bloque {}".format(block_hash))
+
+    def accept_latency(self, txid):
+        """Segundos entre el envío y el inv, None si no hay ambos eventos"""
+        txid = int(txid, 16)
+        with self._cond:
+            if txid not in self._submitted or txid not in self._accepted:
+                return None
+            return self._accepted[txid] - self._submitted[txid]
+
+    def confirm_latency(self, txid):
+        """Segundos entre el envío y la llegada del bloque que la minó"""
+        txid = int(txid, 16)
+        with self._cond:
+            if txid not in self._submitted or txid not in self._mined:
+                return None
+            return self._mined[txid][1] - self._submitted[txid]
+
+    def latencies(self):
+        """Listas de latencias de aceptación y de confirmación de todas las
+        transacciones enviadas que ya tienen el evento"""
+        with self._cond:
+            accept = [self._accepted[t] - s for t, s in self._submitted.items() if t in self._accepted]
+            confirm = [self._mined[t][1] - s for t, s in self._submitted.items() if t in self._mined]
+        return accept, confirm
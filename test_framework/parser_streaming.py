@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Parser de transacciones y bloques sobre memoryview, sin copias.
+
+CTransaction.deserialize construye un objeto CTxIn, COutPoint, CTxOut y
+CScript por cada entrada y salida, y copia cada script. Para recorrer
+bloques completos basta con saber dónde empieza cada campo: TxView guarda
+los desplazamientos de sus entradas, salidas y testigos dentro del buffer
+original, e InputView y OutputView (con __slots__) decodifican cada campo
+solo cuando se lee. El txid y el wtxid también se calculan al pedirlos.
+
+Uso:
+    block = BlockView(raw_block)
+    for tx in block.transactions():
+        total += sum(out.value for out in tx.outputs)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import struct
+
+from test_framework.messages import hash256
+
+# Peso por byte de los datos sin testigo (BIP141)
+WITNESS_SCALE_FACTOR = 4
+
+
+def read_compact_size(buf, pos):
+    """Regresa (valor, posición siguiente) del CompactSize en buf[pos]"""
+    first = buf[pos]
+    if first < 0xfd:
+        return first, pos + 1
+    if first == 0xfd:
+        return struct.unpack_from("<H", buf, pos + 1)[0], pos + 3
+    if first == 0xfe:
+        return struct.unpack_from("<I", buf, pos + 1)[0], pos + 5
+    return struct.unpack_from("<Q", buf, pos + 1)[0], pos + 9
+
+
+class OutputView():
+    """Salida de una transacción: 8 bytes de monto y el scriptPubKey"""
+    __slots__ = ("_buf", "_start", "_script_start", "_end")
+
+    def __init__(self, buf, start, script_start, end):
+        self._buf = buf
+        self._start = start
+        self._script_start = script_start
+        self._end = end
+
+    @property
+    def value(self):
+        return struct.unpack_from("<q", self._buf, self._start)[0]
+
+    @property
+    def script_pubkey(self):
+        """El scriptPubKey como memoryview (bytes() para copiarlo)"""
+        return self._buf[self._script_start:self._end]
+
+    @property
+    def raw(self):
+        return self._buf[self._start:self._end]
+
+
+class InputView():
+    """Entrada de una transacción: outpoint, scriptSig, secuencia y testigo"""
+    __slots__ = ("_buf", "_start", "_script_start", "_script_end", "_witness")
+
+    def __init__(self, buf, start, script_start, script_end, witness):
+        self._buf = buf
+        self._start = start
+        self._script_start = script_start
+        self._script_end = script_end
+        # (inicio, fin) del testigo de la entrada, None si no tiene
+        self._witness = witness
+
+    @property
+    def prevout_hash(self):
+        """txid de la salida gastada en hex, como lo muestra el nodo"""
+        return bytes(self._buf[self._start:self._start + 32])[::-1].hex()
+
+    @property
+    def prevout_n(self):
+        return struct.unpack_from("<I", self._buf, self._start + 32)[0]
+
+    @property
+    def script_sig(self):
+        return self._buf[self._script_start:self._script_end]
+
+    @property
+    def sequence(self):
+        return struct.unpack_from("<I", self._buf, self._script_end)[0]
+
+    @property
+    def witness(self):
+        """Pila del testigo como lista de memoryview"""
+        if self._witness is None:
+            return []
+        count, pos = read_compact_size(self._buf, self._witness[0])
+        stack = []
+        for _ in range(count):
+            size, pos = read_compact_size(self._buf, pos)
+            stack.append(self._buf[pos:pos + size])
+            pos += size
+        return stack
+
+    def is_coinbase(self):
+        return self.prevout_n == 0xffffffff and not any(self._buf[self._start:self._start + 32])
+
+
+class TxView():
+    """Transacción dentro de un buffer. Al construirla solo se recorren los
+    tamaños para ubicar cada campo; el resto se decodifica al leerlo."""
+    __slots__ = ("_buf", "_start", "_end", "_body", "_witness_start",
+                 "_inputs", "_outputs", "_witnesses", "_txid", "_wtxid")
+
+    def __init__(self, buf, start=0):
+        buf = memoryview(buf)
+        self._buf = buf
+        self._start = start
+        pos = start + 4
+        segwit = buf[pos] == 0 and buf[pos + 1] != 0
+        if segwit:
+            pos += 2
+        # Inicio del cuerpo sin testigo: entradas y salidas
+        self._body = pos
+        count, pos = read_compact_size(buf, pos)
+        self._inputs = []
+        for _ in range(count):
+            script_size, script_start = read_compact_size(buf, pos + 36)
+            self._inputs.append((pos, script_start, script_start + script_size))
+            pos = script_start + script_size + 4
+        count, pos = read_compact_size(buf, pos)
+        self._outputs = []
+        for _ in range(count):
+            script_size, script_start = read_compact_size(buf, pos + 8)
+            self._outputs.append((pos, script_start, script_start + script_size))
+            pos = script_start + script_size
+        self._witness_start = pos
+        self._witnesses = None
+        if segwit:
+            self._witnesses = []
+            for _ in range(len(self._inputs)):
+                wit_start = pos
+                items, pos = read_compact_size(buf, pos)
+                for _ in range(items):
+                    size, pos = read_compact_size(buf, pos)
+                    pos += size
+                self._witnesses.append((wit_start, pos))
+        self._end = pos + 4
+        self._txid = None
+        self._wtxid = None
+
+    @property
+    def size(self):
+        return self._end - self._start
+
+    @property
+    def raw(self):
+        return self._buf[self._start:self._end]
+
+    def has_witness(self):
+        return self._witnesses is not None
+
+    @property
+    def version(self):
+        return struct.unpack_from("<i", self._buf, self._start)[0]
+
+    @property
+    def locktime(self):
+        return struct.unpack_from("<I", self._buf, self._end - 4)[0]
+
+    @property
+    def inputs(self):
+        witnesses = self._witnesses or [None] * len(self._inputs)
+        return [InputView(self._buf, start, script_start, script_end, witness)
+                for (start, script_start, script_end), witness in zip(self._inputs, witnesses)]
+
+    @property
+    def outputs(self):
+        return [OutputView(self._buf, *offsets) for offsets in self._outputs]
+
+    @property
+    def num_inputs(self):
+        return len(self._inputs)
+
+    @property
+    def num_outputs(self):
+        return len(self._outputs)
+
+    def output(self, n):
+        return OutputView(self._buf, *self._outputs[n])
+
+    def stripped_size(self):
+        """Tamaño sin marcador, bandera ni testigos"""
+        if self._witnesses is None:
+            return self.size
+        return 4 + (self._witness_start - self._body) + 4
+
+    def weight(self):
+        return self.stripped_size() * (WITNESS_SCALE_FACTOR - 1) + self.size
+
+    def vsize(self):
+        return -(-self.weight() // WITNESS_SCALE_FACTOR)
+
+    @property
+    def txid(self):
+        if self._txid is None:
+            if self._witnesses is None:
+                data = self.raw
+            else:
+                buf = self._buf
+                data = (buf[self._start:self._start + 4].tobytes() +
+                        buf[self._body:self._witness_start].tobytes() +
+                        buf[self._end - 4:self._end].tobytes())
+            self._txid = hash256(data)[::-1].hex()
+        return self._txid
+
+    @property
+    def wtxid(self):
+        if self._wtxid is None:
+            self._wtxid = hash256(self.raw)[::-1].hex() if self._witnesses is not None else self.txid
+        return self._wtxid
+
+
+def iter_transactions(buf, count, pos=0):
+    """Generador de count TxView consecutivas desde buf[pos]"""
+    buf = memoryview(buf)
+    for _ in range(count):
+        tx = TxView(buf, pos)
+        pos = tx._end
+        yield tx
+
+
+class BlockView():
+    """Bloque serializado: encabezado de 80 bytes y transacciones"""
+    __slots__ = ("_buf", "_num_txs", "_txs_start", "_hash")
+
+    def __init__(self, buf):
+        self._buf = memoryview(buf)
+        self._num_txs, self._txs_start = read_compact_size(self._buf, 80)
+        self._hash = None
+
+    @property
+    def hash(self):
+        if self._hash is None:
+            self._hash = hash256(self._buf[:80])[::-1].hex()
+        return self._hash
+
+    @property
+    def version(self):
+        return struct.unpack_from("<i", self._buf, 0)[0]
+
+    @property
+    def prev_hash(self):
+        return bytes(self._buf[4:36])[::-1].hex()
+
+    @property
+    def merkle_root(self):
+        return bytes(self._buf[36:68])[::-1].hex()
+
+    @property
+    def time(self):
+        return struct.unpack_from("<I", self._buf, 68)[0]
+
+    @property
+    def bits(self):
+        return struct.unpack_from("<I", self._buf, 72)[0]
+
+    @property
+    def nonce(self):
+        return struct.unpack_from("<I", self._buf, 76)[0]
+
+    @property
+    def num_transactions(self):
+        return self._num_txs
+
+    def transactions(self):
+        return iter_transactions(self._buf, self._num_txs, self._txs_start)
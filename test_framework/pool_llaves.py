@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Pool de pares de llaves generados por adelantado, con una tabla de base
+fija para multiplicar por G.
+
+ECKey().generate() seguido de get_pubkey() hace una multiplicación de punto
+genérica en Python puro (256 duplicaciones y sumas). Como el punto base
+siempre es G se puede precalcular una tabla por ventanas: con ventanas de 8
+bits, tabla[i][j] = j * 2^(8i) * G, y k * G es la suma de una entrada por
+cada byte de k, 32 sumas y ninguna duplicación. Los resultados de un lote se
+pasan a coordenadas afines con una sola inversión modular (truco de
+Montgomery).
+
+KeyPool genera lotes en procesos de fondo mientras la prueba consume llaves,
+y puede guardar en disco las que no se usaron para que la siguiente ejecución
+empiece con el pool lleno.
+
+Uso:
+    with KeyPool("llaves.pool") as pool:
+        key, pubkey = pool.get()            # ECKey y pubkey comprimida
+        signer.add_key(key, pubkey=pubkey)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import multiprocessing
+import os
+import secrets
+import threading
+from collections import deque
+from functools import lru_cache
+
+from test_framework.key import ECKey
+
+# Parámetros de secp256k1
+FIELD_P = 2**256 - 2**32 - 977
+ORDER_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G_X = 0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798
+G_Y = 0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8
+
+WINDOW_BITS = 8
+# Pares por lote que genera cada proceso y tamaño de un registro en disco:
+# llave privada de 32 bytes y pubkey comprimida de 33
+BATCH_SIZE = 256
+RECORD_SIZE = 32 + 33
+INFINITY = (0, 1, 0)
+
+
+def _double(point):
+    x, y, z = point
+    if z == 0 or y == 0:
+        return INFINITY
+    yy = y * y % FIELD_P
+    s = 4 * x * yy % FIELD_P
+    m = 3 * x * x % FIELD_P
+    x3 = (m * m - 2 * s) % FIELD_P
+    y3 = (m * (s - x3) - 8 * yy * yy) % FIELD_P
+    return x3, y3, 2 * y * z % FIELD_P
+
+
+def _add_affine(point, x2, y2):
+    """Suma de un punto jacobiano y uno afín"""
+    x1, y1, z1 = point
+    if z1 == 0:
+        return x2, y2, 1
+    zz = z1 * z1 % FIELD_P
+    h = (x2 * zz - x1) % FIELD_P
+    r = (y2 * zz * z1 - y1) % FIELD_P
+    if h == 0:
+        return _double(point) if r == 0 else INFINITY
+    hh = h * h % FIELD_P
+    hhh = h * hh % FIELD_P
+    v = x1 * hh % FIELD_P
+    x3 = (r * r - hhh - 2 * v) % FIELD_P
+    y3 = (r * (v - x3) - y1 * hhh) % FIELD_P
+    return x3, y3, z1 * h % FIELD_P
+
+
+def to_affine(points):
+    """Puntos jacobianos a (x, y) con una sola inversión (truco de
+    Montgomery): se invierte el producto de todas las z y se despeja cada
+    inverso con los productos parciales"""
+    prefix = []
+    acc = 1
+    for _, _, z in points:
+        prefix.append(acc)
+        acc = acc * z % FIELD_P
+    inv = pow(acc, -1, FIELD_P)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        x, y, z = points[i]
+        z_inv = inv * prefix[i] % FIELD_P
+        inv = inv * z % FIELD_P
+        zz = z_inv * z_inv % FIELD_P
+        result[i] = (x * zz % FIELD_P, y * zz * z_inv % FIELD_P)
+    return result
+
+
+def compress(x, y):
+    return bytes([2 + (y & 1)]) + x.to_bytes(32, "big")
+
+
+@lru_cache(maxsize=None)
+def fixed_base_table(window=WINDOW_BITS):
+    """tabla[i][j] = j * 2^(window * i) * G en coordenadas afines, j = 0 es
+    None. Con 8 bits son 32 filas de 255 puntos."""
+    size = 1 << window
+    table = []
+    base = (G_X, G_Y, 1)
+    for _ in range(-(-256 // window)):
+        bx, by = to_affine([base])[0]
+        row = [(bx, by, 1)]
+        for _ in range(size - 2):
+            row.append(_add_affine(row[-1], bx, by))
+        table.append([None] + to_affine(row))
+        for _ in range(window):
+            base = _double(base)
+    return table
+
+
+def mul_g(k, window=WINDOW_BITS):
+    """k * G como punto jacobiano, una suma por ventana de k"""
+    table = fixed_base_table(window)
+    mask = (1 << window) - 1
+    point = INFINITY
+    for row in table:
+        digit = k & mask
+        if digit:
+            point = _add_affine(point, *row[digit])
+        k >>= window
+    return point
+
+
+def pubkeys_batch(privkeys, window=WINDOW_BITS):
+    """Pubkeys comprimidas de una lista de llaves privadas (enteros)"""
+    return [compress(x, y) for x, y in to_affine([mul_g(k, window) for k in privkeys])]
+
+
+def generate_batch(count=BATCH_SIZE):
+    """count pares (privada de 32 bytes, pubkey comprimida). Se ejecuta en
+    los procesos del pool; cada uno arma su tabla la primera vez."""
+    privkeys = [secrets.randbelow(ORDER_N - 1) + 1 for _ in range(count)]
+    pubkeys = pubkeys_batch(privkeys)
+    return [(k.to_bytes(32, "big"), pubkey) for k, pubkey in zip(privkeys, pubkeys)]
+
+
+class KeyPool():
+    """Llaves generadas en procesos de fondo. get() regresa una ECKey y su
+    pubkey comprimida ya calculada; cuando quedan menos de low_water se
+    piden más lotes sin bloquear a quien consume."""
+
+    def __init__(self, path=None, workers=None, batch_size=BATCH_SIZE, low_water=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.low_water = low_water if low_water is not None else self.workers * batch_size
+        self._keys = deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._pending = 0
+        self._error = None
+        self._procs = None
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _load(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        assert len(data) % RECORD_SIZE == 0, "archivo de llaves corrupto: {}".format(path)
+        for i in range(0, len(data), RECORD_SIZE):
+            self._keys.append((data[i:i + 32], data[i + 32:i + RECORD_SIZE]))
+
+    def save(self, path=None):
+        """Guardar las llaves que no se han usado, regresa cuántas"""
+        path = path or self.path
+        with self._lock:
+            records = b"".join(priv + pub for priv, pub in self._keys)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(records)
+        os.replace(tmp, path)
+        return len(records) // RECORD_SIZE
+
+    def _on_batch(self, batch):
+        with self._ready:
+            self._keys.extend(batch)
+            self._pending -= 1
+            self._ready.notify_all()
+
+    def _on_error(self, error):
+        # Se ejecuta en un hilo del pool, el error se relanza en get()
+        with self._ready:
+            self._pending -= 1
+            self._error = error
+            self._ready.notify_all()
+
+    def refill(self, count=None):
+        """Pedir en segundo plano los lotes que falten para tener count
+        llaves (por defecto low_water más un lote por proceso)"""
+        if count is None:
+            count = self.low_water + self.workers * self.batch_size
+        with self._lock:
+            if self._procs is None:
+                self._procs = multiprocessing.Pool(self.workers)
+            missing = count - len(self._keys) - self._pending * self.batch_size
+            batches = max(0, -(-missing // self.batch_size))
+            self._pending += batches
+        for _ in range(batches):
+            self._procs.apply_async(generate_batch, (self.batch_size,),
+                                    callback=self._on_batch, error_callback=self._on_error)
+
+    def get(self):
+        """ECKey comprimida y su pubkey en bytes"""
+        if len(self._keys) < self.low_water:
+            self.refill()
+        with self._ready:
+            while not self._keys:
+                if self._error is not None:
+                    raise self._error
+                assert self._pending > 0, "el pool de llaves no tiene lotes pendientes"
+                self._ready.wait()
+            priv, pubkey = self._keys.popleft()
+        key = ECKey()
+        key.set(priv, True)
+        return key, pubkey
+
+    def take(self, count):
+        """Lista de count pares (ECKey, pubkey)"""
+        self.refill(count + self.low_water)
+        return [self.get() for _ in range(count)]
+
+    def close(self):
+        """Terminar los procesos. Si hay archivo, antes se espera a los lotes
+        en curso y se guardan las llaves restantes, así la siguiente ejecución
+        empieza con el pool lleno."""
+        if self.path is not None:
+            with self._ready:
+                while self._pending > 0 and self._error is None:
+                    self._ready.wait()
+            self.save()
+        if self._procs is not None:
+            self._procs.terminate()
+            self._procs.join()
+            self._procs = None
+        with self._lock:
+            self._pending = 0
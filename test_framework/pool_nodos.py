@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Pool de nodos bitcoind de regtest ya arrancados que los ejemplos toman
+prestados en lugar de arrancar los suyos.
+
+Cada ejecución de un ejemplo arranca sus nodos, espera a que el RPC esté
+listo y los detiene al final; en cientos de iteraciones ese arranque es la
+mayor parte del tiempo. Con este módulo los nodos se arrancan una vez con
+la línea de comandos y quedan corriendo:
+
+    ./pool_nodos.py start --size=4
+    ./pool_nodos.py start --size=2 --args=-whitelist=noban@127.0.0.1
+    ./pool_nodos.py status
+    ./pool_nodos.py stop
+
+Cada nodo ocupa un directorio del pool (slot) con su datadir y un
+state.json. Un ejemplo con NodePoolMixin y --node-pool=DIR toma los nodos
+que necesita (mismos argumentos que sus extra_args) bloqueando el archivo
+lock de cada slot con flock; si el proceso muere el bloqueo se libera solo.
+Al devolverlo, el nodo se regresa a su punto de control: se desconectan los
+pares, se descargan y borran las wallets y se invalida el primer bloque
+después del punto de control, lo que saca del mempool todo lo que dependía
+de esos bloques. Si algo no cuadra (la punta, el mempool, las wallets), el
+nodo ya se usó max_uses veces o acumula más de max_tips puntas de cadena
+invalidadas, se recicla: se detiene, se borra su datadir y se arranca de
+nuevo.
+
+Uso:
+    class ExampleTest(TimingMixin, NodePoolMixin, SnapshotMixin, BitcoinTestFramework):
+        ...
+    ./mi_ejemplo_tx_P2PK.py --node-pool=/tmp/pool_nodos
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import argparse
+import fcntl
+import functools
+import json
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+
+from test_framework.authproxy import AuthServiceProxy, JSONRPCException
+from test_framework.util import get_rpc_proxy
+
+DEFAULT_POOL_DIR = os.path.join(tempfile.gettempdir(), "pool_nodos")
+# Fuera de los rangos de puertos que usa el framework (11000-21000)
+DEFAULT_PORT_BASE = 22000
+DEFAULT_MAX_USES = 200
+DEFAULT_MAX_TIPS = 100
+CHAIN = "regtest"
+# Configuración equivalente a la que escribe el framework para sus nodos
+NODE_CONF = [
+    "regtest=1",
+    "[regtest]",
+    "server=1",
+    "listen=1",
+    "bind=127.0.0.1",
+    "rpcbind=127.0.0.1",
+    "rpcallowip=127.0.0.1",
+    "keypool=1",
+    "discover=0",
+    "dnsseed=0",
+    "fixedseeds=0",
+    "listenonion=0",
+    "upnp=0",
+    "natpmp=0",
+    "peertimeout=999999999",
+    "printtoconsole=0",
+    "shrinkdebugfile=0",
+    "fallbackfee=0.0002",
+    "persistmempool=0",
+]
+START_TIMEOUT = 60
+STOP_TIMEOUT = 30
+LEASE_TIMEOUT = 60
+# Veces que se intenta invalidar hasta llegar al punto de control, por si
+# el nodo cambia a otra rama al invalidar la activa
+MAX_INVALIDATE_ROUNDS = 10
+
+
+def _read_json(path):
+    with open(path, encoding="utf8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def node_url(state):
+    """URL RPC del nodo del slot, con la cookie de su datadir"""
+    with open(os.path.join(state["datadir"], CHAIN, ".cookie"), encoding="utf8") as f:
+        cookie = f.read().strip()
+    return "http://{}@127.0.0.1:{}".format(cookie, state["rpc_port"])
+
+
+def node_rpc(state, timeout=30):
+    return AuthServiceProxy(node_url(state), timeout=timeout)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+def start_node(state, bitcoind):
+    """Crear el datadir del slot desde cero, arrancar bitcoind en su propia
+    sesión (sobrevive al proceso que lo arrancó) y esperar el RPC. Regresa
+    el estado con el pid y el punto de control (el génesis)."""
+    datadir = state["datadir"]
+    shutil.rmtree(datadir, ignore_errors=True)
+    os.makedirs(datadir)
+    conf = NODE_CONF + ["port={}".format(state["p2p_port"]), "rpcport={}".format(state["rpc_port"])]
+    with open(os.path.join(datadir, "bitcoin.conf"), "w", encoding="utf8") as f:
+        f.write("\n".join(conf) + "\n")
+    process = subprocess.Popen([bitcoind, "-datadir={}".format(datadir)] + state["args"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    state["pid"] = process.pid
+    rpc = wait_for_rpc(state, process)
+    genesis = rpc.getblockhash(0)
+    state.update(checkpoint={"height": 0, "hash": genesis}, uses=0, clean=True, started=time.time())
+    return state
+
+
+def wait_for_rpc(state, process=None, timeout=START_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise AssertionError("bitcoind del slot {} terminó al arrancar (código {})".format(
+                state["slot"], process.returncode))
+        try:
+            rpc = node_rpc(state)
+            rpc.getblockcount()
+            return rpc
+        except JSONRPCException as e:
+            # -28: el nodo todavía está cargando
+            if e.error["code"] != -28:
+                raise
+        except (OSError, ValueError):
+            # Sin cookie o sin puerto abierto todavía
+            pass
+        time.sleep(0.1)
+    raise AssertionError("El RPC del slot {} no respondió en {} segundos".format(state["slot"], timeout))
+
+
+def stop_node(state):
+    """Detener el nodo por RPC y, si no termina a tiempo, matarlo"""
+    pid = state.get("pid")
+    if not is_alive(pid):
+        return
+    try:
+        node_rpc(state).stop()
+    except (JSONRPCException, OSError, ValueError):
+        pass
+    deadline = time.time() + STOP_TIMEOUT
+    while is_alive(pid) and time.time() < deadline:
+        time.sleep(0.1)
+    if is_alive(pid):
+        os.kill(pid, signal.SIGKILL)
+
+
+def reset_node(rpc, state):
+    """Regresar el nodo a su punto de control: red, wallets, cadena y
+    mempool. Falla con AssertionError si no queda en el estado esperado."""
+    rpc.setmocktime(0)
+    rpc.setnetworkactive(True)
+    rpc.clearbanned()
+    for added in rpc.getaddednodeinfo():
+        rpc.addnode(added["addednode"], "remove")
+    for peer in rpc.getpeerinfo():
+        rpc.disconnectnode(nodeid=peer["id"])
+
+    for wallet in rpc.listwallets():
+        rpc.unloadwallet(wallet)
+    # Sin wallets cargadas se puede borrar el directorio completo, la
+    # siguiente ejecución crea las suyas
+    walletdir = os.path.join(state["datadir"], CHAIN, "wallets")
+    if os.path.isdir(walletdir):
+        shutil.rmtree(walletdir)
+        os.makedirs(walletdir)
+
+    checkpoint = state["checkpoint"]
+    for _ in range(MAX_INVALIDATE_ROUNDS):
+        height = rpc.getblockcount()
+        if height <= checkpoint["height"]:
+            break
+        assert rpc.getblockhash(checkpoint["height"]) == checkpoint["hash"], \
+            "la cadena activa ya no contiene el punto de control"
+        rpc.invalidateblock(rpc.getblockhash(checkpoint["height"] + 1))
+    assert rpc.getbestblockhash() == checkpoint["hash"], "el nodo no regresó al punto de control"
+    # Todo lo que había en el mempool gastaba coinbases de los bloques
+    # invalidados, o descendientes suyos
+    assert rpc.getmempoolinfo()["size"] == 0, "el mempool no quedó vacío"
+    assert rpc.listwallets() == [], "quedaron wallets cargadas"
+
+
+def health_problem(rpc, state, config):
+    """Motivo para reciclar el nodo, None si está sano"""
+    if state["uses"] >= config["max_uses"]:
+        return "se usó {} veces".format(state["uses"])
+    tips = len(rpc.getchaintips())
+    if tips > config["max_tips"]:
+        return "tiene {} puntas de cadena".format(tips)
+    return None
+
+
+def handshake_peer(node, addr):
+    """Par de node con dirección addr que ya terminó el handshake (version y
+    verack), como espera connect_nodes del framework, o None"""
+    for peer in node.getpeerinfo():
+        if peer["addr"] == addr and peer["version"] != 0 and peer["bytesrecv_per_msg"].get("verack", 0) >= 21:
+            return peer
+    return None
+
+class Lease():
+    """Un slot tomado: su estado, el bloqueo flock y el puerto P2P"""
+
+    def __init__(self, pool, slot, lock_file, state):
+        self.pool = pool
+        self.slot = slot
+        self._lock_file = lock_file
+        self.state = state
+
+    @property
+    def p2p_port(self):
+        return self.state["p2p_port"]
+
+    @property
+    def url(self):
+        return node_url(self.state)
+
+    def rpc(self, timeout=60):
+        return node_rpc(self.state, timeout)
+
+    def prepare(self):
+        """Revisar el nodo antes de usarlo. Si el último que lo tomó no lo
+        devolvió (se murió el proceso) o el nodo no responde, se reinicia o
+        se recicla aquí."""
+        try:
+            if not is_alive(self.state.get("pid")):
+                raise AssertionError("el proceso no está corriendo")
+            rpc = self.rpc()
+            if not self.state.get("clean"):
+                reset_node(rpc, self.state)
+            assert rpc.getbestblockhash() == self.state["checkpoint"]["hash"], "no está en el punto de control"
+        except (AssertionError, JSONRPCException, OSError, ValueError) as e:
+            self.pool.log("Reciclando el slot {}: {}".format(self.slot, e))
+            self.pool.recycle(self.state)
+        self.state["clean"] = False
+        self.state["uses"] += 1
+        self.pool.save_state(self.state)
+
+    def release(self):
+        """Regresar el nodo al punto de control y liberar el slot; si el
+        reinicio falla o el nodo ya no está sano se recicla"""
+        try:
+            rpc = self.rpc()
+            reset_node(rpc, self.state)
+            problem = health_problem(rpc, self.state, self.pool.config)
+        except (AssertionError, JSONRPCException, OSError, ValueError) as e:
+            problem = str(e)
+        if problem is not None:
+            self.pool.log("Reciclando el slot {}: {}".format(self.slot, problem))
+            self.pool.recycle(self.state)
+        self.state["clean"] = True
+        self.pool.save_state(self.state)
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+
+class NodePool():
+    """Directorio del pool: pool.json con la configuración y un
+    subdirectorio slotN por nodo"""
+
+    def __init__(self, path=DEFAULT_POOL_DIR, log=print):
+        self.path = path
+        self.log = log
+        config_path = os.path.join(path, "pool.json")
+        self.config = _read_json(config_path) if os.path.exists(config_path) else None
+
+    def _slot_dir(self, slot):
+        return os.path.join(self.path, "slot{}".format(slot))
+
+    def slots(self):
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(int(name[4:]) for name in os.listdir(self.path)
+                      if name.startswith("slot") and name[4:].isdigit())
+
+    def load_state(self, slot):
+        return _read_json(os.path.join(self._slot_dir(slot), "state.json"))
+
+    def save_state(self, state):
+        _write_json(os.path.join(self._slot_dir(state["slot"]), "state.json"), state)
+
+    def create(self, size, args, bitcoind, port_base=DEFAULT_PORT_BASE,
+               max_uses=DEFAULT_MAX_USES, max_tips=DEFAULT_MAX_TIPS):
+        """Agregar size nodos arrancados con args. La configuración del pool
+        se fija la primera vez."""
+        os.makedirs(self.path, exist_ok=True)
+        if self.config is None:
+            self.config = {"bitcoind": os.path.realpath(bitcoind) if os.path.exists(bitcoind) else bitcoind,
+                           "port_base": port_base, "max_uses": max_uses, "max_tips": max_tips}
+            _write_json(os.path.join(self.path, "pool.json"), self.config)
+        first = max(self.slots(), default=-1) + 1
+        for slot in range(first, first + size):
+            os.makedirs(self._slot_dir(slot))
+            state = {
+                "slot": slot,
+                "args": list(args),
+                "datadir": os.path.join(self._slot_dir(slot), "datadir"),
+                "p2p_port": self.config["port_base"] + 2 * slot,
+                "rpc_port": self.config["port_base"] + 2 * slot + 1,
+            }
+            self.save_state(start_node(state, self.config["bitcoind"]))
+            self.log("Slot {} arrancado: pid {}, puerto P2P {}".format(slot, state["pid"], state["p2p_port"]))
+
+    def recycle(self, state):
+        stop_node(state)
+        start_node(state, self.config["bitcoind"])
+        self.save_state(state)
+
+    def _try_lock(self, slot):
+        lock_file = open(os.path.join(self._slot_dir(slot), "lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def lease(self, count, args, timeout=LEASE_TIMEOUT):
+        """Tomar count nodos arrancados con exactamente args. Regresa None si
+        el pool no tiene suficientes nodos con esos argumentos; si los tiene
+        pero están ocupados espera hasta timeout."""
+        candidates = [slot for slot in self.slots() if self.load_state(slot)["args"] == list(args)]
+        if len(candidates) < count:
+            return None
+        deadline = time.time() + timeout
+        leases = []
+        while True:
+            for slot in candidates:
+                if len(leases) == count:
+                    break
+                if any(lease.slot == slot for lease in leases):
+                    continue
+                lock_file = self._try_lock(slot)
+                if lock_file is not None:
+                    leases.append(Lease(self, slot, lock_file, self.load_state(slot)))
+            if len(leases) == count:
+                break
+            if time.time() > deadline:
+                for lease in leases:
+                    lease.release()
+                raise AssertionError("No se liberaron {} nodos del pool en {} segundos".format(count, timeout))
+            time.sleep(0.2)
+        for lease in leases:
+            lease.prepare()
+        return leases
+
+    def status(self):
+        """Una línea por slot: pid, si está vivo, si está tomado, usos y
+        altura"""
+        lines = []
+        for slot in self.slots():
+            state = self.load_state(slot)
+            lock_file = self._try_lock(slot)
+            leased = lock_file is None
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            height = "-"
+            if is_alive(state.get("pid")):
+                try:
+                    height = node_rpc(state, timeout=5).getblockcount()
+                except (JSONRPCException, OSError, ValueError):
+                    height = "?"
+            lines.append("slot{:<3} pid={:<8} vivo={:<5} tomado={:<5} usos={:<5} altura={} args={}".format(
+                slot, state.get("pid"), str(is_alive(state.get("pid"))), str(leased),
+                state.get("uses"), height, " ".join(state["args"])))
+        return lines
+
+    def stop(self, force=False):
+        """Detener todos los nodos que no estén tomados (o todos con force)
+        y borrar el pool si ya no queda ninguno"""
+        remaining = 0
+        for slot in self.slots():
+            lock_file = self._try_lock(slot)
+            if lock_file is None and not force:
+                self.log("Slot {} tomado, no se detiene".format(slot))
+                remaining += 1
+                continue
+            stop_node(self.load_state(slot))
+            shutil.rmtree(self._slot_dir(slot))
+            if lock_file is not None:
+                lock_file.close()
+        if remaining == 0 and os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+
+
+class NodePoolMixin():
+    """Mixin para BitcoinTestFramework: con --node-pool=DIR los nodos de la
+    prueba se toman del pool en lugar de arrancarse, y al terminar se
+    devuelven reiniciados. Va antes de SnapshotMixin y de
+    BitcoinTestFramework en la lista de clases base. Sin la opción, o si el
+    pool no tiene nodos con los extra_args de la prueba, todo funciona como
+    siempre."""
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--node-pool", dest="node_pool", default=None,
+                            help="Directorio de un pool de nodos de pool_nodos.py, p. ej. {}".format(DEFAULT_POOL_DIR))
+
+    def setup_nodes(self):
+        self._leases = None
+        if getattr(self.options, "node_pool", None):
+            extra_args = getattr(self, "extra_args", None) or [[]] * self.num_nodes
+            pool = NodePool(self.options.node_pool, log=self.log.info)
+            # Todos los nodos de la prueba deben tener los mismos argumentos
+            if all(args == extra_args[0] for args in extra_args):
+                self._leases = pool.lease(self.num_nodes, extra_args[0])
+            if self._leases is None:
+                self.log.info("El pool {} no tiene {} nodos con {}, se arrancan nodos nuevos".format(
+                    self.options.node_pool, self.num_nodes, extra_args))
+        if self._leases is None:
+            return super().setup_nodes()
+        self.add_nodes(self.num_nodes, [lease.state["args"] for lease in self._leases])
+        self.start_nodes()
+        self.snapshot_restored = False
+        if getattr(self, "_requires_wallet", False):
+            self.import_deterministic_coinbase_privkeys()
+
+    def start_nodes(self, *args, **kwargs):
+        """Con nodos del pool no se arranca nada: cada TestNode se conecta por
+        RPC al nodo de su slot y sus conexiones P2P van al puerto del slot"""
+        if not getattr(self, "_leases", None):
+            return super().start_nodes(*args, **kwargs)
+        for node, lease in zip(self.nodes, self._leases):
+            node.url = lease.url
+            node.rpc = get_rpc_proxy(node.url, node.index, timeout=node.rpc_timeout, coveragedir=node.coverage_dir)
+            node.rpc_connected = True
+            node.running = True
+            node.add_p2p_connection = functools.partial(node.add_p2p_connection, dstport=lease.p2p_port)
+            self.log.info("Nodo {} tomado del slot {} del pool".format(node.index, lease.slot))
+
+    def connect_nodes(self, a, b):
+        if not getattr(self, "_leases", None):
+            return super().connect_nodes(a, b)
+        from_node, to_node = self.nodes[a], self.nodes[b]
+        target = "127.0.0.1:{}".format(self._leases[b].p2p_port)
+        from_node.addnode(target, "onetry")
+        # Esperar el handshake de esta conexión y no el de otro par: en a es
+        # el par con la dirección de b y en b el que llega desde el puerto
+        # local (addrbind) que a usó para conectarse
+        self.wait_until(lambda: handshake_peer(from_node, target) is not None)
+        addrbind = handshake_peer(from_node, target)["addrbind"]
+        self.wait_until(lambda: handshake_peer(to_node, addrbind) is not None)
+
+    def prepare_chain(self, build_fn):
+        """Los nodos del pool parten de su punto de control, no se usan los
+        snapshots"""
+        if not getattr(self, "_leases", None):
+            return super().prepare_chain(build_fn)
+        return build_fn()
+
+    def stop_nodes(self, *args, **kwargs):
+        if not getattr(self, "_leases", None):
+            return super().stop_nodes(*args, **kwargs)
+        for node, lease in zip(self.nodes, self._leases):
+            node.disconnect_p2ps()
+            del node.add_p2p_connection
+            node.rpc = None
+            node.rpc_connected = False
+            node.running = False
+            lease.release()
+            self.log.info("Nodo {} devuelto al slot {} del pool".format(node.index, lease.slot))
+        self._leases = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("command", choices=["start", "status", "stop"])
+    parser.add_argument("--dir", default=DEFAULT_POOL_DIR, help="Directorio del pool")
+    parser.add_argument("--size", type=int, default=4, help="Nodos a agregar con start")
+    parser.add_argument("--args", action="append", default=[],
+                        help="Argumento de bitcoind de los nodos nuevos, se puede repetir")
+    parser.add_argument("--bitcoind", default=os.getenv("BITCOIND", "bitcoind"),
+                        help="Binario de bitcoind (default: $BITCOIND o bitcoind)")
+    parser.add_argument("--port-base", type=int, default=DEFAULT_PORT_BASE)
+    parser.add_argument("--max-uses", type=int, default=DEFAULT_MAX_USES,
+                        help="Usos después de los cuales se recicla un nodo")
+    parser.add_argument("--max-tips", type=int, default=DEFAULT_MAX_TIPS,
+                        help="Puntas de cadena (ramas invalidadas) después de las cuales se recicla un nodo")
+    parser.add_argument("--force", action="store_true", help="Con stop, detener también los nodos tomados")
+    args = parser.parse_args()
+
+    pool = NodePool(args.dir)
+    if args.command == "start":
+        pool.create(args.size, args.args, args.bitcoind, args.port_base, args.max_uses, args.max_tips)
+    elif args.command == "stop":
+        pool.stop(args.force)
+    for line in pool.status():
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Lotes de llamadas JSON-RPC sobre los nodos de los ejemplos.
+
+Cada llamada a self.nodes[i] es una petición HTTP completa. RPCBatch encola
+las llamadas independientes y las envía en un solo lote JSON-RPC con el
+método batch() de AuthServiceProxy. Cada llamada regresa un RPCFuture que se
+resuelve de forma perezosa: el lote se envía la primera vez que se pide un
+resultado (o al salir del bloque with).
+
+Uso:
+    with RPCBatch(self.nodes[0]) as batch:
+        info = batch.getnetworkinfo()
+        mempool = batch.getrawmempool()
+    relayfee = info.result()["relayfee"]
+
+    # También sobre la wallet de un nodo (get_wallet_rpc)
+    batch = RPCBatch(self.nodes[1].get_wallet_rpc("cosigner"))
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+from concurrent.futures import ThreadPoolExecutor
+
+from test_framework.authproxy import JSONRPCException
+from test_framework.test_node import TestNode
+
+
+def rpc_proxy(node):
+    """Proxy RPC de un TestNode. Cualquier otro objeto ya es un proxy (la
+    wallet de get_wallet_rpc, un get_rpc_proxy o un TimedRPC) y se usa tal
+    cual: en un proxy el atributo .rpc se leería como el método "rpc"."""
+    if isinstance(node, TestNode):
+        return node.rpc
+    return node
+
+
+class RPCFuture():
+    """Resultado pendiente de una llamada encolada en un RPCBatch"""
+
+    def __init__(self, batch, method):
+        self.method = method
+        self._batch = batch
+        self._done = False
+        self._result = None
+        self._error = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        """Enviar el lote si no se ha enviado y regresar el resultado, o
+        lanzar JSONRPCException si el nodo regresó un error"""
+        if not self._done:
+            self._batch.flush()
+        if self._error is not None:
+            raise JSONRPCException(self._error)
+        return self._result
+
+    def _set(self, result, error):
+        self._result = result
+        self._error = error
+        self._done = True
+
+
+class RPCBatch():
+    """Fachada sobre un nodo que encola llamadas y las envía en lotes"""
+
+    def __init__(self, node):
+        self._proxy = rpc_proxy(node)
+        self._pending = []
+        # Llamadas encoladas y peticiones HTTP enviadas
+        self.calls = 0
+        self.round_trips = 0
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self.call(method, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def call(self, method, *args, **kwargs):
+        request = getattr(self._proxy, method).get_request(*args, **kwargs)
+        future = RPCFuture(self, method)
+        self._pending.append((request, future))
+        self.calls += 1
+        return future
+
+    def flush(self):
+        """Enviar todas las llamadas pendientes en una sola petición"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        responses = self._proxy.batch([request for request, _ in pending])
+        self.round_trips += 1
+        # El servidor puede responder en cualquier orden, se asocian por id
+        by_id = {response["id"]: response for response in responses}
+        for request, future in pending:
+            response = by_id[request["id"]]
+            future._set(response.get("result"), response.get("error"))
+
+    @property
+    def saved_round_trips(self):
+        return self.calls - self.round_trips
+
+
+def collect_pubkeys(nodes, count=1, address_type=None):
+    """Modo masivo para recolectar llaves de varios nodos.
+
+    Por cada nodo se envía un lote con count getnewaddress y otro con count
+    getaddressinfo, y los nodos se atienden en paralelo (cada uno tiene su
+    propia conexión HTTP). Regresa la lista de getaddressinfo por nodo y las
+    estadísticas: llamadas, peticiones HTTP, peticiones ahorradas contra las
+    2 * count * len(nodes) llamadas una por una y la profundidad de la ruta
+    crítica."""
+    args = [] if address_type is None else ["", address_type]
+
+    def collect(node):
+        batch = RPCBatch(node)
+        addresses = [batch.getnewaddress(*args) for _ in range(count)]
+        infos = [batch.getaddressinfo(a.result()) for a in addresses]
+        return [info.result() for info in infos], batch
+
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        results = list(executor.map(collect, nodes))
+    calls = sum(batch.calls for _, batch in results)
+    round_trips = sum(batch.round_trips for _, batch in results)
+    stats = {
+        "calls": calls,
+        "round_trips": round_trips,
+        "saved_round_trips": calls - round_trips,
+        # Las peticiones a distintos nodos van en paralelo, la ruta crítica
+        # son los lotes dependientes del nodo que más envió
+        "sequential_stages": max(batch.round_trips for _, batch in results),
+    }
+    return [infos for infos, _ in results], stats
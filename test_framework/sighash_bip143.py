@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Sighash de segwit v0 (BIP143) con caché de hashPrevouts, hashSequence y
+hashOutputs para las seis combinaciones de banderas SIGHASH.
+
+SegwitV0SignatureHash del framework vuelve a hashear todas las entradas y
+salidas por cada entrada que se firma, así que firmar una transacción de n
+entradas cuesta O(n^2). BIP143 se diseñó para que esos hashes intermedios
+se compartan entre todas las entradas; aquí se calculan una sola vez por
+transacción y solo cuando alguna bandera los necesita:
+
+| Bandera               | hashPrevouts | hashSequence | hashOutputs     |
+|-----------------------|--------------|--------------|-----------------|
+| ALL                   | sí           | sí           | todas           |
+| NONE                  | sí           | no           | no              |
+| SINGLE                | sí           | no           | la del índice   |
+| ALL|ANYONECANPAY      | no           | no           | todas           |
+| NONE|ANYONECANPAY     | no           | no           | no              |
+| SINGLE|ANYONECANPAY   | no           | no           | la del índice   |
+
+depends_on(hashtype) da los componentes de la tabla que usa una bandera. Si
+la transacción cambia, invalidate(*components) borra solo los hashes
+afectados; por ejemplo agregar una salida no invalida hashPrevouts ni
+hashSequence, y las firmas con NONE|ANYONECANPAY no necesitan rehacerse.
+
+Uso:
+    cache = SegwitV0Sighash(tx)
+    sighash = cache.sighash(i, script_code, amount, SIGHASH_ALL)
+    tx.vout.append(txout)
+    cache.invalidate(OUTPUTS)                  # hashPrevouts sigue en caché
+    stale = [h for h in SIGHASH_FLAGS if OUTPUTS in depends_on(h)]
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import struct
+
+from test_framework.messages import hash256, ser_string
+from test_framework.script import (SIGHASH_ALL, SIGHASH_ANYONECANPAY,
+                                   SIGHASH_NONE, SIGHASH_SINGLE)
+
+ZERO_HASH = bytes(32)
+
+# Las seis combinaciones de banderas que documenta SigHash.md
+SIGHASH_FLAGS = [
+    SIGHASH_ALL,
+    SIGHASH_NONE,
+    SIGHASH_SINGLE,
+    SIGHASH_ALL | SIGHASH_ANYONECANPAY,
+    SIGHASH_NONE | SIGHASH_ANYONECANPAY,
+    SIGHASH_SINGLE | SIGHASH_ANYONECANPAY,
+]
+
+# Componentes de la caché
+PREVOUTS = "prevouts"
+SEQUENCES = "sequences"
+OUTPUTS = "outputs"
+
+
+def depends_on(hashtype):
+    """Componentes de la caché que usa una bandera SIGHASH, según la tabla
+    de arriba. Con SINGLE, OUTPUTS es solo la salida del índice."""
+    base = hashtype & 0x1f
+    anyonecanpay = hashtype & SIGHASH_ANYONECANPAY
+    components = set()
+    if not anyonecanpay:
+        components.add(PREVOUTS)
+        if base != SIGHASH_SINGLE and base != SIGHASH_NONE:
+            components.add(SEQUENCES)
+    if base != SIGHASH_NONE:
+        components.add(OUTPUTS)
+    return components
+
+
+class SegwitV0Sighash():
+    """Sighash BIP143 de las entradas de una transacción con los hashes
+    compartidos en caché"""
+
+    def __init__(self, tx):
+        self.tx = tx
+        self._hash_prevouts = None
+        self._hash_sequence = None
+        self._hash_outputs = None
+        # índice de salida -> hash de esa salida, para SIGHASH_SINGLE
+        self._hash_single = {}
+
+    def invalidate(self, *components):
+        """Borrar de la caché los componentes indicados (PREVOUTS, SEQUENCES,
+        OUTPUTS) después de modificar la transacción. Sin argumentos borra
+        todo."""
+        components = set(components) or {PREVOUTS, SEQUENCES, OUTPUTS}
+        if PREVOUTS in components:
+            self._hash_prevouts = None
+        if SEQUENCES in components:
+            self._hash_sequence = None
+        if OUTPUTS in components:
+            self._hash_outputs = None
+            self._hash_single.clear()
+
+    def hash_prevouts(self):
+        if self._hash_prevouts is None:
+            self._hash_prevouts = hash256(b"".join(txin.prevout.serialize() for txin in self.tx.vin))
+        return self._hash_prevouts
+
+    def hash_sequence(self):
+        if self._hash_sequence is None:
+            self._hash_sequence = hash256(b"".join(struct.pack("<I", txin.nSequence) for txin in self.tx.vin))
+        return self._hash_sequence
+
+    def hash_outputs(self):
+        if self._hash_outputs is None:
+            self._hash_outputs = hash256(b"".join(txout.serialize() for txout in self.tx.vout))
+        return self._hash_outputs
+
+    def hash_single_output(self, index):
+        if index not in self._hash_single:
+            self._hash_single[index] = hash256(self.tx.vout[index].serialize())
+        return self._hash_single[index]
+
+    def sighash(self, index, script_code, amount, hashtype=SIGHASH_ALL):
+        """Mismo resultado que SegwitV0SignatureHash(script_code, tx, index,
+        hashtype, amount) del framework"""
+        components = depends_on(hashtype)
+        hash_prevouts = self.hash_prevouts() if PREVOUTS in components else ZERO_HASH
+        hash_sequence = self.hash_sequence() if SEQUENCES in components else ZERO_HASH
+        hash_outputs = ZERO_HASH
+        if OUTPUTS in components:
+            if hashtype & 0x1f != SIGHASH_SINGLE:
+                hash_outputs = self.hash_outputs()
+            elif index < len(self.tx.vout):
+                hash_outputs = self.hash_single_output(index)
+
+        txin = self.tx.vin[index]
+        return hash256(struct.pack("<i", self.tx.nVersion) + hash_prevouts + hash_sequence +
+                       txin.prevout.serialize() + ser_string(script_code) +
+                       struct.pack("<q", amount) + struct.pack("<I", txin.nSequence) +
+                       hash_outputs + struct.pack("<I", self.tx.nLockTime) +
+                       struct.pack("<I", hashtype))
+
+    def sighash_all_flags(self, index, script_code, amount):
+        """Diccionario bandera -> sighash con las seis combinaciones"""
+        return {hashtype: self.sighash(index, script_code, amount, hashtype) for hashtype in SIGHASH_FLAGS}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Sighash de taproot (BIP341) con los hashes compartidos precalculados.
+
+El mensaje que se firma en cada entrada taproot incluye sha_prevouts,
+sha_amounts, sha_scriptpubkeys, sha_sequences y sha_outputs, que son iguales
+para todas las entradas de la transacción. TaprootSignatureHash del framework
+los recalcula en cada llamada; TaprootSighash los calcula una sola vez (y
+solo si alguna bandera los necesita) y los comparte entre todas las entradas.
+
+Uso:
+    cache = TaprootSighash(tx, spent_outputs)
+    sighash = cache.sighash(i)                         # key path
+    sighash = cache.sighash(i, leaf_hash=leaf_hash)    # script path
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+import struct
+
+from test_framework.messages import ser_string
+from test_framework.script import (SIGHASH_ALL, SIGHASH_ANYONECANPAY,
+                                   SIGHASH_NONE, SIGHASH_SINGLE)
+
+SIGHASH_DEFAULT = 0
+TAPROOT_HASHTYPES = [SIGHASH_DEFAULT, SIGHASH_ALL, SIGHASH_NONE, SIGHASH_SINGLE,
+                     SIGHASH_ALL | SIGHASH_ANYONECANPAY,
+                     SIGHASH_NONE | SIGHASH_ANYONECANPAY,
+                     SIGHASH_SINGLE | SIGHASH_ANYONECANPAY]
+
+# Sin OP_CODESEPARATOR ejecutado la posición es 0xffffffff
+NO_CODESEPARATOR = 0xffffffff
+
+
+def tagged_hasher(tag):
+    """Regresa una función equivalente a TaggedHash(tag, data) del framework
+    que reutiliza el estado de SHA256 después de los dos hashes de la
+    etiqueta"""
+    tag_hash = hashlib.sha256(tag.encode()).digest()
+    midstate = hashlib.sha256(tag_hash + tag_hash)
+
+    def tagged_hash(data):
+        h = midstate.copy()
+        h.update(data)
+        return h.digest()
+    return tagged_hash
+
+
+tap_sighash = tagged_hasher("TapSighash")
+
+
+def sha256(data):
+    return hashlib.sha256(data).digest()
+
+
+class TaprootSighash():
+    """Sighash BIP341 de las entradas de una transacción. spent_outputs es la
+    lista de CTxOut que gasta cada entrada, taproot firma todos los montos y
+    scriptPubKeys gastados."""
+
+    def __init__(self, tx, spent_outputs):
+        assert len(tx.vin) == len(spent_outputs)
+        self.tx = tx
+        self.spent_outputs = spent_outputs
+        self._shared = None
+        self._sha_outputs = None
+
+    def invalidate(self):
+        """Borrar los hashes compartidos después de modificar la transacción"""
+        self._shared = None
+        self._sha_outputs = None
+
+    def shared_hashes(self):
+        """sha_prevouts + sha_amounts + sha_scriptpubkeys + sha_sequences"""
+        if self._shared is None:
+            self._shared = (
+                sha256(b"".join(txin.prevout.serialize() for txin in self.tx.vin)) +
+                sha256(b"".join(struct.pack("<q", txout.nValue) for txout in self.spent_outputs)) +
+                sha256(b"".join(ser_string(txout.scriptPubKey) for txout in self.spent_outputs)) +
+                sha256(b"".join(struct.pack("<I", txin.nSequence) for txin in self.tx.vin)))
+        return self._shared
+
+    def sha_outputs(self):
+        if self._sha_outputs is None:
+            self._sha_outputs = sha256(b"".join(txout.serialize() for txout in self.tx.vout))
+        return self._sha_outputs
+
+    def sighash(self, index, hashtype=SIGHASH_DEFAULT, leaf_hash=None,
+                codeseparator_pos=NO_CODESEPARATOR, annex=None):
+        """Mismo resultado que TaprootSignatureHash del framework. Con
+        leaf_hash se calcula el sighash del script path (BIP342)."""
+        assert hashtype in TAPROOT_HASHTYPES
+        output_type = SIGHASH_ALL if hashtype == SIGHASH_DEFAULT else hashtype & 3
+        anyonecanpay = hashtype & SIGHASH_ANYONECANPAY
+        msg = struct.pack("<B", hashtype) + struct.pack("<i", self.tx.nVersion) + struct.pack("<I", self.tx.nLockTime)
+        if not anyonecanpay:
+            msg += self.shared_hashes()
+        if output_type == SIGHASH_ALL:
+            msg += self.sha_outputs()
+        spend_type = (2 if leaf_hash is not None else 0) + (1 if annex is not None else 0)
+        msg += struct.pack("<B", spend_type)
+        if anyonecanpay:
+            txin = self.tx.vin[index]
+            spent = self.spent_outputs[index]
+            msg += (txin.prevout.serialize() + struct.pack("<q", spent.nValue) +
+                    ser_string(spent.scriptPubKey) + struct.pack("<I", txin.nSequence))
+        else:
+            msg += struct.pack("<I", index)
+        if annex is not None:
+            msg += sha256(ser_string(annex))
+        if output_type == SIGHASH_SINGLE:
+            assert index < len(self.tx.vout)
+            msg += sha256(self.tx.vout[index].serialize())
+        if leaf_hash is not None:
+            msg += leaf_hash + b"\x00" + struct.pack("<I", codeseparator_pos)
+        # Época 0
+        return tap_sighash(b"\x00" + msg)
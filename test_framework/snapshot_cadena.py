@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Caché de cadenas pre minadas (snapshots) compartida por los ejemplos.
+
+Los ejemplos usan setup_clean_chain = True y pasan la mayor parte del tiempo
+minando COINBASE_MATURITY + 1 bloques. Con SnapshotMixin la primera ejecución
+mina como siempre y guarda el directorio de la cadena de cada nodo (bloques,
+chainstate y wallets) en la caché del framework; las siguientes ejecuciones
+copian ese directorio antes de arrancar los nodos y no minan nada.
+
+La llave de la caché incluye el número de nodos, los extra_args, la receta
+de preparación y el binario de bitcoind, así que un cambio en cualquiera de
+ellos invalida el snapshot automáticamente.
+
+Uso:
+    class ExampleTest(SnapshotMixin, BitcoinTestFramework):
+        def run_test(self):
+            blocks = self.prepare_chain(lambda: self.generate(self.nodes[0], 101))
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+import json
+import os
+import shutil
+
+from test_framework.blocktools import COINBASE_MATURITY
+
+# Cambiar si cambia el formato de los snapshots
+SNAPSHOT_VERSION = 1
+
+# Archivos del directorio de la cadena que no se guardan en el snapshot,
+# son propios de cada ejecución
+IGNORED_FILES = ["*.lock", ".cookie", "debug.log", "bitcoind.pid", "peers.dat",
+                 "anchors.dat", "mempool.dat", "fee_estimates.dat", "db.log"]
+
+# La cadena restaurada puede tener bloques viejos, evitamos que el nodo se
+# considere en descarga inicial de bloques (IBD)
+MAX_TIP_AGE_ARG = "-maxtipage={}".format(10 * 365 * 24 * 60 * 60)
+
+
+class SnapshotMixin():
+    """Mixin para BitcoinTestFramework que restaura la cadena pre minada de la
+    caché en lugar de minarla en cada ejecución."""
+
+    def snapshot_recipe(self):
+        """Identificador de lo que hace la función de preparación. Los ejemplos
+        que preparan la cadena de otra forma deben sobrescribirlo."""
+        return "generate-{}".format(COINBASE_MATURITY + 1)
+
+    def snapshot_key(self, extra_args):
+        bitcoind = getattr(self.options, "bitcoind", None)
+        binary = None
+        if bitcoind and os.path.exists(bitcoind):
+            stat = os.stat(bitcoind)
+            binary = [os.path.realpath(bitcoind), stat.st_size, stat.st_mtime]
+        key = json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "recipe": self.snapshot_recipe(),
+            "chain": self.chain,
+            "num_nodes": self.num_nodes,
+            "extra_args": extra_args,
+            "descriptors": getattr(self.options, "descriptors", None),
+            "bitcoind": binary,
+        }, sort_keys=True)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def setup_nodes(self):
+        """Igual que en BitcoinTestFramework, pero restaurando el snapshot en
+        los directorios de los nodos antes de arrancarlos"""
+        extra_args = [[]] * self.num_nodes
+        if hasattr(self, "extra_args"):
+            extra_args = self.extra_args
+        self.snapshot_dir = os.path.join(self.options.cachedir, "snapshots", self.snapshot_key(extra_args))
+        self.add_nodes(self.num_nodes, extra_args)
+        self.snapshot_restored = self._restore_snapshot()
+        self.start_nodes()
+        # Las wallets restauradas ya están creadas y se cargan al arrancar
+        if not self.snapshot_restored and getattr(self, "_requires_wallet", False):
+            self.import_deterministic_coinbase_privkeys()
+
+    def prepare_chain(self, build_fn):
+        """Ejecutar build_fn solo si no se restauró un snapshot. El valor que
+        regresa build_fn debe poder guardarse en JSON, se guarda en el
+        snapshot y se regresa igual en las siguientes ejecuciones."""
+        if self.snapshot_restored:
+            self.log.info("Cadena restaurada del snapshot {}".format(self.snapshot_dir))
+            self._load_wallets(self._snapshot_meta["wallets"])
+            return self._snapshot_meta["data"]
+        data = build_fn()
+        self._save_snapshot(data)
+        return data
+
+    def _chain_dir(self, node):
+        datadir = getattr(node, "datadir_path", None) or node.datadir
+        return os.path.join(str(datadir), self.chain)
+
+    def _restore_snapshot(self):
+        meta_path = os.path.join(self.snapshot_dir, "snapshot.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, encoding="utf8") as f:
+            self._snapshot_meta = json.load(f)
+        for i, node in enumerate(self.nodes):
+            chain_dir = self._chain_dir(node)
+            shutil.rmtree(chain_dir, ignore_errors=True)
+            shutil.copytree(os.path.join(self.snapshot_dir, "node{}".format(i)), chain_dir)
+            node.extra_args = node.extra_args + [MAX_TIP_AGE_ARG]
+        return True
+
+    def _save_snapshot(self, data):
+        wallets = [node.listwallets() if self.is_wallet_compiled() else [] for node in self.nodes]
+        # Hay que detener los nodos para que los archivos queden consistentes
+        self.stop_nodes()
+        # Copiar a un directorio temporal y renombrar, así otra ejecución en
+        # paralelo nunca ve un snapshot a medias
+        tmp_dir = "{}.tmp-{}".format(self.snapshot_dir, os.getpid())
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        for i, node in enumerate(self.nodes):
+            shutil.copytree(self._chain_dir(node), os.path.join(tmp_dir, "node{}".format(i)),
+                            ignore=shutil.ignore_patterns(*IGNORED_FILES))
+        with open(os.path.join(tmp_dir, "snapshot.json"), "w", encoding="utf8") as f:
+            json.dump({"wallets": wallets, "data": data}, f)
+        try:
+            os.rename(tmp_dir, self.snapshot_dir)
+            self.log.info("Snapshot guardado en {}".format(self.snapshot_dir))
+        except OSError:
+            # Otra ejecución lo guardó primero
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.start_nodes()
+        self._load_wallets(wallets)
+        # Reconectar los nodos con la topología lineal por defecto
+        for i in range(self.num_nodes - 1):
+            self.connect_nodes(i + 1, i)
+
+    def _load_wallets(self, wallets):
+        for node, names in zip(self.nodes, wallets):
+            if not names:
+                continue
+            loaded = node.listwallets()
+            for name in names:
+                if name not in loaded:
+                    node.loadwallet(name)
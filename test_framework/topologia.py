@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Topologías de varios nodos y medición de la propagación de transacciones
+y bloques.
+
+Por defecto el framework conecta los nodos en línea (0-1, 1-2, ...). Este
+módulo arma otras formas de red y mide cuánto tarda cada nodo en ver una
+transacción o un bloque inyectado en otro:
+
+- edges(shape, n) regresa las aristas de una línea, un anillo, una estrella
+  (el nodo 0 al centro) o un grafo aleatorio conexo.
+- hop_counts(edges, n) da la distancia en saltos entre cada par de nodos.
+- PropagationTracker conecta un PropagationObserver (P2PInterface) a cada
+  nodo, que anota el momento del primer anuncio (inv o headers) de cada
+  hash. record() espera a que todos los nodos lo anuncien y guarda la
+  latencia desde la inyección agrupada por número de saltos al origen.
+
+Cada nodo revisa sus mensajes pendientes más o menos cada 100 ms y retrasa
+los inv de transacciones a sus pares salvo los que tienen el permiso noban.
+Los nodos deben arrancar con -whitelist=noban@127.0.0.1 (WHITELIST_ARG de
+notificador_p2p.py) para que los observadores reciban los anuncios sin
+retraso. Entre nodos el permiso solo aplica del lado que recibe la conexión:
+el nodo que la abrió sigue agrupando sus inv (2 segundos en promedio), como
+en la red real.
+
+Uso:
+    self.edges = edges("ring", self.num_nodes)
+    # en setup_network: self.connect_nodes(a, b) por cada arista
+    tracker = PropagationTracker(self.nodes, self.edges)
+    start = time.perf_counter()
+    self.nodes[0].sendrawtransaction(tx.serialize().hex())
+    tracker.record("tx", 0, [tx.sha256, tx.calc_sha256(True)], start)
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import random
+import threading
+import time
+from collections import defaultdict, deque
+
+from test_framework.p2p import P2PInterface
+
+SHAPES = ["line", "ring", "star", "random"]
+
+
+def edges(shape, n, degree=3, seed=None):
+    """Lista de aristas (a, b) sin repetir. En random primero se arma un
+    árbol que une a todos los nodos y luego se agregan aristas al azar hasta
+    que el grado promedio llega a degree."""
+    assert shape in SHAPES, "topología no soportada: {}".format(shape)
+    if shape == "line":
+        return [(i, i + 1) for i in range(n - 1)]
+    if shape == "ring":
+        return [(i, (i + 1) % n) for i in range(n)] if n > 2 else edges("line", n)
+    if shape == "star":
+        return [(0, i) for i in range(1, n)]
+    rng = random.Random(seed)
+    result = {(rng.randrange(i), i) for i in range(1, n)}
+    target = min(n * degree // 2, n * (n - 1) // 2)
+    while len(result) < target:
+        a, b = sorted(rng.sample(range(n), 2))
+        result.add((a, b))
+    return sorted(result)
+
+
+def hop_counts(edge_list, n):
+    """Matriz de distancias en saltos (BFS desde cada nodo), None si no hay
+    camino"""
+    neighbors = defaultdict(set)
+    for a, b in edge_list:
+        neighbors[a].add(b)
+        neighbors[b].add(a)
+    distances = []
+    for source in range(n):
+        dist = [None] * n
+        dist[source] = 0
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            for peer in neighbors[current]:
+                if dist[peer] is None:
+                    dist[peer] = dist[current] + 1
+                    queue.append(peer)
+        distances.append(dist)
+    return distances
+
+
+class PropagationObserver(P2PInterface):
+    """Anota el primer momento en que el nodo anuncia cada hash. No pide el
+    contenido: el anuncio basta para saber que el nodo ya lo validó."""
+
+    def __init__(self):
+        super().__init__()
+        self._cond = threading.Condition()
+        # hash entero (txid, wtxid o hash de bloque) -> momento del anuncio
+        self._seen = {}
+
+    def _mark(self, hashes):
+        now = time.perf_counter()
+        with self._cond:
+            for h in hashes:
+                self._seen.setdefault(h, now)
+            self._cond.notify_all()
+
+    def on_inv(self, message):
+        self._mark(inv.hash for inv in message.inv)
+
+    def on_headers(self, message):
+        for header in message.headers:
+            header.rehash()
+        self._mark(header.sha256 for header in message.headers)
+
+    def on_cmpctblock(self, message):
+        header = message.header_and_shortids.header
+        header.rehash()
+        self._mark([header.sha256])
+
+    def first_seen(self, hashes):
+        """El primer anuncio de cualquiera de hashes, None si no ha llegado"""
+        with self._cond:
+            times = [self._seen[h] for h in hashes if h in self._seen]
+        return min(times) if times else None
+
+    def wait_for_any(self, hashes, timeout=60):
+        with self._cond:
+            if not self._cond.wait_for(lambda: any(h in self._seen for h in hashes), timeout):
+                raise AssertionError("El anuncio de {:064x} no llegó en {} segundos".format(hashes[0], timeout))
+
+
+class PropagationTracker():
+    """Un observador por nodo y las latencias medidas, por tipo ("tx" o
+    "block") y número de saltos desde el nodo donde se inyectó"""
+
+    def __init__(self, nodes, edge_list):
+        self.hops = hop_counts(edge_list, len(nodes))
+        self.observers = [node.add_p2p_connection(PropagationObserver()) for node in nodes]
+        self.samples = defaultdict(lambda: defaultdict(list))
+
+    def record(self, kind, source, hashes, start, timeout=60):
+        """Esperar a que todos los nodos anuncien alguno de hashes (una
+        transacción se anuncia por wtxid o por txid) y guardar las latencias
+        desde start. Regresa la latencia de cada nodo."""
+        deadline = time.perf_counter() + timeout
+        latencies = []
+        for i, observer in enumerate(self.observers):
+            observer.wait_for_any(hashes, max(0, deadline - time.perf_counter()))
+            latency = observer.first_seen(hashes) - start
+            self.samples[kind][self.hops[source][i]].append(latency)
+            latencies.append(latency)
+        return latencies
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# Copyright (c) 2017-2019 The Bitcoin Core developers
+# Distributed under the MIT software license, see the accompanying
+# file COPYING or http://www.opensource.org/licenses/mit-license.php.
+"""Verificación local de las entradas de una transacción antes de enviarla.
+
+Una transacción mal armada (un redeem script equivocado, el hash de una
+pubkey en hex en lugar de bytes, una firma sobre el mensaje incorrecto) solo
+se detecta cuando sendrawtransaction la rechaza. ScriptVerifier valida en el
+proceso las plantillas que usan los ejemplos, sin ejecutar un intérprete de
+Script completo:
+
+    P2PK, P2PKH, multifirma desnuda, P2SH (con redeem script P2PK, P2PKH,
+    multifirma u OP_TRUE), P2WPKH y P2TR por el key path
+
+Las firmas válidas se guardan en una caché LRU acotada con la llave (sighash,
+pubkey, firma), como la caché de firmas de Bitcoin Core, y las entradas ya
+validadas en otra con la llave (wtxid, índice, salidas gastadas), como su
+caché de ejecución de scripts. Volver a verificar las mismas entradas, por
+ejemplo en los ciclos de estrés del mempool, no repite ninguna operación de
+curva elíptica ni el cálculo del sighash.
+
+Uso:
+    verifier = ScriptVerifier()
+    verifier.check_tx(tx, spent_outputs)     # AssertionError con el motivo
+    errors = verifier.verify_tx(tx, spent_outputs)
+    tx = verify_spend(verifier, tx_hex, utxo)  # utxo de listunspent
+"""
+# Imports en orden PEP8 std library primero, después de terceros y
+# finalmente locales
+import hashlib
+from collections import OrderedDict
+
+from test_framework.address import hash160
+from test_framework.key import ECPubKey, verify_schnorr
+from test_framework.messages import COIN, CTxOut, tx_from_hex
+from test_framework.script import CScript, OP_CHECKMULTISIG
+from test_framework.script_util import keyhash_to_p2pkh_script
+
+from firmador_local import LegacySighashCache
+from sighash_bip143 import SegwitV0Sighash
+from sighash_bip341 import SIGHASH_DEFAULT, TaprootSighash
+
+# Tamaño por defecto de las cachés, en entradas
+SIG_CACHE_SIZE = 100000
+SCRIPT_CACHE_SIZE = 50000
+
+# Plantillas reconocidas
+P2PK = "p2pk"
+P2PKH = "p2pkh"
+MULTISIG = "multisig"
+P2SH = "p2sh"
+P2WPKH = "p2wpkh"
+P2TR = "p2tr"
+TRUE = "true"
+
+OP_SMALL_INTS = range(0x51, 0x61)
+
+
+def classify(script):
+    """Plantilla de un scriptPubKey o redeem script: regresa (tipo, datos) o
+    (None, None) si no es una de las soportadas. Los datos son la pubkey, el
+    hash o (m, pubkeys) según el tipo."""
+    script = bytes(script)
+    size = len(script)
+    if size in (35, 67) and script[0] == size - 2 and script[-1] == 0xac:
+        return P2PK, script[1:-1]
+    if size == 25 and script[:3] == b"\x76\xa9\x14" and script[23:] == b"\x88\xac":
+        return P2PKH, script[3:23]
+    if size == 23 and script[:2] == b"\xa9\x14" and script[22] == 0x87:
+        return P2SH, script[2:22]
+    if size == 22 and script[:2] == b"\x00\x14":
+        return P2WPKH, script[2:]
+    if size == 34 and script[:2] == b"\x51\x20":
+        return P2TR, script[2:]
+    if script == b"\x51":
+        return TRUE, None
+    if size > 3 and script[-1] == OP_CHECKMULTISIG and script[0] in OP_SMALL_INTS and script[-2] in OP_SMALL_INTS:
+        ops = list(CScript(script))
+        m, pubkeys, n = ops[0], ops[1:-2], ops[-2]
+        if all(isinstance(p, bytes) for p in pubkeys) and len(pubkeys) == n and 1 <= m <= n:
+            return MULTISIG, (m, pubkeys)
+    return None, None
+
+
+def push_only(script):
+    """Elementos de un scriptSig que solo hace pushes, None si tiene otros
+    opcodes. OP_0 queda como b"" y OP_1..OP_16 como enteros."""
+    try:
+        items = list(CScript(script))
+    except Exception:
+        return None
+    if any(not isinstance(item, (bytes, int)) or (isinstance(item, int) and item > 16) for item in items):
+        return None
+    return items
+
+
+class LRUCache():
+    """Diccionario acotado que descarta el elemento usado hace más tiempo"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+class _TxContext():
+    """Motores de sighash de una transacción, se crean al primer uso"""
+
+    def __init__(self, tx, spent):
+        self.tx = tx
+        self.spent = spent
+        self._legacy = None
+        self._segwit = None
+        self._taproot = None
+
+    def legacy(self, index, script_code, hashtype):
+        if self._legacy is None:
+            self._legacy = LegacySighashCache(self.tx)
+        return self._legacy.sighash(index, script_code, hashtype)
+
+    def segwit(self, index, script_code, amount, hashtype):
+        if self._segwit is None:
+            self._segwit = SegwitV0Sighash(self.tx)
+        return self._segwit.sighash(index, script_code, amount, hashtype)
+
+    def taproot(self, index, hashtype):
+        if self._taproot is None:
+            self._taproot = TaprootSighash(self.tx, self.spent)
+        return self._taproot.sighash(index, hashtype)
+
+
+class ScriptVerifier():
+    """Verifica las entradas de una transacción contra las salidas que gasta
+    para las plantillas de classify(), con cachés de firmas y de entradas"""
+
+    def __init__(self, sig_cache_size=SIG_CACHE_SIZE, script_cache_size=SCRIPT_CACHE_SIZE):
+        self.sig_cache = LRUCache(sig_cache_size)
+        self.script_cache = LRUCache(script_cache_size)
+
+    def verify_tx(self, tx, spent):
+        """Lista de (índice, motivo) de las entradas inválidas, vacía si la
+        transacción es válida. spent[i] es el CTxOut que gasta la entrada i."""
+        assert len(tx.vin) == len(spent)
+        wtxid = tx.calc_sha256(with_witness=True)
+        # El sighash de taproot compromete los montos y scripts de todas las
+        # entradas, no solo el de la propia
+        spent_hash = hashlib.sha256(b"".join(txout.serialize() for txout in spent)).digest()
+        ctx = _TxContext(tx, spent)
+        errors = []
+        for i in range(len(spent)):
+            key = (wtxid, i, spent_hash)
+            if self.script_cache.get(key):
+                continue
+            error = self.verify_input(ctx, i)
+            if error is None:
+                self.script_cache.put(key, True)
+            else:
+                errors.append((i, error))
+        return errors
+
+    def check_tx(self, tx, spent):
+        """Como verify_tx, pero lanza AssertionError con los motivos"""
+        errors = self.verify_tx(tx, spent)
+        assert not errors, "Transacción inválida: " + "; ".join(
+            "entrada {}: {}".format(i, reason) for i, reason in errors)
+
+    def verify_input(self, ctx, index):
+        """None si la entrada es válida, si no el motivo"""
+        txin = ctx.tx.vin[index]
+        txout = ctx.spent[index]
+        witness = ctx.tx.wit.vtxinwit[index].scriptWitness.stack if index < len(ctx.tx.wit.vtxinwit) else []
+        kind, data = classify(txout.scriptPubKey)
+
+        if kind == P2WPKH:
+            if len(txin.scriptSig) or len(witness) != 2:
+                return "P2WPKH requiere scriptSig vacío y testigo <firma> <pubkey>"
+            sig, pubkey = witness
+            if hash160(pubkey) != data:
+                return "la pubkey del testigo no corresponde al hash"
+            if not sig:
+                return "firma vacía"
+            sighash = ctx.segwit(index, keyhash_to_p2pkh_script(data), txout.nValue, sig[-1])
+            return None if self.check_ecdsa(pubkey, sig, sighash) else "firma ECDSA inválida"
+
+        if kind == P2TR:
+            if len(txin.scriptSig) or len(witness) != 1:
+                return "solo se soporta el key path de taproot (un elemento en el testigo, sin annex)"
+            sig = witness[0]
+            if len(sig) == 64:
+                hashtype = SIGHASH_DEFAULT
+            elif len(sig) == 65 and sig[64] != SIGHASH_DEFAULT:
+                hashtype = sig[64]
+            else:
+                return "firma Schnorr de tamaño inválido"
+            sighash = ctx.taproot(index, hashtype)
+            return None if self.check_schnorr(data, sig[:64], sighash) else "firma Schnorr inválida"
+
+        if witness:
+            return "testigo inesperado en una entrada legacy"
+        stack = push_only(txin.scriptSig)
+        if stack is None:
+            return "el scriptSig debe tener solo pushes"
+        if kind == P2SH:
+            if not stack or not isinstance(stack[-1], bytes):
+                return "falta el redeem script"
+            redeem_script = stack.pop()
+            if hash160(redeem_script) != data:
+                return "el redeem script no corresponde al hash del scriptPubKey"
+            kind, data = classify(redeem_script)
+            if kind in (P2SH, P2WPKH, P2TR):
+                return "redeem script no soportado: {}".format(kind)
+            return self._verify_legacy(ctx, index, kind, data, stack, redeem_script)
+        return self._verify_legacy(ctx, index, kind, data, stack, txout.scriptPubKey)
+
+    def _verify_legacy(self, ctx, index, kind, data, stack, script_code):
+        if kind is None:
+            return "plantilla de script no soportada: {}".format(bytes(script_code).hex())
+        if kind == TRUE:
+            return None if not stack else "el scriptSig debe quedar vacío con OP_TRUE"
+        if kind == P2PK:
+            if len(stack) != 1:
+                return "P2PK requiere <firma>"
+            return self._legacy_sig(ctx, index, data, stack[0], script_code)
+        if kind == P2PKH:
+            if len(stack) != 2:
+                return "P2PKH requiere <firma> <pubkey>"
+            sig, pubkey = stack
+            if hash160(pubkey) != data:
+                return "la pubkey del scriptSig no corresponde al hash"
+            return self._legacy_sig(ctx, index, pubkey, sig, script_code)
+        # Multifirma: el elemento de más que consume OP_CHECKMULTISIG debe ir
+        # vacío (NULLDUMMY) y las firmas en el orden de las pubkeys
+        m, pubkeys = data
+        if len(stack) != m + 1 or stack[0] != b"":
+            return "multifirma requiere OP_0 y {} firmas".format(m)
+        sigs = stack[1:]
+        ikey = 0
+        for isig, sig in enumerate(sigs):
+            while True:
+                if len(sigs) - isig > len(pubkeys) - ikey:
+                    return "firmas de multifirma inválidas o fuera de orden"
+                ikey += 1
+                if self._legacy_sig(ctx, index, pubkeys[ikey - 1], sig, script_code) is None:
+                    break
+        return None
+
+    def _legacy_sig(self, ctx, index, pubkey, sig, script_code):
+        if not isinstance(sig, bytes) or not sig:
+            return "firma vacía"
+        sighash = ctx.legacy(index, script_code, sig[-1])
+        return None if self.check_ecdsa(pubkey, sig, sighash) else "firma ECDSA inválida"
+
+    def check_ecdsa(self, pubkey, sig, sighash):
+        """Firma DER con el byte de hashtype al final"""
+        key = (sighash, bytes(pubkey), bytes(sig))
+        if self.sig_cache.get(key):
+            return True
+        pub = ECPubKey()
+        pub.set(pubkey)
+        valid = pub.is_valid and pub.verify_ecdsa(sig[:-1], sighash)
+        if valid:
+            self.sig_cache.put(key, True)
+        return valid
+
+    def check_schnorr(self, xonly_pubkey, sig, sighash):
+        key = (sighash, bytes(xonly_pubkey), bytes(sig))
+        if self.sig_cache.get(key):
+            return True
+        valid = verify_schnorr(xonly_pubkey, sig, sighash)
+        if valid:
+            self.sig_cache.put(key, True)
+        return valid
+
+    def stats(self):
+        """Aciertos y fallos de las dos cachés"""
+        return {
+            "sig_cache": {"size": len(self.sig_cache), "hits": self.sig_cache.hits, "misses": self.sig_cache.misses},
+            "script_cache": {"size": len(self.script_cache), "hits": self.script_cache.hits,
+                             "misses": self.script_cache.misses},
+        }
+
+
+def verify_spend(verifier, tx_hex, utxo):
+    """Verificar una transacción firmada (hex) que gasta un solo utxo con el
+    formato de listunspent. Regresa la CTransaction; lanza AssertionError con
+    el motivo si la firma no es válida."""
+    tx = tx_from_hex(tx_hex)
+    verifier.check_tx(tx, [CTxOut(int(utxo["amount"] * COIN), bytes.fromhex(utxo["scriptPubKey"]))])
+    return tx